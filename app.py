@@ -1,17 +1,27 @@
 from fastapi import FastAPI, Request, Form, HTTPException, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 import uvicorn
-from typing import Optional, Union
+from typing import List, Optional, Union
+from pydantic import BaseModel
 import pandas as pd
+import asyncio
+import math
 import os
 import re
+import weakref
 
 # Import our prediction model
-from model import predict_match
-from data_fetcher import get_team_name, get_cached_data, save_to_cache
+from model import predict_match_async
+from data_fetcher import get_cached_data, save_to_cache
 from find_team import search_teams
+from prediction_api import API_VERSION, dumps, parse_fields, prediction_document
+from batch_predictions import predict_fixtures, stream_fixtures
+from serving import Overloaded, RouteLimiter, run_blocking
+from config import (
+    PREDICT_CONCURRENCY, PREDICT_QUEUE_SIZE, SEARCH_CONCURRENCY, SEARCH_QUEUE_SIZE, MAX_BATCH_FIXTURES
+)
 
 app = FastAPI(title="Soccer Match Score Predictor")
 
@@ -27,6 +37,19 @@ os.makedirs(".cache", exist_ok=True)
 # Cache for team search results
 TEAM_SEARCH_CACHE_KEY = "team_search_results"
 
+# Per-route admission limits; blocking work itself runs in the serving pool
+predict_limiter = RouteLimiter("predict", PREDICT_CONCURRENCY, PREDICT_QUEUE_SIZE)
+search_limiter = RouteLimiter("search_team", SEARCH_CONCURRENCY, SEARCH_QUEUE_SIZE)
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """Shed load with a 503 instead of queueing without bound"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """Render the home page with the prediction form"""
@@ -53,6 +76,11 @@ def validate_team_input(team_input: str) -> int:
     # If we get here, the input is neither a valid ID nor a found team name
     raise ValueError(f"Could not find team ID for: {team_input}")
 
+def check_threshold(threshold: Optional[float]):
+    """Reject over/under thresholds that are not finite numbers (nan, inf)"""
+    if threshold is not None and not math.isfinite(threshold):
+        raise HTTPException(status_code=422, detail="Goal threshold must be a finite number")
+
 @app.post("/predict", response_class=HTMLResponse)
 async def predict(
     request: Request,
@@ -62,27 +90,32 @@ async def predict(
     goal_threshold: Optional[float] = Form(None)
 ):
     """Process prediction request and display results"""
+    check_threshold(goal_threshold)
+    async with predict_limiter:
+        return await _predict(request, team_a_input, team_b_input, is_neutral_venue, goal_threshold)
+
+async def _predict(request, team_a_input, team_b_input, is_neutral_venue, goal_threshold):
     try:
-        # Convert team inputs to IDs
+        # Convert team inputs to IDs (a name may need an API search)
         try:
-            team_a_id = validate_team_input(team_a_input)
-            team_b_id = validate_team_input(team_b_input)
+            team_a_id = await run_blocking(validate_team_input, team_a_input)
+            team_b_id = await run_blocking(validate_team_input, team_b_input)
         except ValueError as e:
             raise HTTPException(status_code=400, detail=str(e))
         
-        # Get team names for display
-        team_a_name = get_team_name(team_a_id)
-        team_b_name = get_team_name(team_b_id)
-        
-        # Make prediction, including the over/under threshold if provided
-        prediction = predict_match(team_a_id, team_b_id, is_neutral_venue, goal_threshold)
+        # Make prediction, including the over/under threshold if provided.
+        # Team data and head-to-head history are fetched concurrently.
+        prediction = await predict_match_async(team_a_id, team_b_id, is_neutral_venue, goal_threshold)
         
         if not prediction:
             raise HTTPException(status_code=404, detail="Could not make prediction. Please check team inputs.")
+        
+        # Get team names for display
+        team_a_name = prediction['team_a']['team_name']
+        team_b_name = prediction['team_b']['team_name']
             
         # Format probability tables for display
-        total_goals_table = format_probability_table(prediction['total_goals_probabilities'])
-        score_table = format_score_probability_table(prediction['score_probabilities'].head(10))
+        total_goals_table, score_table, over_under_ladder = await run_blocking(format_prediction_tables, prediction)
         
         # Set venue labels for display
         if is_neutral_venue:
@@ -118,15 +151,184 @@ async def predict(
                 "total_goals_table": total_goals_table,
                 "score_table": score_table,
                 "goal_threshold": prediction.get('goal_threshold'),
-                "over_under_result": over_under_result
+                "over_under_result": over_under_result,
+                "over_under_ladder": over_under_ladder
             }
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
+@app.get("/api/v1/predict")
+async def api_predict(
+    team_a: str,
+    team_b: str,
+    neutral: bool = False,
+    threshold: Optional[float] = None,
+    fields: Optional[str] = None
+):
+    """
+    Prediction as a versioned JSON document. `fields` is a comma-separated
+    list of sections (lambdas, markets, top_scores, total_goals, over_under,
+    history, or all); history is left out unless asked for.
+    """
+    check_threshold(threshold)
+    try:
+        selected = parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async with predict_limiter:
+        try:
+            team_a_id = await run_blocking(validate_team_input, team_a)
+            team_b_id = await run_blocking(validate_team_input, team_b)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        prediction = await predict_match_async(team_a_id, team_b_id, neutral, threshold)
+        if not prediction:
+            raise HTTPException(status_code=404, detail="Could not make prediction. Please check team inputs.")
+        
+        body = await run_blocking(lambda: dumps(prediction_document(prediction, selected)))
+    
+    return Response(content=body, media_type="application/json")
+
+class FixtureRequest(BaseModel):
+    team_a: Union[int, str]
+    team_b: Union[int, str]
+    neutral: Optional[bool] = None
+    threshold: Optional[float] = None
+
+class BatchPredictionRequest(BaseModel):
+    fixtures: List[FixtureRequest]
+    neutral: bool = False               # default for fixtures that do not set it
+    threshold: Optional[float] = None   # default for fixtures that do not set it
+    fields: Optional[str] = None
+
+def batch_fixtures(batch: BatchPredictionRequest):
+    """Fixtures as plain dicts, with the batch-wide defaults applied"""
+    check_threshold(batch.threshold)
+    for fixture in batch.fixtures:
+        check_threshold(fixture.threshold)
+    return [
+        {
+            'team_a': str(fixture.team_a),
+            'team_b': str(fixture.team_b),
+            'neutral': batch.neutral if fixture.neutral is None else fixture.neutral,
+            'threshold': batch.threshold if fixture.threshold is None else fixture.threshold,
+        }
+        for fixture in batch.fixtures
+    ]
+
+@app.post("/api/v1/predict/batch")
+async def api_predict_batch(batch: BatchPredictionRequest):
+    """
+    Predict a slate of fixtures. Each team's data is fetched (concurrently)
+    and aggregated once and the model runs over all fixtures together;
+    results keep the input order, with an error entry for fixtures that
+    could not be predicted. Head-to-head meetings come from the match store
+    only (see batch_predictions).
+    """
+    if len(batch.fixtures) > MAX_BATCH_FIXTURES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_FIXTURES} fixtures per batch")
+    try:
+        selected = parse_fields(batch.fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    fixtures = batch_fixtures(batch)
+    
+    async with predict_limiter:
+        results = await predict_fixtures(fixtures, validate_team_input, selected)
+        body = await run_blocking(dumps, {'version': API_VERSION, 'results': results})
+    
+    return Response(content=body, media_type="application/json")
+
+# Streamed batch encodings: NDJSON lines or Server-Sent Events
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+def encode_stream_event(event, stream_format):
+    """One streamed event as an NDJSON line or an SSE message"""
+    if stream_format == "sse":
+        return b"event: " + event['type'].encode() + b"\ndata: " + dumps(event) + b"\n\n"
+    return dumps(event) + b"\n"
+
+def release_on_loop(loop, release):
+    """Schedule `release` on `loop` from whichever thread calls this"""
+    try:
+        loop.call_soon_threadsafe(release)
+    except RuntimeError:
+        # The loop is closed, so nothing is left waiting for the slot
+        pass
+
+class LimitedStreamingResponse(StreamingResponse):
+    """
+    Streaming response holding a route limiter slot, given back through
+    `release` however the response ends: finished, failed, the client gone
+    before or during the body, or the response never sent at all
+    """
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+        # Collection can happen on any thread; the limiter's semaphore is only safe to touch on its loop
+        weakref.finalize(self, release_on_loop, asyncio.get_running_loop(), release)
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+@app.post("/api/v1/predict/batch/stream")
+async def api_predict_batch_stream(batch: BatchPredictionRequest, format: str = "ndjson"):
+    """
+    Streamed batch prediction: a start event, one result event per fixture
+    as soon as it is ready (with its input index, cache hit flag and
+    progress), then an end event. `format` is ndjson (default) or sse.
+    """
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    if len(batch.fixtures) > MAX_BATCH_FIXTURES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_FIXTURES} fixtures per batch")
+    try:
+        selected = parse_fields(batch.fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    fixtures = batch_fixtures(batch)
+    
+    # Admission happens before the response starts, so overload is still a 503;
+    # the slot is held until the response is done with, whatever happens to it
+    release = await predict_limiter.acquire()
+    
+    async def events():
+        async for event in stream_fixtures(fixtures, validate_team_input, selected):
+            yield encode_stream_event(event, format)
+    
+    return LimitedStreamingResponse(
+        events(),
+        release,
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/batch", response_class=HTMLResponse)
+async def batch_page(request: Request):
+    """Render the batch prediction page, which streams results as they arrive"""
+    return templates.TemplateResponse("batch.html", {"request": request})
+
 @app.get("/search_team", response_class=HTMLResponse)
 async def search_team(request: Request, query: Optional[str] = None):
     """Search for teams by name"""
+    async with search_limiter:
+        results = await run_blocking(find_teams, query)
+    
+    return templates.TemplateResponse(
+        "search_results.html", 
+        {"request": request, "results": results, "query": query}
+    )
+
+def find_teams(query):
+    """
+    Teams whose name contains query, from the search cache or the API
+    """
     results = []
     
     if query and len(query) >= 3:
@@ -159,9 +361,14 @@ async def search_team(request: Request, query: Optional[str] = None):
                 # Save updated list to cache
                 save_to_cache(TEAM_SEARCH_CACHE_KEY, all_teams)
     
-    return templates.TemplateResponse(
-        "search_results.html", 
-        {"request": request, "results": results, "query": query}
+    return results
+
+def format_prediction_tables(prediction):
+    """Format the total goals, top scores and over/under tables of a prediction for display"""
+    return (
+        format_probability_table(prediction['total_goals_probabilities']),
+        format_score_probability_table(prediction['score_probabilities'].head(10)),
+        format_over_under_ladder(prediction['over_under_ladder']),
     )
 
 def format_probability_table(prob_table):
@@ -180,6 +387,10 @@ def format_score_probability_table(prob_table):
     
     return formatted.to_dict('records')
 
+def format_over_under_ladder(ladder):
+    """Format the over/under ladder for display"""
+    return ladder.round(2).to_dict('records')
+
 if __name__ == "__main__":
     # Run the FastAPI app with uvicorn
     uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
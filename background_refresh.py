@@ -0,0 +1,64 @@
+import queue
+import threading
+
+from config import REFRESH_QUEUE_SIZE, REFRESH_WORKERS
+
+
+class RefreshQueue:
+    """
+    Bounded, deduplicated queue of background refresh jobs.
+
+    Jobs are keyed; a key that is already queued or running is not queued
+    again, and when the queue is full new jobs are dropped (the caller keeps
+    serving what it has). Worker threads are started on the first submit.
+    """
+
+    def __init__(self, maxsize=REFRESH_QUEUE_SIZE, workers=REFRESH_WORKERS):
+        self._queue = queue.Queue(maxsize)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._workers = workers
+        self._threads = []
+
+    def submit(self, key, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) under key; returns False if it was a duplicate or the queue is full."""
+        with self._lock:
+            if key in self._pending:
+                return False
+            try:
+                self._queue.put_nowait((key, fn, args, kwargs))
+            except queue.Full:
+                return False
+            self._pending.add(key)
+            self._start_workers()
+        return True
+
+    def _start_workers(self):
+        while len(self._threads) < self._workers:
+            thread = threading.Thread(target=self._work, name="refresh-worker", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            key, fn, args, kwargs = self._queue.get()
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                print(f"Background refresh of {key} failed: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+                self._queue.task_done()
+
+    def is_pending(self, key):
+        with self._lock:
+            return key in self._pending
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def join(self):
+        """Block until every queued job has run."""
+        self._queue.join()
@@ -0,0 +1,212 @@
+"""
+Predictions for a whole slate of fixtures at once.
+
+Team inputs are resolved once each, every distinct team's matches are
+fetched concurrently and its stats built once (aggregated in a single
+pass), and the expected goals of every fixture are computed in one
+predict_goals_batch call. Failures are reported per fixture; results keep
+the input order.
+
+Head-to-head meetings come from the match store only, without the
+dedicated upstream request a single prediction may make, so a pair whose
+meetings were never synced can be predicted from fewer of them than
+/api/v1/predict would use.
+
+stream_fixtures is the streaming variant: it predicts a few fixtures at a
+time through predict_match_async (and so its prediction cache) and yields
+each result as soon as it is ready, fixtures with cached team data first.
+Fetches are awaited on the event loop rather than waited for in serving
+pool threads, so a stream cannot fill the pool with threads blocked on
+flights whose leaders need the pool to finish.
+"""
+
+import asyncio
+
+import numpy as np
+
+from async_data_fetcher import get_team_histories_async
+from config import STREAM_CONCURRENCY
+from data_fetcher import combine_prediction_data, is_team_data_cached, stored_head_to_head, team_stats_from_histories
+from model import predict_goals_batch, predict_match_async, prediction_from_expected_goals
+from serving import run_blocking
+from prediction_api import DEFAULT_FIELDS, prediction_document
+
+# Per-match lists that predict_goals_batch does not need in its table
+HISTORY_KEYS = ('match_results', 'match_history', 'h2h_history')
+
+
+def _resolve_teams(fixtures, resolve_team):
+    """{team input: team id or the ValueError raised resolving it}, one lookup per distinct input."""
+    team_ids = {}
+    for fixture in fixtures:
+        for team_input in (fixture['team_a'], fixture['team_b']):
+            if team_input not in team_ids:
+                try:
+                    team_ids[team_input] = resolve_team(team_input)
+                except ValueError as e:
+                    team_ids[team_input] = e
+    return team_ids
+
+
+def _model_inputs(stats):
+    """Stats row for predict_goals_batch: scalars only, with the H2H count precomputed."""
+    row = {key: value for key, value in stats.items() if key not in HISTORY_KEYS}
+    row['num_h2h_matches'] = len(stats.get('h2h_history', []))
+    return row
+
+
+async def predict_fixtures(fixtures, resolve_team, fields=DEFAULT_FIELDS):
+    """
+    Predict every fixture, a list of dicts with team_a and team_b (name or
+    id) and optional neutral and threshold. resolve_team turns a team input
+    into an id or raises ValueError. Returns one entry per fixture, in
+    order: {'index', 'prediction'} or {'index', 'error'}.
+    """
+    team_ids = await run_blocking(_resolve_teams, fixtures, resolve_team)
+
+    # Each distinct team's matches once for the whole slate, cold ones fetched concurrently
+    known = [team_id for team_id in dict.fromkeys(team_ids.values()) if not isinstance(team_id, ValueError)]
+    histories = await get_team_histories_async(known)
+
+    return await run_blocking(_predict_resolved, fixtures, team_ids, histories, fields)
+
+
+def _predict_resolved(fixtures, team_ids, histories, fields):
+    """predict_fixtures once team inputs are resolved and their matches fetched"""
+    results = [None] * len(fixtures)
+    team_stats = team_stats_from_histories(histories)
+
+    # Prediction data for every fixture that can be predicted
+    pending = []
+    h2h_cache = {}
+    for index, fixture in enumerate(fixtures):
+        team_a_id = team_ids[fixture['team_a']]
+        team_b_id = team_ids[fixture['team_b']]
+        for team_id in (team_a_id, team_b_id):
+            if isinstance(team_id, ValueError):
+                results[index] = {'index': index, 'error': str(team_id)}
+                break
+        if results[index] is not None:
+            continue
+
+        team_a_stats = team_stats.get(team_a_id)
+        team_b_stats = team_stats.get(team_b_id)
+        if not team_a_stats or not team_b_stats:
+            results[index] = {'index': index, 'error': "Could not make prediction. Please check team inputs."}
+            continue
+
+        pair = (team_a_id, team_b_id)
+        if pair not in h2h_cache:
+            h2h_cache[pair] = stored_head_to_head(team_a_id, team_b_id)
+
+        # combine_prediction_data adds H2H keys, so each fixture gets its own copies
+        prediction_data = combine_prediction_data(dict(team_a_stats), dict(team_b_stats), h2h_cache[pair])
+        pending.append((index, fixture, prediction_data))
+
+    if not pending:
+        return results
+
+    # Expected goals for every fixture in one vectorized pass
+    neutral = np.array([bool(fixture.get('neutral')) for _, fixture, _ in pending])
+    team_a_goals, team_b_goals = predict_goals_batch(
+        [_model_inputs(data['team_a']) for _, _, data in pending],
+        [_model_inputs(data['team_b']) for _, _, data in pending],
+        neutral,
+    )
+
+    for (index, fixture, prediction_data), team_a_exp, team_b_exp, is_neutral in zip(
+            pending, team_a_goals, team_b_goals, neutral):
+        try:
+            prediction = prediction_from_expected_goals(
+                prediction_data, team_a_exp, team_b_exp, bool(is_neutral), fixture.get('threshold')
+            )
+            results[index] = {'index': index, 'prediction': prediction_document(prediction, fields)}
+        except Exception as e:
+            results[index] = {'index': index, 'error': f"Prediction error: {e}"}
+
+    return results
+
+
+def _both_cached(team_a_id, team_b_id):
+    return is_team_data_cached(team_a_id) and is_team_data_cached(team_b_id)
+
+
+async def predict_fixture(index, fixture, resolve_team, fields=DEFAULT_FIELDS):
+    """
+    Predict one fixture through predict_match_async. Returns a result
+    entry as in predict_fixtures, plus whether both teams' data was cached.
+    """
+    try:
+        team_a_id = await run_blocking(resolve_team, fixture['team_a'])
+        team_b_id = await run_blocking(resolve_team, fixture['team_b'])
+    except ValueError as e:
+        return {'index': index, 'error': str(e), 'cached': False}
+
+    cached = await run_blocking(_both_cached, team_a_id, team_b_id)
+    try:
+        prediction = await predict_match_async(
+            team_a_id, team_b_id, bool(fixture.get('neutral')), fixture.get('threshold')
+        )
+        if not prediction:
+            return {'index': index, 'error': "Could not make prediction. Please check team inputs.", 'cached': cached}
+        document = await run_blocking(prediction_document, prediction, fields)
+        return {'index': index, 'prediction': document, 'cached': cached}
+    except Exception as e:
+        return {'index': index, 'error': f"Prediction error: {e}", 'cached': cached}
+
+
+def _warm_first(fixtures):
+    """
+    Fixture indices with those whose teams are given by id and already
+    cached first, so their results go out before any cold fetch finishes
+    """
+    def is_warm(fixture):
+        team_inputs = (fixture['team_a'], fixture['team_b'])
+        return all(team_input.isdigit() and is_team_data_cached(int(team_input)) for team_input in team_inputs)
+
+    warm, cold = [], []
+    for index, fixture in enumerate(fixtures):
+        (warm if is_warm(fixture) else cold).append(index)
+    return warm + cold
+
+
+async def stream_fixtures(fixtures, resolve_team, fields=DEFAULT_FIELDS, concurrency=STREAM_CONCURRENCY):
+    """
+    Async generator of events for a streamed batch: a 'start' event, one
+    'result' event per fixture as soon as it is ready (in completion order,
+    with its input index, whether its data was cached and the progress so
+    far), then an 'end' event. At most `concurrency` fixtures are in flight
+    and results are not kept, so memory does not grow with the batch.
+    """
+    total = len(fixtures)
+    yield {'type': 'start', 'total': total}
+
+    order = iter(await run_blocking(_warm_first, fixtures))
+    in_flight = set()
+    done = 0
+    cached = 0
+
+    def submit():
+        index = next(order, None)
+        if index is not None:
+            in_flight.add(asyncio.ensure_future(predict_fixture(index, fixtures[index], resolve_team, fields)))
+
+    try:
+        for _ in range(concurrency):
+            submit()
+        while in_flight:
+            finished, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                in_flight.discard(task)
+                result = task.result()
+                done += 1
+                cached += result['cached']
+                submit()
+                yield dict(result, type='result', done=done, total=total)
+    finally:
+        # The client is gone. A cancelled fixture that leads a shared fetch only
+        # stops waiting: the fetch runs on for the other requests that joined it
+        for task in in_flight:
+            task.cancel()
+
+    yield {'type': 'end', 'done': done, 'total': total, 'cached': cached}
@@ -17,4 +17,41 @@ AWAY_TEAM_ID = 73
 IS_NEUTRAL_VENUE = True  # Set to True for matches at neutral venues
 
 # Cache configuration
-CACHE_MAX_AGE = 12  # hours
\ No newline at end of file
+CACHE_MAX_AGE = 12  # hours
+CACHE_MAX_STALENESS = 72  # hours; older data is served while it refreshes, up to this age
+
+# Team ratings maintained incrementally as matches are stored (team_ratings.py)
+RATING_HALF_LIFE_DAYS = 180   # a match's weight halves every this many days
+USE_TEAM_RATINGS = False      # serve team stats from the stored ratings instead of recomputing
+
+# Background refresh of stale team data
+REFRESH_QUEUE_SIZE = 256      # pending refresh jobs; more are dropped until it drains
+REFRESH_WORKERS = 2           # worker threads (the API rate limit still applies)
+
+# Web serving: blocking work runs in a bounded thread pool, and each route admits a
+# bounded number of requests (extra ones wait, then get a 503)
+BLOCKING_WORKERS = 8          # threads for store lookups, aggregation and model math
+PREDICT_CONCURRENCY = 8       # predictions running at once
+PREDICT_QUEUE_SIZE = 32       # predictions waiting for a slot
+SEARCH_CONCURRENCY = 4        # team searches running at once
+SEARCH_QUEUE_SIZE = 16        # team searches waiting for a slot
+ROUTE_QUEUE_TIMEOUT = 10      # seconds a request may wait for a slot
+MAX_BATCH_FIXTURES = 500      # fixtures accepted in one batch prediction request
+STREAM_CONCURRENCY = 4        # fixtures of a streamed batch predicted at once
+FLIGHT_WAIT_TIMEOUT = 60      # seconds a thread waits on another caller's fetch before fetching itself
+
+# SQLite match store shared by all workers
+MATCH_STORE_PATH = ".cache/matches.sqlite3"
+
+# HTTP client configuration
+REQUEST_TIMEOUT = 10          # seconds per request
+MAX_RETRIES = 3               # retries on 429/5xx and connection errors
+BACKOFF_FACTOR = 0.5          # seconds, doubled on each retry
+MAX_RETRY_DELAY = 60          # seconds; cap on any wait between retries, whatever the headers say
+RATE_LIMIT_PER_MINUTE = 10    # football-data.org free tier quota
+HTTP_POOL_SIZE = 10           # keep-alive connections per host
+
+# In-process (L1) cache in front of the match store and .cache/*.json files
+MEMORY_CACHE_SIZE = 512       # entries
+MEMORY_CACHE_TTL = 300        # seconds before an entry is re-read from disk
+TEAM_STATS_CACHE_SIZE = 256   # teams whose computed stats are kept in process
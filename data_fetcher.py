@@ -1,65 +1,150 @@
-import requests
 import pandas as pd
+import numpy as np
 import os
 import json
+import time
+from collections.abc import Sequence
 from datetime import datetime, timedelta
 
 from config import (
-    API_KEY, BASE_URL, HEADERS, 
+    API_KEY, BASE_URL,
     MATCHES_TO_CONSIDER, MAX_H2H_MATCHES,
-    CACHE_MAX_AGE
+    CACHE_MAX_AGE, CACHE_MAX_STALENESS, MEMORY_CACHE_SIZE, MEMORY_CACHE_TTL,
+    TEAM_STATS_CACHE_SIZE, USE_TEAM_RATINGS, FLIGHT_WAIT_TIMEOUT
 )
+from background_refresh import RefreshQueue
+from http_client import get_client
+from match_store import get_store, project_matches
+from memory_cache import LRUCache
+from singleflight import SingleFlight
+from team_ratings import rate_matches, rating_stats
 
-# Create a cache directory if it doesn't exist
+# Create a cache directory if it doesn't exist.
+# Matches and team names live in the SQLite match store; the JSON files hold the rest.
 CACHE_DIR = ".cache"
 os.makedirs(CACHE_DIR, exist_ok=True)
 
+# Concurrent cache misses for the same key share one upstream request.
+# Used by both the sync fetchers here and the async ones in async_data_fetcher.
+fetch_flight = SingleFlight(wait_timeout=FLIGHT_WAIT_TIMEOUT)
+
+# L1 tier in front of the match store and the JSON files: cache_key -> (saved_at, data).
+# saved_at mirrors the sync time / file mtime so max_age_hours means the same thing in
+# every tier; the TTL bounds how long another worker's write can go unnoticed.
+_memory_cache = LRUCache(MEMORY_CACHE_SIZE, ttl=MEMORY_CACHE_TTL)
+
+# Computed team stats: team_id -> (data version, stats). The version fingerprints the
+# match set the stats were built from, so an entry is only reused for the same data.
+_team_stats_cache = LRUCache(TEAM_STATS_CACHE_SIZE)
+
+# Bumped for a team whenever a save in this process adds or changes matches involving
+# it; part of the data version of cached predictions (see prediction_data_version)
+_team_generations = {}
+
+# Define which competitions are considered more competitive/important
+TOP_COMPETITION_IDS = [
+    2001,  # Champions League
+    2002,  # Europa League
+    2019,  # Premier League
+    2014,  # La Liga
+    2021,  # Serie A
+    2015,  # Ligue 1
+    2002,  # Bundesliga
+    2000,  # World Cup
+    2018,  # European Championship
+]
+
+# Define importance levels for different competitions
+COMPETITION_IMPORTANCE = {
+    2001: 1.0,  # Champions League
+    2002: 0.9,  # Europa League
+    2019: 0.8,  # Premier League
+    2014: 0.8,  # La Liga
+    2021: 0.8,  # Serie A
+    2015: 0.75, # Ligue 1
+    2002: 0.8,  # Bundesliga
+    2000: 1.0,  # World Cup
+    2018: 0.9,  # European Championship
+}
+
+# Stored data past CACHE_MAX_AGE (but within CACHE_MAX_STALENESS) is served as-is
+# while one of these workers refetches it.
+refresh_queue = RefreshQueue()
+
 def get_team_name(team_id):
     """
     Get team name from API using team ID
     """
-    # Try to get from cache first
-    cache_key = f"team_name_{team_id}"
-    cached_data = get_cached_data(cache_key)
+    # Try to get from the store first
+    cached_data = get_stored_team_name(team_id)
     
     if cached_data:
         return cached_data
     
-    # Not in cache, fetch from API
+    # Not stored, fetch from API (once, however many callers missed together)
+    return fetch_flight.do(f"team_name_{team_id}", _fetch_team_name, team_id)
+
+def _fetch_team_name(team_id):
+    # Another flight may have refreshed the store since our miss
+    cached_data = get_stored_team_name(team_id, max_stale_hours=None)
+    if cached_data:
+        return cached_data
+    
     url = f"{BASE_URL}/teams/{team_id}"
     
     try:
-        response = requests.get(url, headers=HEADERS)
-        
-        if response.status_code == 200:
-            data = response.json()
-            team_name = data.get("name", f"Team ID: {team_id}")
-            
-            # Save to cache
-            save_to_cache(cache_key, team_name)
-            
-            return team_name
-        else:
-            print(f"API Error {response.status_code}: {response.text}")
-            return f"Team ID: {team_id}"
+        response = get_client().get(url)
+        return handle_team_name_response(team_id, response.status_code, response.json, response.text)
             
     except Exception as e:
         print(f"An error occurred: {e}")
         return f"Team ID: {team_id}"
 
+def handle_team_name_response(team_id, status_code, json_body, text):
+    """
+    Turn a /teams/{id} response into a team name and store it.
+    Shared by the sync and async fetch paths; json_body is a callable.
+    """
+    if status_code == 200:
+        data = json_body()
+        team_name = data.get("name", f"Team ID: {team_id}")
+        
+        # Save to the store
+        try:
+            get_store().save_team(team_id, team_name)
+        except Exception as e:
+            print(f"Error saving to match store: {e}")
+        _memory_cache.set(f"team_name_{team_id}", (time.time(), team_name))
+        
+        return team_name
+    else:
+        print(f"API Error {status_code}: {text}")
+        return f"Team ID: {team_id}"
+
 def get_cached_data(cache_key, max_age_hours=CACHE_MAX_AGE):
     """
-    Get data from cache if available and fresh
+    Get data from cache if available and fresh.
+    Checks the in-memory tier first and only falls back to the JSON file on a miss.
     """
+    max_age_seconds = max_age_hours * 3600
+    
+    entry = _memory_cache.get(cache_key)
+    if entry is not None:
+        saved_at, data = entry
+        if time.time() - saved_at < max_age_seconds:
+            return data
+    
     cache_file = os.path.join(CACHE_DIR, f"{cache_key}.json")
     
     if os.path.exists(cache_file):
         # Check if cache is still valid
-        file_mod_time = datetime.fromtimestamp(os.path.getmtime(cache_file))
-        if datetime.now() - file_mod_time < timedelta(hours=max_age_hours):
+        saved_at = os.path.getmtime(cache_file)
+        if time.time() - saved_at < max_age_seconds:
             try:
                 with open(cache_file, 'r') as f:
-                    return json.load(f)
+                    data = json.load(f)
+                _memory_cache.set(cache_key, (saved_at, data))
+                return data
             except Exception as e:
                 print(f"Error reading cache: {e}")
     
@@ -67,9 +152,10 @@ def get_cached_data(cache_key, max_age_hours=CACHE_MAX_AGE):
 
 def save_to_cache(cache_key, data):
     """
-    Save data to cache
+    Save data to cache (both the in-memory tier and the JSON file)
     """
     cache_file = os.path.join(CACHE_DIR, f"{cache_key}.json")
+    _memory_cache.set(cache_key, (time.time(), data))
     
     try:
         with open(cache_file, 'w') as f:
@@ -77,56 +163,397 @@ def save_to_cache(cache_key, data):
     except Exception as e:
         print(f"Error saving to cache: {e}")
 
-def get_recent_team_matches(team_id, limit=MATCHES_TO_CONSIDER):
+def _serving_window(max_age_hours, max_stale_hours):
     """
-    Get the most recent matches for a specific team directly
+    Seconds for which stored data may be served, fresh or stale
     """
-    # Get team name for logging purposes
-    team_name = get_team_name(team_id)
+    if max_stale_hours is None:
+        return max_age_hours * 3600
+    return max(max_age_hours, max_stale_hours) * 3600
+
+def _load_stored(cache_key, max_age_hours, synced_at, load, refresh=None, max_stale_hours=None):
+    """
+    Read from the match store through the in-memory tier.
+    synced_at() returns when the data was last fetched from the API (or None);
+    load() is only run when that is recent enough and may return None if the
+    stored data does not cover the request.
     
-    # Try to get from cache first
-    cache_key = f"team_matches_{team_id}"
-    cached_data = get_cached_data(cache_key)
+    Data older than max_age_hours but within max_stale_hours is still returned,
+    and refresh() is queued in the background to bring it up to date.
+    """
+    max_age_seconds = max_age_hours * 3600
+    window_seconds = _serving_window(max_age_hours, max_stale_hours if refresh else None)
     
-    if cached_data:
-        matches = cached_data
-        print(f"Using cached data: Found {len(matches)} recent matches for {team_name}")
-        return matches
+    entry = _memory_cache.get(cache_key)
+    if entry is not None:
+        saved_at, data = entry
+        age = time.time() - saved_at
+        if age < window_seconds:
+            if age >= max_age_seconds:
+                _schedule_refresh(cache_key, refresh)
+            return data
     
-    # Not in cache, fetch from API
-    url = f"{BASE_URL}/teams/{team_id}/matches"
+    saved_at = synced_at()
+    if saved_at is None or time.time() - saved_at >= window_seconds:
+        return None
+    
+    try:
+        data = load()
+    except Exception as e:
+        print(f"Error reading match store: {e}")
+        return None
     
+    if data is None:
+        return None
+    
+    _memory_cache.set(cache_key, (saved_at, data))
+    if time.time() - saved_at >= max_age_seconds:
+        _schedule_refresh(cache_key, refresh)
+    return data
+
+def _schedule_refresh(cache_key, refresh):
+    if refresh_queue.submit(cache_key, refresh):
+        print(f"Serving stale {cache_key} while it refreshes in the background")
+
+def get_stored_team_name(team_id, max_age_hours=CACHE_MAX_AGE, max_stale_hours=CACHE_MAX_STALENESS):
+    """
+    Team name from the match store if fresh (or stale but refreshing), else None
+    """
+    store = get_store()
+    return _load_stored(
+        f"team_name_{team_id}", max_age_hours,
+        lambda: store.team_updated_at(team_id),
+        lambda: store.team_name(team_id),
+        lambda: fetch_flight.do(f"team_name_{team_id}", _fetch_team_name, team_id),
+        max_stale_hours,
+    )
+
+def get_stored_team_matches(team_id, limit=MATCHES_TO_CONSIDER, max_age_hours=CACHE_MAX_AGE,
+                            max_stale_hours=CACHE_MAX_STALENESS):
+    """
+    A team's recent competitive matches from the match store if its last sync is
+    fresh (or stale but refreshing), else None
+    """
+    store = get_store()
+    return _load_stored(
+        f"team_matches_{team_id}:{limit}", max_age_hours,
+        lambda: team_history_synced_at(team_id),
+        lambda: stored_team_history(team_id, limit),
+        lambda: fetch_flight.do(
+            f"team_matches_{team_id}:{limit}", _fetch_team_matches, team_id, get_team_name(team_id), limit
+        ),
+        max_stale_hours,
+    )
+
+def is_team_data_cached(team_id, max_age_hours=CACHE_MAX_AGE, max_stale_hours=CACHE_MAX_STALENESS):
+    """
+    Whether a team's recent matches can be served from the store without an upstream request
+    """
+    synced_at = team_history_synced_at(team_id)
+    return synced_at is not None and time.time() - synced_at < _serving_window(max_age_hours, max_stale_hours)
+
+def competition_coverage_synced_at(team_id, max_age_days=365):
+    """
+    When every competition the team played in over the last max_age_days was
+    last ingested (the oldest of those ingests), or None if one never was
+    """
+    since = (datetime.utcnow() - timedelta(days=max_age_days)).strftime('%Y-%m-%d')
+    return get_store().team_coverage_synced_at(team_id, since)
+
+def team_history_synced_at(team_id):
+    """
+    When a team's match history was last synced, by its own fetch or by
+    ingesting every competition it plays in, whichever is more recent
+    """
+    synced_at = (get_store().team_synced_at(team_id), competition_coverage_synced_at(team_id))
+    return max((value for value in synced_at if value is not None), default=None)
+
+def stored_team_history(team_id, limit=MATCHES_TO_CONSIDER):
+    """
+    Recent competitive matches for a team from the match store, regardless of sync age
+    """
+    return filter_competitive_matches(get_store().team_matches(team_id, limit=history_window(limit)))[:limit]
+
+def stored_head_to_head(team_a_id, team_b_id, limit=MAX_H2H_MATCHES):
+    """
+    Head-to-head meetings between two teams from the match store, regardless of sync age
+    """
+    return get_store().head_to_head(team_a_id, team_b_id, limit=limit)
+
+def get_stored_head_to_head(team_a_id, team_b_id, limit=MAX_H2H_MATCHES, max_age_hours=CACHE_MAX_AGE,
+                            max_stale_hours=CACHE_MAX_STALENESS):
+    """
+    Head-to-head matches from the match store, else None.
+    
+    Meetings come from the pair index, which every team fetch and competition
+    ingest also fills. They are used when the pair itself was synced recently
+    (or both teams' competitions were ingested recently), or when either
+    team's history is fresh and already holds at least `limit` meetings;
+    otherwise the caller falls back to the dedicated API request. Stale data
+    is served while it refreshes, as for team matches.
+    """
+    store = get_store()
+    window_seconds = _serving_window(max_age_hours, max_stale_hours)
+    
+    def pair_synced_at():
+        synced_at = [store.pair_synced_at(team_a_id, team_b_id)]
+        coverage = [competition_coverage_synced_at(team_a_id), competition_coverage_synced_at(team_b_id)]
+        if None not in coverage:
+            synced_at.append(min(coverage))
+        return max((value for value in synced_at if value is not None), default=None)
+    
+    def synced_times():
+        return [
+            synced_at for synced_at in (
+                pair_synced_at(),
+                team_history_synced_at(team_a_id),
+                team_history_synced_at(team_b_id),
+            )
+            if synced_at is not None
+        ]
+    
+    def load():
+        meetings = store.head_to_head(team_a_id, team_b_id, limit=limit)
+        synced_at = pair_synced_at()
+        if synced_at is not None and time.time() - synced_at < window_seconds:
+            return meetings
+        return meetings if len(meetings) >= limit else None
+    
+    def refresh():
+        fetch_flight.do(
+            f"{h2h_cache_key(team_a_id, team_b_id)}:{limit}", _fetch_head_to_head,
+            team_a_id, team_b_id, get_team_name(team_a_id), get_team_name(team_b_id), limit
+        )
+    
+    return _load_stored(
+        f"{h2h_cache_key(team_a_id, team_b_id)}:{limit}", max_age_hours,
+        lambda: max(synced_times(), default=None),
+        load,
+        refresh,
+        max_stale_hours,
+    )
+
+def save_matches(matches, mark_synced=None):
+    """
+    Write fetched matches to the match store, fold the new ones into the team
+    ratings, then record the sync with mark_synced(store). Returns the ids of
+    the teams whose stored matches changed.
+    """
+    try:
+        store = get_store()
+        written = store.upsert_matches(matches)
+        rate_matches(store, matches, get_competition_importance)
+        changed_teams = {
+            team_id for match in written for team_id in (match['homeTeam']['id'], match['awayTeam']['id'])
+        }
+        invalidate_team_stats(changed_teams)
+        if mark_synced is not None:
+            mark_synced(store)
+        return changed_teams
+    except Exception as e:
+        print(f"Error saving to match store: {e}")
+        return set()
+
+def get_team_ratings(team_id, team_name=None, as_of=None):
+    """
+    Team statistics from the incrementally maintained ratings in the match
+    store (a lookup, no recomputation), or None if the team has none yet
+    """
+    rating = get_store().team_rating(team_id)
+    if rating is None:
+        return None
+    if team_name is None:
+        team_name = get_team_name(team_id)
+    return rating_stats(rating, team_id, team_name, as_of)
+
+def rebuild_team_ratings():
+    """
+    Fold every stored match into the team ratings, e.g. for a store filled
+    before ratings existed. Matches already rated are skipped.
+    """
+    store = get_store()
+    batch = []
+    applied = 0
+    for match in store.all_matches():
+        batch.append(match)
+        if len(batch) >= 1000:
+            applied += rate_matches(store, batch, get_competition_importance)
+            batch = []
+    if batch:
+        applied += rate_matches(store, batch, get_competition_importance)
+    return applied
+
+def get_memory_cache_stats():
+    """
+    Hit/miss counters and size of the in-memory cache tier
+    """
+    return _memory_cache.stats()
+
+def clear_memory_cache():
+    """
+    Drop every entry from the in-memory cache tier and the computed team stats
+    """
+    _memory_cache.clear()
+    _team_stats_cache.clear()
+
+def _cache_key_teams(cache_key):
+    """
+    Team ids a team name, team matches or head-to-head memory cache key is about
+    """
+    key = cache_key.split(':', 1)[0]
+    for prefix in ('team_name_', 'team_matches_', 'h2h_'):
+        if key.startswith(prefix):
+            try:
+                return {int(team_id) for team_id in key[len(prefix):].split('_')}
+            except ValueError:
+                return set()
+    return set()
+
+def invalidate_team_entries(team_ids):
+    """
+    Drop the in-memory names, match lists and head-to-head lists of these teams,
+    leaving every other entry in place
+    """
+    team_ids = set(team_ids)
+    return _memory_cache.pop_matching(lambda cache_key: not team_ids.isdisjoint(_cache_key_teams(cache_key)))
+
+def invalidate_team_stats(team_ids):
+    """
+    Forget the computed stats of teams that have new or changed matches, and
+    move them to a new generation so predictions cached for them are not reused
+    """
+    for team_id in set(team_ids):
+        _team_stats_cache.pop(team_id)
+        _team_generations[team_id] = _team_generations.get(team_id, 0) + 1
+
+def get_team_stats_cache_stats():
+    """
+    Hit/miss counters and size of the computed team stats cache
+    """
+    return _team_stats_cache.stats()
+
+def history_window(limit=MATCHES_TO_CONSIDER):
+    """
+    How many matches to look at before filtering by competitiveness
+    """
     # Get more matches than we need so we can filter by competitiveness later
-    api_limit = min(limit * 2, 100)  # Double the limit but stay within API constraints
+    return min(limit * 2, 100)  # Double the limit but stay within API constraints
+
+def team_sync_cursor(team_id):
+    """
+    utcDate of the latest finished match already synced for a team, or None if
+    the team has never been synced (and needs a full fetch)
+    """
+    try:
+        return get_store().team_synced_through(team_id)
+    except Exception as e:
+        print(f"Error reading match store: {e}")
+        return None
+
+def team_matches_request(team_id, limit=MATCHES_TO_CONSIDER, since=None):
+    """
+    URL and query parameters for fetching a team's recent matches.
+    With `since` (a sync cursor) only matches from that day on are requested.
+    """
+    url = f"{BASE_URL}/teams/{team_id}/matches"
+    
+    if since:
+        # Incremental sync: the stored history already covers everything before `since`
+        params = {
+            "status": "FINISHED",
+            "dateFrom": since[:10],
+            "dateTo": datetime.utcnow().strftime('%Y-%m-%d'),
+        }
+        return url, params
     
     params = {
         "status": "FINISHED",
-        "limit": api_limit,
+        "limit": history_window(limit),
         "sort": "date",  # Get matches sorted by date
         "direction": "desc"  # Most recent first
     }
     
-    try:
-        response = requests.get(url, headers=HEADERS, params=params)
-        
-        if response.status_code == 200:
-            data = response.json()
-            all_matches = data.get("matches", [])
+    return url, params
+
+def handle_team_matches_response(team_id, team_name, status_code, json_body, text,
+                                 limit=MATCHES_TO_CONSIDER, since=None):
+    """
+    Store a team matches response, then filter and trim it.
+    An incremental response (`since` set) is merged into the stored history first.
+    Shared by the sync and async fetch paths; json_body is a callable.
+    """
+    if status_code == 200:
+        data = json_body()
+        # Keep only the fields the model reads
+        all_matches = project_matches(data.get("matches", []))
+        if since:
+            print(f"Found {len(all_matches)} new matches for {team_name} since {since[:10]}")
+        else:
             print(f"Found {len(all_matches)} recent matches for {team_name}")
-            
+        
+        # Save every match once; later lookups are indexed queries.
+        # The newest finished match becomes the cursor for the next sync.
+        synced_through = max(
+            (match['utcDate'] for match in all_matches if match.get('status', 'FINISHED') == 'FINISHED'),
+            default=None
+        )
+        save_matches(all_matches, lambda store: store.mark_team_synced(team_id, synced_through=synced_through))
+        
+        matches = None
+        if since:
+            try:
+                matches = stored_team_history(team_id, limit)
+            except Exception as e:
+                print(f"Error reading match store: {e}")
+        
+        if matches is None:
             # Filter out friendlies and less important competitions
             competitive_matches = filter_competitive_matches(all_matches)
             
             # Take only the needed number of matches
             matches = competitive_matches[:limit]
-            
-            # Save to cache
-            save_to_cache(cache_key, matches)
-            
-            return matches
-        else:
-            print(f"API Error {response.status_code}: {response.text}")
-            return []
+        
+        _memory_cache.set(f"team_matches_{team_id}:{limit}", (time.time(), matches))
+        
+        return matches
+    else:
+        print(f"API Error {status_code}: {text}")
+        return []
+
+def get_recent_team_matches(team_id, limit=MATCHES_TO_CONSIDER, team_name=None):
+    """
+    Get the most recent matches for a specific team directly
+    """
+    # Get team name for logging purposes
+    if team_name is None:
+        team_name = get_team_name(team_id)
+    
+    # Try to get from the store first
+    cached_data = get_stored_team_matches(team_id, limit)
+    
+    if cached_data:
+        matches = cached_data
+        print(f"Using stored data: Found {len(matches)} recent matches for {team_name}")
+        return matches
+    
+    # Not stored, fetch from API (once, however many callers missed together)
+    return fetch_flight.do(f"team_matches_{team_id}:{limit}", _fetch_team_matches, team_id, team_name, limit)
+
+def _fetch_team_matches(team_id, team_name, limit):
+    # Another flight may have refreshed the store since our miss
+    cached_data = get_stored_team_matches(team_id, limit, max_stale_hours=None)
+    if cached_data:
+        return cached_data
+    
+    # Only ask for what happened since the last sync, if there was one
+    since = team_sync_cursor(team_id)
+    url, params = team_matches_request(team_id, limit, since)
+    
+    try:
+        response = get_client().get(url, params=params)
+        return handle_team_matches_response(
+            team_id, team_name, response.status_code, response.json, response.text, limit, since
+        )
             
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -136,18 +563,8 @@ def filter_competitive_matches(matches, max_age_days=365):
     """
     Filter matches to include only competitive games and recent ones
     """
-    # Define which competitions are considered more competitive/important
-    top_competition_ids = [
-        2001,  # Champions League
-        2002,  # Europa League
-        2019,  # Premier League
-        2014,  # La Liga
-        2021,  # Serie A
-        2015,  # Ligue 1
-        2002,  # Bundesliga
-        2000,  # World Cup
-        2018,  # European Championship
-    ]
+    # Competitions considered more competitive/important
+    top_competition_ids = TOP_COMPETITION_IDS
     
     # Filter by date - only include matches within the last year
     now = datetime.now()
@@ -178,24 +595,13 @@ def filter_competitive_matches(matches, max_age_days=365):
     # Combine the lists, prioritizing competitive matches
     return competitive_matches + other_matches
 
-def get_head_to_head_matches(team_a_id, team_b_id, limit=MAX_H2H_MATCHES):
+def h2h_cache_key(team_a_id, team_b_id):
+    return f"h2h_{min(team_a_id, team_b_id)}_{max(team_a_id, team_b_id)}"
+
+def head_to_head_request(team_a_id, team_b_id):
     """
-    Get head-to-head matches between two teams
+    URL and query parameters for fetching head-to-head matches
     """
-    # Get team names for logging purposes
-    team_a_name = get_team_name(team_a_id)
-    team_b_name = get_team_name(team_b_id)
-    
-    # Try to get from cache first
-    cache_key = f"h2h_{min(team_a_id, team_b_id)}_{max(team_a_id, team_b_id)}"
-    cached_data = get_cached_data(cache_key)
-    
-    if cached_data:
-        h2h_matches = cached_data
-        print(f"Using cached data: Found {len(h2h_matches)} head-to-head matches between {team_a_name} and {team_b_name}")
-        return h2h_matches[:limit]
-    
-    # Not in cache, fetch directly using the dedicated API endpoint
     url = f"{BASE_URL}/teams/{team_a_id}/matches"
     
     params = {
@@ -206,100 +612,292 @@ def get_head_to_head_matches(team_a_id, team_b_id, limit=MAX_H2H_MATCHES):
         "direction": "desc"
     }
     
-    try:
-        response = requests.get(url, headers=HEADERS, params=params)
+    return url, params
+
+def handle_head_to_head_response(team_a_id, team_b_id, team_a_name, team_b_name,
+                                 status_code, json_body, text, limit=MAX_H2H_MATCHES):
+    """
+    Store and trim a head-to-head response.
+    Shared by the sync and async fetch paths; json_body is a callable.
+    """
+    if status_code == 200:
+        data = json_body()
+        h2h_matches = project_matches(data.get("matches", []))
+        print(f"Found {len(h2h_matches)} head-to-head matches between {team_a_name} and {team_b_name}")
         
-        if response.status_code == 200:
-            data = response.json()
-            h2h_matches = data.get("matches", [])
-            print(f"Found {len(h2h_matches)} head-to-head matches between {team_a_name} and {team_b_name}")
-            
-            # Save to cache
-            save_to_cache(cache_key, h2h_matches)
-            
-            return h2h_matches[:limit]
-        else:
-            print(f"API Error {response.status_code} when fetching head-to-head matches: {response.text}")
-            return []
+        # Save to the store, indexed by the unordered pair
+        save_matches(h2h_matches, lambda store: store.mark_pair_synced(team_a_id, team_b_id))
+        
+        h2h_matches = h2h_matches[:limit]
+        _memory_cache.set(f"{h2h_cache_key(team_a_id, team_b_id)}:{limit}", (time.time(), h2h_matches))
+        
+        return h2h_matches
+    else:
+        print(f"API Error {status_code} when fetching head-to-head matches: {text}")
+        return []
+
+def get_head_to_head_matches(team_a_id, team_b_id, limit=MAX_H2H_MATCHES, team_a_name=None, team_b_name=None):
+    """
+    Get head-to-head matches between two teams
+    """
+    # Get team names for logging purposes
+    if team_a_name is None:
+        team_a_name = get_team_name(team_a_id)
+    if team_b_name is None:
+        team_b_name = get_team_name(team_b_id)
+    
+    # Try to get from the store first
+    cached_data = get_stored_head_to_head(team_a_id, team_b_id, limit)
+    
+    if cached_data is not None:
+        h2h_matches = cached_data
+        print(f"Using stored data: Found {len(h2h_matches)} head-to-head matches between {team_a_name} and {team_b_name}")
+        return h2h_matches
+    
+    # Not stored, fetch directly using the dedicated API endpoint (once per pair)
+    return fetch_flight.do(
+        f"{h2h_cache_key(team_a_id, team_b_id)}:{limit}", _fetch_head_to_head,
+        team_a_id, team_b_id, team_a_name, team_b_name, limit
+    )
+
+def _fetch_head_to_head(team_a_id, team_b_id, team_a_name, team_b_name, limit):
+    # Another flight may have refreshed the store since our miss
+    cached_data = get_stored_head_to_head(team_a_id, team_b_id, limit, max_stale_hours=None)
+    if cached_data is not None:
+        return cached_data
+    
+    url, params = head_to_head_request(team_a_id, team_b_id)
+    
+    try:
+        response = get_client().get(url, params=params)
+        return handle_head_to_head_response(
+            team_a_id, team_b_id, team_a_name, team_b_name,
+            response.status_code, response.json, response.text, limit
+        )
             
     except Exception as e:
         print(f"An error occurred when fetching head-to-head matches: {e}")
         return []
 
+def competition_matches_request(competition_id, season=None, date_from=None, date_to=None):
+    """
+    URL and query parameters for fetching every finished match of a competition
+    """
+    url = f"{BASE_URL}/competitions/{competition_id}/matches"
+    
+    params = {"status": "FINISHED"}
+    if season is not None:
+        params["season"] = season
+    if date_from and date_to:
+        params["dateFrom"] = date_from
+        params["dateTo"] = date_to
+    
+    return url, params
+
+def handle_competition_matches_response(competition_id, status_code, json_body, text):
+    """
+    Store a competition's matches and fan them out to every participating team:
+    names are saved and the matches join each team's and pair's stored history.
+    Returns the ids of the teams that were updated.
+    """
+    if status_code != 200:
+        print(f"API Error {status_code} when fetching competition {competition_id}: {text}")
+        return []
+    
+    data = json_body()
+    matches = project_matches(data.get("matches", []))
+    
+    teams = {}
+    for match in matches:
+        for side in ('homeTeam', 'awayTeam'):
+            team = match.get(side) or {}
+            if team.get('id') is not None:
+                teams[team['id']] = team.get('name')
+    
+    # The pair index is filled by the upsert itself. Team syncs are left alone: a
+    # team's history counts as synced through the ingest only while every
+    # competition it played in has been ingested (see team_history_synced_at).
+    def mark_synced(store):
+        store.save_teams({team_id: name for team_id, name in teams.items() if name})
+        store.mark_competition_synced(competition_id)
+    
+    changed_teams = save_matches(matches, mark_synced)
+    
+    # Cached query results for teams with new or changed matches are out of date
+    invalidate_team_entries(changed_teams)
+    
+    print(f"Ingested {len(matches)} matches for {len(teams)} teams from competition {competition_id}")
+    return list(teams)
+
+def ingest_competition(competition_id, season=None, date_from=None, date_to=None):
+    """
+    Populate the match store for every team in a competition with a single API call
+    """
+    url, params = competition_matches_request(competition_id, season, date_from, date_to)
+    
+    try:
+        response = get_client().get(url, params=params)
+        return handle_competition_matches_response(
+            competition_id, response.status_code, response.json, response.text
+        )
+    
+    except Exception as e:
+        print(f"An error occurred when ingesting competition {competition_id}: {e}")
+        return []
+
+def ingest_competitions(competition_ids=None, season=None):
+    """
+    Ingest several competitions (by default the top competitions) and
+    return {competition_id: [team ids]}
+    """
+    if competition_ids is None:
+        competition_ids = TOP_COMPETITION_IDS
+    
+    return {
+        competition_id: ingest_competition(competition_id, season)
+        for competition_id in dict.fromkeys(competition_ids)
+    }
+
+# Columns of the per-match feature table, in extract_match_features order
+MATCH_FEATURE_COLUMNS = [
+    'match_id', 'date', 'is_home', 'is_away', 'is_neutral', 'opponent_id', 'opponent_name',
+    'goals_scored', 'goals_conceded', 'total_goals', 'result', 'match_info',
+    'recency_score', 'competition_importance'
+]
+
+def format_match_info(match):
+    """
+    One-line description of a match for the history lists
+    """
+    home_score = match['score']['fullTime']['home'] or 0
+    away_score = match['score']['fullTime']['away'] or 0
+    is_neutral = match.get('venue', {}).get('neutral', False)
+    
+    # Match info for reference
+    match_info = f"{match['utcDate'][:10]} - "
+    if is_neutral:
+        match_info += f"{match['homeTeam']['name']} {home_score}-{away_score} {match['awayTeam']['name']} (Neutral)"
+    else:
+        match_info += f"{match['homeTeam']['name']} {home_score}-{away_score} {match['awayTeam']['name']}"
+    
+    # Add competition name if available
+    competition_name = match.get('competition', {}).get('name', '')
+    if competition_name:
+        match_info += f" ({competition_name})"
+    
+    return match_info
+
+class MatchHistory(Sequence):
+    """
+    match_info strings for a list of matches, formatted only when read.
+    Behaves like the list of strings it stands for (len, slicing, iteration, ==).
+    """
+    
+    def __init__(self, matches, positions=None):
+        self._matches = matches
+        self._positions = list(range(len(matches)) if positions is None else positions)
+        self._formatted = {}
+    
+    def __len__(self):
+        return len(self._positions)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        position = self._positions[index]
+        if position not in self._formatted:
+            self._formatted[position] = format_match_info(self._matches[position])
+        return self._formatted[position]
+    
+    def __eq__(self, other):
+        if isinstance(other, (MatchHistory, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+    
+    def __repr__(self):
+        return repr(list(self))
+
+def extract_match_frame(matches, team_id, now=None):
+    """
+    Columnar version of extract_match_features: one DataFrame column per
+    feature, built in bulk with dates parsed once and recency measured against
+    a single reference time. match_info is not included; the frame's index is
+    each row's position in `matches`, for MatchHistory(matches, frame.index).
+    """
+    columns = [column for column in MATCH_FEATURE_COLUMNS if column != 'match_info']
+    
+    home_ids = [match['homeTeam']['id'] for match in matches]
+    away_ids = [match['awayTeam']['id'] for match in matches]
+    
+    # Skip matches the team did not play in
+    positions = [i for i, (home_id, away_id) in enumerate(zip(home_ids, away_ids))
+                 if home_id == team_id or away_id == team_id]
+    if not positions:
+        return pd.DataFrame(columns=columns)
+    
+    rows = [matches[i] for i in positions]
+    is_home = np.array([home_ids[i] == team_id for i in positions])
+    is_away = np.array([away_ids[i] == team_id for i in positions])
+    is_neutral = np.array([match.get('venue', {}).get('neutral', False) for match in rows], dtype=bool)
+    
+    # Get team scores
+    home_score = np.array([match['score']['fullTime']['home'] or 0 for match in rows])
+    away_score = np.array([match['score']['fullTime']['away'] or 0 for match in rows])
+    
+    # Dates, and recency on a 0 to 1 scale (1 is most recent, 0 for a year or more ago)
+    dates = np.array([match['utcDate'][:10] for match in rows], dtype='datetime64[D]')
+    now = np.datetime64(datetime.now() if now is None else now, 'us')
+    days_ago = (now - dates) // np.timedelta64(1, 'D')
+    recency_score = np.maximum(0, 1 - (days_ago / 365))
+    
+    # Goals scored and conceded
+    goals_scored = np.where(is_home, home_score, away_score)
+    goals_conceded = np.where(is_home, away_score, home_score)
+    
+    # Opponent
+    opponent_side = np.where(is_home, 'awayTeam', 'homeTeam')
+    opponent_id = [match[side]['id'] for match, side in zip(rows, opponent_side)]
+    opponent_name = [match[side]['name'] for match, side in zip(rows, opponent_side)]
+    
+    # Competition importance (higher value for more important competitions)
+    competition_importance = [
+        get_competition_importance(match.get('competition', {}).get('id', 0)) for match in rows
+    ]
+    
+    # Result (win, draw, loss) from the team's point of view
+    result = np.select(
+        [goals_scored > goals_conceded, goals_scored < goals_conceded], ['W', 'L'], default='D'
+    )
+    
+    return pd.DataFrame({
+        'match_id': [match['id'] for match in rows],
+        'date': dates.astype('datetime64[ns]'),
+        'is_home': is_home,
+        'is_away': is_away,
+        'is_neutral': is_neutral,
+        'opponent_id': opponent_id,
+        'opponent_name': opponent_name,
+        'goals_scored': goals_scored,
+        'goals_conceded': goals_conceded,
+        'total_goals': goals_scored + goals_conceded,
+        'result': result,
+        'recency_score': recency_score,
+        'competition_importance': competition_importance
+    }, index=positions)
+
 def extract_match_features(matches, team_id):
     """
     Extract relevant features from match data for a specific team
     """
-    features = []
+    df = extract_match_frame(matches, team_id)
+    if df.empty:
+        return []
     
-    for match in matches:
-        is_home = match['homeTeam']['id'] == team_id
-        is_away = match['awayTeam']['id'] == team_id
-        is_neutral = match.get('venue', {}).get('neutral', False)
-        
-        # Skip if the team is not in this match
-        if not (is_home or is_away):
-            continue
-            
-        # Get team scores
-        home_score = match['score']['fullTime']['home'] or 0
-        away_score = match['score']['fullTime']['away'] or 0
-        
-        # Date
-        match_date = datetime.strptime(match['utcDate'][:10], '%Y-%m-%d')
-        
-        # Calculate match recency (0 to 1, where 1 is most recent)
-        days_ago = (datetime.now() - match_date).days
-        recency_score = max(0, 1 - (days_ago / 365))  # Scale from 0 to 1 based on days ago (max 1 year)
-        
-        # Goals scored and conceded
-        goals_scored = home_score if is_home else away_score
-        goals_conceded = away_score if is_home else home_score
-        
-        # Opponent
-        opponent_id = match['awayTeam']['id'] if is_home else match['homeTeam']['id']
-        opponent_name = match['awayTeam']['name'] if is_home else match['homeTeam']['name']
-        
-        # Competition importance (higher value for more important competitions)
-        competition_id = match.get('competition', {}).get('id', 0)
-        competition_importance = get_competition_importance(competition_id)
-        
-        # Result (win, draw, loss)
-        if home_score > away_score:
-            result = 'W' if is_home else 'L'
-        elif home_score < away_score:
-            result = 'L' if is_home else 'W'
-        else:
-            result = 'D'
-        
-        # Match info for reference
-        match_info = f"{match_date.strftime('%Y-%m-%d')} - "
-        if is_neutral:
-            match_info += f"{match['homeTeam']['name']} {home_score}-{away_score} {match['awayTeam']['name']} (Neutral)"
-        else:
-            match_info += f"{match['homeTeam']['name']} {home_score}-{away_score} {match['awayTeam']['name']}"
-        
-        # Add competition name if available
-        competition_name = match.get('competition', {}).get('name', '')
-        if competition_name:
-            match_info += f" ({competition_name})"
-        
-        features.append({
-            'match_id': match['id'],
-            'date': match_date,
-            'is_home': is_home,
-            'is_away': is_away,
-            'is_neutral': is_neutral,
-            'opponent_id': opponent_id,
-            'opponent_name': opponent_name,
-            'goals_scored': goals_scored,
-            'goals_conceded': goals_conceded,
-            'total_goals': goals_scored + goals_conceded,
-            'result': result,
-            'match_info': match_info,
-            'recency_score': recency_score,
-            'competition_importance': competition_importance
-        })
+    df['match_info'] = list(MatchHistory(matches, df.index))
+    
+    features = df[MATCH_FEATURE_COLUMNS].to_dict('records')
+    for feature in features:
+        feature['date'] = feature['date'].to_pydatetime()
     
     return features
 
@@ -308,200 +906,366 @@ def get_competition_importance(competition_id):
     Assign an importance value to different competitions
     Higher value means more important competition
     """
-    # Define importance levels for different competitions
-    top_competitions = {
-        2001: 1.0,  # Champions League
-        2002: 0.9,  # Europa League
-        2019: 0.8,  # Premier League
-        2014: 0.8,  # La Liga
-        2021: 0.8,  # Serie A
-        2015: 0.75, # Ligue 1
-        2002: 0.8,  # Bundesliga
-        2000: 1.0,  # World Cup
-        2018: 0.9,  # European Championship
-    }
-    
     # Return importance or default value for other competitions
-    return top_competitions.get(competition_id, 0.6)
+    return COMPETITION_IMPORTANCE.get(competition_id, 0.6)
 
-def get_team_stats(team_id):
+def get_team_stats(team_id, team_name=None):
     """
     Calculate team statistics from recent match data with improved focus on recency
     """
     # Get team name for logging
-    team_name = get_team_name(team_id)
+    if team_name is None:
+        team_name = get_team_name(team_id)
     
     # Get recent matches for this team
-    team_matches = get_recent_team_matches(team_id)
+    team_matches = get_recent_team_matches(team_id, team_name=team_name)
     
-    if not team_matches:
-        print(f"No matches found for {team_name}")
-        return None
+    return team_stats_from_history(team_id, team_name, team_matches)
+
+def team_stats_from_history(team_id, team_name, team_matches):
+    """
+    Team statistics once the team's history is synced: the stored ratings
+    when USE_TEAM_RATINGS is set and the team has any, else aggregated from
+    the fetched matches
+    """
+    if USE_TEAM_RATINGS:
+        stats = get_team_ratings(team_id, team_name)
+        if stats is not None:
+            return stats
+    return memoized_team_stats([(team_id, team_name, team_matches)])[team_id]
+
+def match_fingerprint(matches):
+    """
+    Data-version fingerprint of a match list: ids, dates, statuses and scores
+    """
+    return hash(tuple(
+        (match.get('id'), match.get('utcDate'), match.get('status'),
+         match['score']['fullTime']['home'], match['score']['fullTime']['away'])
+        for match in matches
+    ))
+
+def memoized_team_stats(teams):
+    """
+    build_many_team_stats, reusing stats already computed from the same data.
+    Each team's entry is keyed by its name, the match set fingerprint and the
+    day (recency weights are relative to today); only teams without a current
+    entry are aggregated. Callers get their own copy of each stats dict.
+    """
+    today = datetime.now().date()
+    results = {}
+    missing = []
     
-    # Extract features
-    features = extract_match_features(team_matches, team_id)
+    for team_id, team_name, team_matches in teams:
+        version = (team_name, today, match_fingerprint(team_matches or []))
+        entry = _team_stats_cache.get(team_id)
+        if entry is not None and entry[0] == version:
+            results[team_id] = entry[1]
+        else:
+            missing.append((team_id, team_name, team_matches, version))
     
-    # Convert to DataFrame for analysis
-    df = pd.DataFrame(features)
+    if missing:
+        built = build_many_team_stats([(team_id, team_name, team_matches)
+                                       for team_id, team_name, team_matches, _ in missing])
+        for team_id, _, _, version in missing:
+            _team_stats_cache.set(team_id, (version, built[team_id]))
+            results[team_id] = built[team_id]
     
-    if df.empty:
-        print(f"No features extracted for {team_name}")
-        return None
+    return {team_id: dict(stats) if stats is not None else None for team_id, stats in results.items()}
+
+def get_many_team_stats(team_ids):
+    """
+    Statistics for several teams at once: {team_id: stats or None}.
+    Matches are fetched per team, then aggregated for all teams in one pass.
+    """
+    teams = []
+    for team_id in dict.fromkeys(team_ids):
+        team_name = get_team_name(team_id)
+        teams.append((team_id, team_name, get_recent_team_matches(team_id, team_name=team_name)))
     
-    # Apply recency weighting to the data
-    df['weight'] = df['recency_score'] * df['competition_importance']
-    total_weight = df['weight'].sum()
+    return team_stats_from_histories(teams)
+
+def team_stats_from_histories(teams):
+    """
+    team_stats_from_history for many (team_id, team_name, matches) at once:
+    {team_id: stats or None}, with the teams that are not rated aggregated
+    in one pass
+    """
+    rated = {}
+    unrated = []
+    for team_id, team_name, team_matches in teams:
+        stats = get_team_ratings(team_id, team_name) if USE_TEAM_RATINGS else None
+        if stats is not None:
+            rated[team_id] = stats
+        else:
+            unrated.append((team_id, team_name, team_matches))
     
-    # Calculate weighted statistics
-    if total_weight > 0:
-        weighted_goals_scored = (df['goals_scored'] * df['weight']).sum() / total_weight
-        weighted_goals_conceded = (df['goals_conceded'] * df['weight']).sum() / total_weight
-        
-        # Home/away specific weighted stats
-        home_df = df[df['is_home'] & ~df['is_neutral']]
-        away_df = df[df['is_away'] & ~df['is_neutral']]
-        neutral_df = df[df['is_neutral']]
+    results = memoized_team_stats(unrated)
+    results.update(rated)
+    return {team_id: results[team_id] for team_id, _, _ in teams}
+
+# Venue codes used to group matches when aggregating
+VENUE_HOME, VENUE_AWAY, VENUE_NEUTRAL = 0, 1, 2
+
+def _ratio(numerator, denominator):
+    """numerator / denominator, and 0 wherever the denominator is 0"""
+    return np.divide(numerator, denominator, out=np.zeros(np.shape(numerator)), where=denominator > 0)
+
+def aggregate_match_frame(df, groups=None, n_groups=1):
+    """
+    Recency-weighted aggregates for the rows of an extract_match_frame table,
+    split by group (e.g. team) and venue, in a single bincount pass.
+    
+    Rows are weighted by recency_score * competition_importance. Every rate
+    falls back to a simple average for a group whose total weight is 0, as
+    the per-split pandas filters did. Per-venue arrays have shape
+    (n_groups, 3), indexed by VENUE_HOME / VENUE_AWAY / VENUE_NEUTRAL; the
+    rest have shape (n_groups,).
+    """
+    if groups is None:
+        groups = np.zeros(len(df), dtype=int)
+    
+    weight = df['recency_score'].to_numpy(dtype=float) * df['competition_importance'].to_numpy(dtype=float)
+    goals_scored = df['goals_scored'].to_numpy(dtype=float)
+    goals_conceded = df['goals_conceded'].to_numpy(dtype=float)
+    wins = (df['result'].to_numpy() == 'W').astype(float)
+    
+    venue = np.where(df['is_neutral'].to_numpy(dtype=bool), VENUE_NEUTRAL,
+                     np.where(df['is_home'].to_numpy(dtype=bool), VENUE_HOME, VENUE_AWAY))
+    bins = np.asarray(groups) * 3 + venue
+    
+    def by_venue(values=None):
+        return np.bincount(bins, weights=values, minlength=n_groups * 3).reshape(n_groups, 3)
+    
+    count = by_venue()
+    venue_weight = by_venue(weight)
+    sums = {
+        'goals_scored': (by_venue(weight * goals_scored), by_venue(goals_scored)),
+        'goals_conceded': (by_venue(weight * goals_conceded), by_venue(goals_conceded)),
+        'win_rate': (by_venue(weight * wins), by_venue(wins)),
+    }
+    
+    total_count = count.sum(axis=1)
+    total_weight = venue_weight.sum(axis=1)
+    weighted = total_weight > 0
+    
+    aggregates = {
+        'count': count,
+        'weight': venue_weight,
+        'total_count': total_count,
+        'total_weight': total_weight,
+        'avg_goals_scored': _ratio(sums['goals_scored'][1].sum(axis=1), total_count),
+        'avg_goals_conceded': _ratio(sums['goals_conceded'][1].sum(axis=1), total_count),
+    }
+    aggregates['avg_total_goals'] = aggregates['avg_goals_scored'] + aggregates['avg_goals_conceded']
+    
+    for name, (weighted_sum, plain_sum) in sums.items():
+        aggregates[name] = np.where(
+            weighted,
+            _ratio(weighted_sum.sum(axis=1), total_weight),
+            _ratio(plain_sum.sum(axis=1), total_count)
+        )
+        aggregates[f'venue_{name}'] = np.where(
+            weighted[:, None],
+            _ratio(weighted_sum, venue_weight),
+            _ratio(plain_sum, count)
+        )
+    
+    return aggregates
+
+def build_team_stats(team_id, team_name, team_matches):
+    """
+    Aggregate already-fetched matches into team statistics
+    """
+    return build_many_team_stats([(team_id, team_name, team_matches)])[team_id]
+
+def build_many_team_stats(teams):
+    """
+    Aggregate already-fetched matches for many teams at once.
+    teams is an iterable of (team_id, team_name, team_matches); returns
+    {team_id: stats}, with None for teams that have no usable matches.
+    """
+    results = {}
+    frames = []
+    
+    for team_id, team_name, team_matches in teams:
+        results[team_id] = None
         
-        home_weight = home_df['weight'].sum() if not home_df.empty else 0
-        away_weight = away_df['weight'].sum() if not away_df.empty else 0
-        neutral_weight = neutral_df['weight'].sum() if not neutral_df.empty else 0
+        if not team_matches:
+            print(f"No matches found for {team_name}")
+            continue
         
-        home_weighted_goals_scored = (home_df['goals_scored'] * home_df['weight']).sum() / home_weight if home_weight > 0 else 0
-        home_weighted_goals_conceded = (home_df['goals_conceded'] * home_df['weight']).sum() / home_weight if home_weight > 0 else 0
-        away_weighted_goals_scored = (away_df['goals_scored'] * away_df['weight']).sum() / away_weight if away_weight > 0 else 0
-        away_weighted_goals_conceded = (away_df['goals_conceded'] * away_df['weight']).sum() / away_weight if away_weight > 0 else 0
-        neutral_weighted_goals_scored = (neutral_df['goals_scored'] * neutral_df['weight']).sum() / neutral_weight if neutral_weight > 0 else 0
-        neutral_weighted_goals_conceded = (neutral_df['goals_conceded'] * neutral_df['weight']).sum() / neutral_weight if neutral_weight > 0 else 0
-    else:
-        # Fallback to simple average if no weights
-        weighted_goals_scored = df['goals_scored'].mean()
-        weighted_goals_conceded = df['goals_conceded'].mean()
+        # Extract features as columns (match_info is formatted lazily below)
+        df = extract_match_frame(team_matches, team_id)
         
-        home_df = df[df['is_home'] & ~df['is_neutral']]
-        away_df = df[df['is_away'] & ~df['is_neutral']]
-        neutral_df = df[df['is_neutral']]
+        if df.empty:
+            print(f"No features extracted for {team_name}")
+            continue
         
-        home_weighted_goals_scored = home_df['goals_scored'].mean() if not home_df.empty else 0
-        home_weighted_goals_conceded = home_df['goals_conceded'].mean() if not home_df.empty else 0
-        away_weighted_goals_scored = away_df['goals_scored'].mean() if not away_df.empty else 0
-        away_weighted_goals_conceded = away_df['goals_conceded'].mean() if not away_df.empty else 0
-        neutral_weighted_goals_scored = neutral_df['goals_scored'].mean() if not neutral_df.empty else 0
-        neutral_weighted_goals_conceded = neutral_df['goals_conceded'].mean() if not neutral_df.empty else 0
-    
-    # Calculate weighted win rate
-    if total_weight > 0:
-        win_df = df[df['result'] == 'W']
-        weighted_win_rate = (win_df['weight'].sum() / total_weight) if not win_df.empty else 0
-    else:
-        weighted_win_rate = len(df[df['result'] == 'W']) / len(df) if len(df) > 0 else 0
+        frames.append((team_id, team_name, team_matches, df))
     
-    # Calculate neutral venue win rate separately
-    if not neutral_df.empty and neutral_weight > 0:
-        neutral_win_df = neutral_df[neutral_df['result'] == 'W']
-        neutral_weighted_win_rate = (neutral_win_df['weight'].sum() / neutral_weight) if not neutral_win_df.empty else 0
-    else:
-        neutral_weighted_win_rate = 0
-    
-    # Calculate aggregated stats
-    stats = {
-        'team_id': team_id,
-        'team_name': team_name,
-        'num_matches': len(df),
-        'num_home_matches': len(home_df),
-        'num_away_matches': len(away_df),
-        'num_neutral_matches': len(neutral_df),
-        'avg_goals_scored': df['goals_scored'].mean(),  # Keep simple average for reference
-        'avg_goals_conceded': df['goals_conceded'].mean(),
-        'avg_total_goals': df['total_goals'].mean(),
-        'weighted_goals_scored': weighted_goals_scored,  # New weighted metrics
-        'weighted_goals_conceded': weighted_goals_conceded,
-        'home_avg_goals_scored': home_weighted_goals_scored,
-        'home_avg_goals_conceded': home_weighted_goals_conceded,
-        'away_avg_goals_scored': away_weighted_goals_scored,
-        'away_avg_goals_conceded': away_weighted_goals_conceded,
-        'neutral_avg_goals_scored': neutral_weighted_goals_scored,
-        'neutral_avg_goals_conceded': neutral_weighted_goals_conceded,
-        'win_rate': weighted_win_rate,
-        'neutral_win_rate': neutral_weighted_win_rate,
-        'recent_form': ''.join(df.sort_values('date', ascending=False)['result'].head(5).tolist()),
-        'match_results': df.to_dict('records')
-    }
+    if not frames:
+        return results
     
-    # Add a list of match results for reference
-    stats['match_history'] = df.sort_values('date', ascending=False)['match_info'].tolist()
+    # One aggregation pass over every team's matches
+    sizes = [len(frame[3]) for frame in frames]
+    combined = pd.concat([frame[3] for frame in frames], ignore_index=True)
+    groups = np.repeat(np.arange(len(frames)), sizes)
+    agg = aggregate_match_frame(combined, groups, len(frames))
     
-    print(f"Calculated stats for {team_name} based on {len(df)} recent matches")
-    if stats['recent_form']:
-        print(f"Recent form: {stats['recent_form']}")
+    # One sort for every team: by team, then most recent first
+    dates = combined['date'].to_numpy().astype('int64')
+    order = np.lexsort((-dates, groups))
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
     
-    return stats
+    for i, (team_id, team_name, team_matches, df) in enumerate(frames):
+        # Row positions within this team's frame, most recent first
+        recent_first = order[offsets[i]:offsets[i + 1]] - offsets[i]
+        weighted = agg['total_weight'][i] > 0
+        
+        # Apply recency weighting to the data
+        df['weight'] = df['recency_score'] * df['competition_importance']
+        
+        # Calculate aggregated stats
+        stats = {
+            'team_id': team_id,
+            'team_name': team_name,
+            'num_matches': len(df),
+            'num_home_matches': int(agg['count'][i, VENUE_HOME]),
+            'num_away_matches': int(agg['count'][i, VENUE_AWAY]),
+            'num_neutral_matches': int(agg['count'][i, VENUE_NEUTRAL]),
+            'avg_goals_scored': agg['avg_goals_scored'][i],  # Keep simple average for reference
+            'avg_goals_conceded': agg['avg_goals_conceded'][i],
+            'avg_total_goals': agg['avg_total_goals'][i],
+            'weighted_goals_scored': agg['goals_scored'][i],  # New weighted metrics
+            'weighted_goals_conceded': agg['goals_conceded'][i],
+            'home_avg_goals_scored': agg['venue_goals_scored'][i, VENUE_HOME],
+            'home_avg_goals_conceded': agg['venue_goals_conceded'][i, VENUE_HOME],
+            'away_avg_goals_scored': agg['venue_goals_scored'][i, VENUE_AWAY],
+            'away_avg_goals_conceded': agg['venue_goals_conceded'][i, VENUE_AWAY],
+            'neutral_avg_goals_scored': agg['venue_goals_scored'][i, VENUE_NEUTRAL],
+            'neutral_avg_goals_conceded': agg['venue_goals_conceded'][i, VENUE_NEUTRAL],
+            'win_rate': agg['win_rate'][i],
+            # Neutral venue win rate is only defined from weighted matches
+            'neutral_win_rate': agg['venue_win_rate'][i, VENUE_NEUTRAL] if weighted else 0,
+            'recent_form': ''.join(df['result'].to_numpy()[recent_first[:5]]),
+            'match_results': df.to_dict('records')
+        }
+        
+        # Add a list of match results for reference
+        stats['match_history'] = MatchHistory(team_matches, df.index[recent_first])
+        
+        print(f"Calculated stats for {team_name} based on {len(df)} recent matches")
+        if stats['recent_form']:
+            print(f"Recent form: {stats['recent_form']}")
+        
+        results[team_id] = stats
+    
+    return results
 
 def get_match_prediction_data(team_a_id, team_b_id):
     """
     Get all data needed for predicting match between team A and team B
     """
-    # Get team names for logging
+    return prediction_data_from_inputs(get_match_inputs(team_a_id, team_b_id))
+
+def get_match_inputs(team_a_id, team_b_id):
+    """
+    The matches a prediction between team A and team B is computed from:
+    both teams' names and recent matches, and their head-to-head matches
+    """
+    # Get team names once and reuse them for every lookup below
     team_a_name = get_team_name(team_a_id)
     team_b_name = get_team_name(team_b_id)
     
-    # Get team stats from recent matches
-    team_a_stats = get_team_stats(team_a_id)
-    team_b_stats = get_team_stats(team_b_id)
+    # Get recent matches for both teams
+    team_a_matches = get_recent_team_matches(team_a_id, team_name=team_a_name)
+    team_b_matches = get_recent_team_matches(team_b_id, team_name=team_b_name)
+    
+    # Get head-to-head matches, unless one team has nothing to predict from
+    h2h_matches = []
+    if team_a_matches and team_b_matches:
+        h2h_matches = get_head_to_head_matches(
+            team_a_id, team_b_id, team_a_name=team_a_name, team_b_name=team_b_name
+        )
+    
+    return match_inputs(team_a_id, team_a_name, team_a_matches, team_b_id, team_b_name, team_b_matches, h2h_matches)
+
+def match_inputs(team_a_id, team_a_name, team_a_matches, team_b_id, team_b_name, team_b_matches, h2h_matches):
+    """
+    Bundle the inputs of a prediction (see get_match_inputs)
+    """
+    return {
+        'team_a_id': team_a_id,
+        'team_a_name': team_a_name,
+        'team_a_matches': team_a_matches,
+        'team_b_id': team_b_id,
+        'team_b_name': team_b_name,
+        'team_b_matches': team_b_matches,
+        'h2h_matches': h2h_matches,
+    }
+
+def prediction_data_from_inputs(inputs):
+    """
+    Team stats and head-to-head statistics for a prediction from its inputs, or None
+    """
+    team_a_stats = team_stats_from_history(inputs['team_a_id'], inputs['team_a_name'], inputs['team_a_matches'])
+    team_b_stats = team_stats_from_history(inputs['team_b_id'], inputs['team_b_name'], inputs['team_b_matches'])
     
     if not team_a_stats or not team_b_stats:
         return None
     
-    # Get head-to-head matches
-    h2h_matches = get_head_to_head_matches(team_a_id, team_b_id)
+    return combine_prediction_data(team_a_stats, team_b_stats, inputs['h2h_matches'])
+
+def prediction_data_version(inputs):
+    """
+    Data version of a prediction's inputs: fingerprints of both teams' matches
+    and their head-to-head matches, the teams' generations (bumped when a save
+    adds or changes their matches) and the day, as recency weights are relative to today
+    """
+    return (
+        datetime.now().date(),
+        _team_generations.get(inputs['team_a_id'], 0),
+        _team_generations.get(inputs['team_b_id'], 0),
+        match_fingerprint(inputs['team_a_matches'] or []),
+        match_fingerprint(inputs['team_b_matches'] or []),
+        match_fingerprint(inputs['h2h_matches'] or []),
+    )
+
+def combine_prediction_data(team_a_stats, team_b_stats, h2h_matches):
+    """
+    Add head-to-head statistics to both teams' stats and bundle the prediction data
+    """
+    team_a_id = team_a_stats['team_id']
+    team_a_name = team_a_stats['team_name']
+    team_b_name = team_b_stats['team_name']
     
     if not h2h_matches:
         print(f"No head-to-head matches found between {team_a_name} and {team_b_name}")
     
     if h2h_matches:
         # Calculate head-to-head stats for team A
-        h2h_features = extract_match_features(h2h_matches, team_a_id)
-        h2h_df = pd.DataFrame(h2h_features)
+        h2h_df = extract_match_frame(h2h_matches, team_a_id)
         
         if not h2h_df.empty:
-            # Apply recency weighting to H2H matches
-            h2h_df['weight'] = h2h_df['recency_score'] * h2h_df['competition_importance']
-            total_h2h_weight = h2h_df['weight'].sum()
+            # Recency-weighted H2H aggregates, overall and at neutral venues, in one pass
+            agg = aggregate_match_frame(h2h_df)
+            weighted = agg['total_weight'][0] > 0
             
-            # Track neutral venue H2H matches
-            neutral_h2h_df = h2h_df[h2h_df['is_neutral']]
-            neutral_h2h_weight = neutral_h2h_df['weight'].sum() if not neutral_h2h_df.empty else 0
+            team_a_stats['h2h_avg_goals_scored'] = agg['goals_scored'][0]
+            team_a_stats['h2h_avg_goals_conceded'] = agg['goals_conceded'][0]
+            team_a_stats['h2h_win_rate'] = agg['win_rate'][0]
             
-            if total_h2h_weight > 0:
-                # Weighted H2H stats
-                team_a_stats['h2h_avg_goals_scored'] = (h2h_df['goals_scored'] * h2h_df['weight']).sum() / total_h2h_weight
-                team_a_stats['h2h_avg_goals_conceded'] = (h2h_df['goals_conceded'] * h2h_df['weight']).sum() / total_h2h_weight
-                
-                win_h2h_df = h2h_df[h2h_df['result'] == 'W']
-                team_a_stats['h2h_win_rate'] = (win_h2h_df['weight'].sum() / total_h2h_weight) if not win_h2h_df.empty else 0
-                
-                # Add neutral venue specific H2H stats if available
-                if neutral_h2h_weight > 0:
-                    neutral_win_h2h_df = neutral_h2h_df[neutral_h2h_df['result'] == 'W']
-                    team_a_stats['h2h_neutral_win_rate'] = (neutral_win_h2h_df['weight'].sum() / neutral_h2h_weight) if not neutral_win_h2h_df.empty else 0
-                    team_a_stats['h2h_neutral_avg_goals_scored'] = (neutral_h2h_df['goals_scored'] * neutral_h2h_df['weight']).sum() / neutral_h2h_weight
-                    team_a_stats['h2h_neutral_avg_goals_conceded'] = (neutral_h2h_df['goals_conceded'] * neutral_h2h_df['weight']).sum() / neutral_h2h_weight
-            else:
-                # Fallback to simple average if no weights
-                team_a_stats['h2h_avg_goals_scored'] = h2h_df['goals_scored'].mean()
-                team_a_stats['h2h_avg_goals_conceded'] = h2h_df['goals_conceded'].mean()
-                team_a_stats['h2h_win_rate'] = len(h2h_df[h2h_df['result'] == 'W']) / len(h2h_df)
-                
-                # Add neutral venue specific H2H stats if available
-                if not neutral_h2h_df.empty:
-                    team_a_stats['h2h_neutral_win_rate'] = len(neutral_h2h_df[neutral_h2h_df['result'] == 'W']) / len(neutral_h2h_df)
-                    team_a_stats['h2h_neutral_avg_goals_scored'] = neutral_h2h_df['goals_scored'].mean()
-                    team_a_stats['h2h_neutral_avg_goals_conceded'] = neutral_h2h_df['goals_conceded'].mean()
+            # Add neutral venue specific H2H stats if available
+            if (agg['weight'] if weighted else agg['count'])[0, VENUE_NEUTRAL] > 0:
+                team_a_stats['h2h_neutral_win_rate'] = agg['venue_win_rate'][0, VENUE_NEUTRAL]
+                team_a_stats['h2h_neutral_avg_goals_scored'] = agg['venue_goals_scored'][0, VENUE_NEUTRAL]
+                team_a_stats['h2h_neutral_avg_goals_conceded'] = agg['venue_goals_conceded'][0, VENUE_NEUTRAL]
             
             # Add a list of h2h match results for reference
-            team_a_stats['h2h_history'] = h2h_df.sort_values('date', ascending=False)['match_info'].tolist()
+            team_a_stats['h2h_history'] = MatchHistory(h2h_matches, h2h_df.sort_values('date', ascending=False).index)
             
             # Count neutral venue h2h matches
-            team_a_stats['h2h_neutral_matches'] = len(neutral_h2h_df)
+            team_a_stats['h2h_neutral_matches'] = int(agg['count'][0, VENUE_NEUTRAL])
         
         # For team B, the values are inverted
         team_b_stats['h2h_avg_goals_scored'] = team_a_stats.get('h2h_avg_goals_conceded', 0)
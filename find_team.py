@@ -1,20 +1,12 @@
-import requests
-
-# API key from football-data.org
-API_KEY = "42941e9e63ae4f029b9a88377da23dec"
+from http_client import get_client
 
 def search_teams(team_name):
     """
     Search for teams by name and return a list of matches
     Modified to support the web interface
     """
-    # API endpoint
-    url = "https://api.football-data.org/v4/teams"
-    
-    # Request headers
-    headers = {
-        "X-Auth-Token": API_KEY
-    }
+    # API endpoint (base URL and auth headers come from config via the shared client)
+    url = "/teams"
     
     # Parameters: limit to a reasonable number
     params = {
@@ -24,7 +16,7 @@ def search_teams(team_name):
     
     try:
         # Make request
-        response = requests.get(url, headers=headers, params=params)
+        response = get_client().get(url, params=params)
         
         # Handle response
         if response.status_code == 200:
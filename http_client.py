@@ -0,0 +1,236 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    BASE_URL, HEADERS,
+    REQUEST_TIMEOUT, MAX_RETRIES, BACKOFF_FACTOR, MAX_RETRY_DELAY,
+    RATE_LIMIT_PER_MINUTE, HTTP_POOL_SIZE
+)
+
+# Status codes worth retrying: quota exhaustion and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter shared by every thread using a client.
+
+    The bucket holds up to ``capacity`` tokens and refills continuously at
+    ``rate_per_minute``; ``acquire`` blocks until a token is available.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Take a token if one is available and return 0, otherwise return the wait in seconds."""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Block until a token is available."""
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            self._sleep(wait)
+
+    async def acquire_async(self, sleep=asyncio.sleep):
+        """Wait for a token without blocking the event loop."""
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            await sleep(wait)
+
+
+def retry_delay(response, attempt, backoff_factor=BACKOFF_FACTOR, max_delay=MAX_RETRY_DELAY):
+    """
+    Seconds to wait before retrying a failed request, at most ``max_delay``.
+
+    Honours ``Retry-After``, and on 429 also football-data.org's
+    ``X-RequestCounter-Reset`` header, otherwise backs off exponentially.
+    """
+    delay = backoff_factor * (2 ** attempt)
+    if response is not None:
+        headers = ("Retry-After", "X-RequestCounter-Reset") if response.status_code == 429 else ("Retry-After",)
+        for header in headers:
+            value = response.headers.get(header)
+            if value is not None:
+                try:
+                    delay = max(0.0, float(value))
+                    break
+                except ValueError:
+                    pass
+    return min(delay, max_delay)
+
+
+class ApiClient:
+    """
+    Pooled HTTP client for the football-data.org API.
+
+    Keeps one ``requests.Session`` with keep-alive connections, applies a
+    timeout to every call, retries 429/5xx responses and connection errors
+    with exponential backoff (or the delay the server asks for, capped at
+    ``max_retry_delay``), and throttles requests through a token bucket
+    sized to the API's per-minute quota. After the last retry the final
+    response is returned as-is, so callers keep handling status codes.
+    """
+
+    def __init__(self, base_url=BASE_URL, headers=HEADERS, timeout=REQUEST_TIMEOUT,
+                 max_retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR, max_retry_delay=MAX_RETRY_DELAY,
+                 rate_limit_per_minute=RATE_LIMIT_PER_MINUTE, pool_size=HTTP_POOL_SIZE,
+                 rate_limiter=None, sleep=time.sleep):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_retry_delay = max_retry_delay
+        if rate_limiter is None and rate_limit_per_minute:
+            rate_limiter = TokenBucket(rate_limit_per_minute, sleep=sleep)
+        self.rate_limiter = rate_limiter
+        self._sleep = sleep
+
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path):
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(self, path, params=None):
+        """GET a path relative to the API base URL, retrying transient failures."""
+        url = self.url(path)
+
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                self._sleep(retry_delay(None, attempt, self.backoff_factor, self.max_retry_delay))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                self._sleep(retry_delay(response, attempt, self.backoff_factor, self.max_retry_delay))
+                continue
+
+            return response
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncApiClient:
+    """
+    ``httpx``-based counterpart of ``ApiClient`` for use inside the event loop.
+
+    Same timeout, retry and backoff rules. Pass the sync client's
+    ``rate_limiter`` to make both count against one shared quota.
+    """
+
+    def __init__(self, base_url=BASE_URL, headers=HEADERS, timeout=REQUEST_TIMEOUT,
+                 max_retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR, max_retry_delay=MAX_RETRY_DELAY,
+                 rate_limit_per_minute=RATE_LIMIT_PER_MINUTE, pool_size=HTTP_POOL_SIZE,
+                 rate_limiter=None, sleep=asyncio.sleep):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_retry_delay = max_retry_delay
+        if rate_limiter is None and rate_limit_per_minute:
+            rate_limiter = TokenBucket(rate_limit_per_minute)
+        self.rate_limiter = rate_limiter
+        self._sleep = sleep
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    url = ApiClient.url
+
+    async def get(self, path, params=None):
+        """GET a path relative to the API base URL, retrying transient failures."""
+        url = self.url(path)
+
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter:
+                await self.rate_limiter.acquire_async(self._sleep)
+
+            try:
+                response = await self.client.get(url, params=params)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+                await self._sleep(retry_delay(None, attempt, self.backoff_factor, self.max_retry_delay))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                await self._sleep(retry_delay(response, attempt, self.backoff_factor, self.max_retry_delay))
+                continue
+
+            return response
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_client = None
+_client_lock = threading.Lock()
+_async_clients = {}
+
+
+def get_client():
+    """Return the process-wide API client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ApiClient()
+    return _client
+
+
+def get_async_client():
+    """
+    Return the async API client for the running event loop.
+
+    httpx connection pools are bound to a loop, so one client is kept per
+    loop; all of them share the sync client's rate limiter.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        for stale_loop in [other for other in _async_clients if other.is_closed()]:
+            del _async_clients[stale_loop]
+        client = AsyncApiClient(rate_limiter=get_client().rate_limiter)
+        _async_clients[loop] = client
+    return client
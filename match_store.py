@@ -0,0 +1,416 @@
+"""
+SQLite-backed store for matches and team names.
+
+Every match is stored once, however many team or head-to-head lookups it
+belongs to, and is indexed by team, unordered team pair, competition, date
+and status. The database runs in WAL mode so several uvicorn workers can
+read while one of them writes.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from config import MATCH_STORE_PATH
+
+# Version of the slim match projection below; bump it when adding fields
+MATCH_SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY,
+    utc_date TEXT NOT NULL,
+    status TEXT,
+    home_team_id INTEGER,
+    away_team_id INTEGER,
+    team_low INTEGER,
+    team_high INTEGER,
+    competition_id INTEGER,
+    competition_type TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_matches_home ON matches (home_team_id, utc_date);
+CREATE INDEX IF NOT EXISTS idx_matches_away ON matches (away_team_id, utc_date);
+CREATE INDEX IF NOT EXISTS idx_matches_pair ON matches (team_low, team_high, utc_date);
+CREATE INDEX IF NOT EXISTS idx_matches_competition ON matches (competition_id, utc_date);
+CREATE INDEX IF NOT EXISTS idx_matches_status ON matches (status, utc_date);
+
+CREATE TABLE IF NOT EXISTS teams (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+
+-- When each team's match list / each pair's head-to-head list was last fetched.
+-- synced_through is the utcDate of the latest finished match the team's own
+-- fetches have returned; the next sync only asks for matches from that date on.
+CREATE TABLE IF NOT EXISTS team_sync (
+    team_id INTEGER PRIMARY KEY,
+    synced_at REAL NOT NULL,
+    synced_through TEXT
+);
+-- Decay-weighted rating state per team (see team_ratings), and which
+-- matches each team's state already includes
+CREATE TABLE IF NOT EXISTS team_ratings (
+    team_id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rated_matches (
+    team_id INTEGER NOT NULL,
+    match_id INTEGER NOT NULL,
+    PRIMARY KEY (team_id, match_id)
+);
+
+CREATE TABLE IF NOT EXISTS pair_sync (
+    team_low INTEGER NOT NULL,
+    team_high INTEGER NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (team_low, team_high)
+);
+
+-- When each competition's match list was last ingested. Kept apart from
+-- team_sync: one competition does not cover a team's other competitions.
+CREATE TABLE IF NOT EXISTS competition_sync (
+    competition_id INTEGER PRIMARY KEY,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+def team_pair(team_a_id, team_b_id):
+    """Unordered pair key: (lower id, higher id)."""
+    return min(team_a_id, team_b_id), max(team_a_id, team_b_id)
+
+
+def project_match(match):
+    """
+    Slim, versioned copy of an API match object.
+
+    Keeps only what the model reads (ids, date, status, team ids and names,
+    full-time score, neutral flag, competition id/name/type) in the API's
+    own nested shape, so code written against raw matches still works.
+    """
+    if match.get('_v') == MATCH_SCHEMA_VERSION:
+        return match
+
+    home = match.get('homeTeam') or {}
+    away = match.get('awayTeam') or {}
+    full_time = (match.get('score') or {}).get('fullTime') or {}
+    competition = match.get('competition') or {}
+    venue = match.get('venue')
+    neutral = venue.get('neutral', False) if isinstance(venue, dict) else False
+
+    return {
+        '_v': MATCH_SCHEMA_VERSION,
+        'id': match.get('id'),
+        'utcDate': match.get('utcDate'),
+        'status': match.get('status'),
+        'homeTeam': {'id': home.get('id'), 'name': home.get('name')},
+        'awayTeam': {'id': away.get('id'), 'name': away.get('name')},
+        'score': {'fullTime': {'home': full_time.get('home'), 'away': full_time.get('away')}},
+        'venue': {'neutral': bool(neutral)},
+        'competition': {
+            'id': competition.get('id'),
+            'name': competition.get('name'),
+            'type': competition.get('type'),
+        },
+    }
+
+
+def project_matches(matches):
+    return [project_match(match) for match in matches]
+
+
+def match_row(match):
+    """Indexed columns plus JSON payload for one API match object."""
+    home_id = match.get('homeTeam', {}).get('id')
+    away_id = match.get('awayTeam', {}).get('id')
+    competition = match.get('competition') or {}
+    if home_id is not None and away_id is not None:
+        team_low, team_high = team_pair(home_id, away_id)
+    else:
+        team_low = team_high = None
+
+    return (
+        match['id'],
+        match['utcDate'],
+        match.get('status'),
+        home_id,
+        away_id,
+        team_low,
+        team_high,
+        competition.get('id'),
+        competition.get('type'),
+        json.dumps(project_match(match), separators=(',', ':')),
+    )
+
+
+class MatchStore:
+    """
+    Normalized match and team storage shared by all workers.
+
+    Each thread gets its own connection; SQLite serializes writers and WAL
+    lets readers continue while a write is in progress.
+    """
+
+    def __init__(self, path=MATCH_STORE_PATH, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _migrate(self, conn):
+        """Bring databases created by older versions up to the current schema."""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(team_sync)")}
+        if 'synced_through' not in columns:
+            conn.execute("ALTER TABLE team_sync ADD COLUMN synced_through TEXT")
+
+    def close(self):
+        """Close every connection opened by this store."""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    # Matches
+
+    def upsert_matches(self, matches, batch_size=500):
+        """
+        Insert new matches and replace stored ones whose data changed; returns
+        the matches that were written (unchanged ones are left alone).
+        """
+        rows = {match['id']: (match, match_row(match)) for match in matches if match.get('id') is not None}
+        if not rows:
+            return []
+        with self._connection() as conn:
+            stored = {}
+            match_ids = list(rows)
+            for start in range(0, len(match_ids), batch_size):
+                batch = match_ids[start:start + batch_size]
+                stored.update(conn.execute(
+                    f"SELECT id, payload FROM matches WHERE id IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall())
+            changed = [(match, row) for match_id, (match, row) in rows.items() if stored.get(match_id) != row[-1]]
+            conn.executemany(
+                "INSERT OR REPLACE INTO matches (id, utc_date, status, home_team_id, away_team_id, "
+                "team_low, team_high, competition_id, competition_type, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [row for _, row in changed],
+            )
+        return [match for match, _ in changed]
+
+    def _payloads(self, sql, params):
+        rows = self._connection().execute(sql, params).fetchall()
+        # Rows written before the slim projection are projected on the way out
+        return [project_match(json.loads(payload)) for (payload,) in rows]
+
+    def team_matches(self, team_id, limit=None, status='FINISHED'):
+        """A team's stored matches, most recent first."""
+        # Two indexed halves rather than an OR, so both use their (team, date) index
+        sql = (
+            "SELECT payload FROM ("
+            " SELECT payload, utc_date FROM matches WHERE home_team_id = ? AND status = ?"
+            " UNION ALL"
+            " SELECT payload, utc_date FROM matches WHERE away_team_id = ? AND status = ?"
+            ") ORDER BY utc_date DESC LIMIT ?"
+        )
+        return self._payloads(sql, (team_id, status, team_id, status, -1 if limit is None else limit))
+
+    def head_to_head(self, team_a_id, team_b_id, limit=None, status='FINISHED'):
+        """Stored meetings between two teams, most recent first."""
+        team_low, team_high = team_pair(team_a_id, team_b_id)
+        sql = (
+            "SELECT payload FROM matches WHERE team_low = ? AND team_high = ? AND status = ?"
+            " ORDER BY utc_date DESC LIMIT ?"
+        )
+        return self._payloads(sql, (team_low, team_high, status, -1 if limit is None else limit))
+
+    def competition_matches(self, competition_id, limit=None, status='FINISHED'):
+        """Stored matches of one competition, most recent first."""
+        sql = (
+            "SELECT payload FROM matches WHERE competition_id = ? AND status = ?"
+            " ORDER BY utc_date DESC LIMIT ?"
+        )
+        return self._payloads(sql, (competition_id, status, -1 if limit is None else limit))
+
+    def all_matches(self, batch_size=1000):
+        """Every stored match, oldest first, fetched in batches."""
+        cursor = self._connection().execute("SELECT payload FROM matches ORDER BY utc_date")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for (payload,) in rows:
+                yield project_match(json.loads(payload))
+
+    # Ratings
+
+    def update_ratings(self, entries, update):
+        """
+        Apply update(state, match, team_id) -> new state for each (team_id, match)
+        entry not applied before; state is None for a team without one.
+        Runs in one immediate transaction, so concurrent workers can neither
+        apply a match twice nor lose each other's updates. Returns how many
+        entries were applied.
+        """
+        conn = self._connection()
+        applied = 0
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            states = {}
+            for team_id, match in entries:
+                claimed = conn.execute(
+                    "INSERT OR IGNORE INTO rated_matches (team_id, match_id) VALUES (?, ?)",
+                    (team_id, match['id']),
+                ).rowcount
+                if not claimed:
+                    continue
+                if team_id not in states:
+                    row = conn.execute("SELECT state FROM team_ratings WHERE team_id = ?", (team_id,)).fetchone()
+                    states[team_id] = json.loads(row[0]) if row else None
+                states[team_id] = update(states[team_id], match, team_id)
+                applied += 1
+
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO team_ratings (team_id, state, updated_at) VALUES (?, ?, ?)",
+                [(team_id, json.dumps(state), now) for team_id, state in states.items()],
+            )
+        return applied
+
+    def team_rating(self, team_id):
+        """A team's rating state, or None if none of its matches were rated yet."""
+        row = self._connection().execute("SELECT state FROM team_ratings WHERE team_id = ?", (team_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Teams
+
+    def save_team(self, team_id, name):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO teams (id, name, updated_at) VALUES (?, ?, ?)",
+                (team_id, name, time.time()),
+            )
+
+    def save_teams(self, names):
+        """Save many team names at once from a {team_id: name} mapping."""
+        now = time.time()
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO teams (id, name, updated_at) VALUES (?, ?, ?)",
+                [(team_id, name, now) for team_id, name in names.items()],
+            )
+
+    def team_name(self, team_id):
+        row = self._connection().execute("SELECT name FROM teams WHERE id = ?", (team_id,)).fetchone()
+        return row[0] if row else None
+
+    def team_updated_at(self, team_id):
+        row = self._connection().execute("SELECT updated_at FROM teams WHERE id = ?", (team_id,)).fetchone()
+        return row[0] if row else None
+
+    # Sync bookkeeping
+
+    def mark_team_synced(self, team_id, synced_at=None, synced_through=None):
+        """Record a sync; synced_through only ever moves forward."""
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO team_sync (team_id, synced_at, synced_through) VALUES (?, ?, ?) "
+                "ON CONFLICT (team_id) DO UPDATE SET synced_at = excluded.synced_at, "
+                "synced_through = CASE WHEN team_sync.synced_through IS NULL "
+                "OR excluded.synced_through > team_sync.synced_through "
+                "THEN excluded.synced_through ELSE team_sync.synced_through END",
+                (team_id, time.time() if synced_at is None else synced_at, synced_through),
+            )
+
+    def team_synced_at(self, team_id):
+        row = self._connection().execute(
+            "SELECT synced_at FROM team_sync WHERE team_id = ?", (team_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def team_synced_through(self, team_id):
+        row = self._connection().execute(
+            "SELECT synced_through FROM team_sync WHERE team_id = ?", (team_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def mark_pair_synced(self, team_a_id, team_b_id, synced_at=None):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pair_sync (team_low, team_high, synced_at) VALUES (?, ?, ?)",
+                (*team_pair(team_a_id, team_b_id), time.time() if synced_at is None else synced_at),
+            )
+
+    def mark_competition_synced(self, competition_id, synced_at=None):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO competition_sync (competition_id, synced_at) VALUES (?, ?)",
+                (competition_id, time.time() if synced_at is None else synced_at),
+            )
+
+    def competition_synced_at(self, competition_id):
+        row = self._connection().execute(
+            "SELECT synced_at FROM competition_sync WHERE competition_id = ?", (competition_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def team_coverage_synced_at(self, team_id, since):
+        """
+        When a team's matches from `since` on were last covered by competition
+        ingests: the oldest ingest of the competitions they belong to, or None
+        if the team has no such matches or one is in a competition never ingested.
+        """
+        synced_at, missing = self._connection().execute(
+            "SELECT MIN(competition_sync.synced_at), COUNT(*) - COUNT(competition_sync.synced_at) FROM ("
+            " SELECT competition_id FROM matches WHERE home_team_id = ? AND utc_date >= ?"
+            " UNION"
+            " SELECT competition_id FROM matches WHERE away_team_id = ? AND utc_date >= ?"
+            ") AS played LEFT JOIN competition_sync ON competition_sync.competition_id = played.competition_id",
+            (team_id, since, team_id, since),
+        ).fetchone()
+        return synced_at if not missing else None
+
+    def pair_synced_at(self, team_a_id, team_b_id):
+        row = self._connection().execute(
+            "SELECT synced_at FROM pair_sync WHERE team_low = ? AND team_high = ?",
+            team_pair(team_a_id, team_b_id),
+        ).fetchone()
+        return row[0] if row else None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide match store, opening it on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MatchStore()
+    return _store
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Small thread-safe least-recently-used cache with hit/miss counters.
+
+    Used for in-process caches that must stay bounded, such as the score
+    matrix cache in ``model`` and the L1 tier in front of the file cache.
+    When ``ttl`` (seconds) is set, entries also expire that long after they
+    were stored; ``set`` can override it per entry.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, clock=time.monotonic):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._expires = {}
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if absent or expired."""
+        with self._lock:
+            if key in self._data:
+                expires = self._expires.get(key)
+                if expires is None or self._clock() < expires:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return self._data[key]
+                del self._data[key]
+                del self._expires[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, evicting the least recently used entry when full."""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if ttl is not None:
+                self._expires[key] = self._clock() + ttl
+            else:
+                self._expires.pop(key, None)
+            while len(self._data) > self.maxsize:
+                evicted, _ = self._data.popitem(last=False)
+                self._expires.pop(evicted, None)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, computing and storing it on a miss."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def pop(self, key, default=None):
+        """Remove key and return its value."""
+        with self._lock:
+            self._expires.pop(key, None)
+            return self._data.pop(key, default)
+
+    def pop_matching(self, predicate):
+        """Remove every key for which predicate(key) is true; returns how many were removed."""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+                self._expires.pop(key, None)
+            return len(keys)
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def stats(self):
+        """Return hit/miss counters and current size."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+            }
@@ -1,11 +1,32 @@
+from collections.abc import Sized
+from functools import cached_property
+
 import numpy as np
 from scipy.stats import poisson
 import pandas as pd
 
+from memory_cache import LRUCache
+
 
 MIN_EXPECTED_GOALS = 0.2
 MAX_EXPECTED_GOALS = 4.5
 LOW_SCORE_RHO = -0.08
+DEFAULT_OVER_UNDER_LINES = tuple(np.arange(0.5, 6.75, 0.25))
+TAIL_MASS_TOLERANCE = 1e-6
+SCORE_MATRIX_CACHE_SIZE = 4096
+SCORE_MATRIX_CACHE_PRECISION = 0.01
+PREDICTION_CACHE_SIZE = 1024
+
+# Part of every prediction cache key; bump it whenever predict_goals or the score
+# distribution changes so predictions made by the previous model are not served
+MODEL_VERSION = 1
+
+# Opt-in cache of normalized score matrices, see enable_score_matrix_cache()
+_score_matrix_cache = None
+_score_matrix_cache_precision = SCORE_MATRIX_CACHE_PRECISION
+
+# Finished predictions, see prediction_cache_key()
+_prediction_cache = LRUCache(PREDICTION_CACHE_SIZE)
 
 
 def _safe_rate(value, fallback, minimum=0.1):
@@ -28,42 +49,140 @@ def _form_score(form_string):
     return sum(weights[i] * points.get(result, 0.5) for i, result in enumerate(form_string[:5]))
 
 
-def _apply_dixon_coles_adjustment(home_goals, away_goals, home_lambda, away_lambda, rho=LOW_SCORE_RHO):
-    """Low-score correlation adjustment for Poisson score lines."""
-    if home_goals == 0 and away_goals == 0:
-        return 1 - (home_lambda * away_lambda * rho)
-    if home_goals == 0 and away_goals == 1:
-        return 1 + (home_lambda * rho)
-    if home_goals == 1 and away_goals == 0:
-        return 1 + (away_lambda * rho)
-    if home_goals == 1 and away_goals == 1:
-        return 1 - rho
-    return 1.0
-
-
-def _build_joint_probability_matrix(team_a_exp_goals, team_b_exp_goals, max_goals):
-    """Build a normalized joint probability table for score combinations."""
-    probabilities = []
-
-    for home_goals in range(max_goals + 1):
-        home_prob = poisson.pmf(home_goals, team_a_exp_goals)
-        for away_goals in range(max_goals + 1):
-            away_prob = poisson.pmf(away_goals, team_b_exp_goals)
-            adjustment = _apply_dixon_coles_adjustment(
-                home_goals, away_goals, team_a_exp_goals, team_b_exp_goals
-            )
-            probabilities.append({
-                'home_goals': home_goals,
-                'away_goals': away_goals,
-                'probability': max(0.0, home_prob * away_prob * adjustment)
-            })
+def _dixon_coles_matrix(home_lambda, away_lambda, rho=LOW_SCORE_RHO):
+    """2x2 Dixon-Coles adjustment factors for the 0-0, 0-1, 1-0 and 1-1 cells."""
+    return np.array([
+        [1 - (home_lambda * away_lambda * rho), 1 + (home_lambda * rho)],
+        [1 + (away_lambda * rho), 1 - rho],
+    ])
+
+
+def adaptive_max_goals(team_a_exp_goals, team_b_exp_goals, tolerance=TAIL_MASS_TOLERANCE):
+    """Smallest grid size whose per-team tail mass beyond it stays below ``tolerance``."""
+    return max(1, int(poisson.isf(tolerance, max(team_a_exp_goals, team_b_exp_goals))))
+
+
+def _score_components(team_a_exp_goals, team_b_exp_goals, max_goals, rho=LOW_SCORE_RHO):
+    """
+    Pieces of the Dixon-Coles score distribution without building the full grid.
+
+    Returns the two Poisson pmf vectors, the change the Dixon-Coles factors
+    make to the 2x2 low-score block, and the normalizing constant of the
+    truncated grid.
+    """
+    goals = np.arange(max_goals + 1)
+    team_a_pmf = poisson.pmf(goals, team_a_exp_goals)
+    team_b_pmf = poisson.pmf(goals, team_b_exp_goals)
+
+    corner = min(2, max_goals + 1)
+    independent = np.outer(team_a_pmf[:corner], team_b_pmf[:corner])
+    adjusted = independent * _dixon_coles_matrix(team_a_exp_goals, team_b_exp_goals, rho)[:corner, :corner]
+    corner_delta = np.maximum(adjusted, 0.0) - independent
+
+    normalizer = (team_a_pmf.sum() * team_b_pmf.sum()) + corner_delta.sum()
+    return team_a_pmf, team_b_pmf, corner_delta, normalizer
+
+
+def _compute_score_matrix(team_a_exp_goals, team_b_exp_goals, max_goals, rho=LOW_SCORE_RHO):
+    """
+    Build a normalized joint probability array for score combinations.
+
+    Row index is team A (home) goals, column index is team B (away) goals.
+    The pmf vectors are evaluated once and combined with an outer product;
+    the Dixon-Coles correction only touches the top-left 2x2 block.
+    """
+    team_a_pmf, team_b_pmf, corner_delta, normalizer = _score_components(
+        team_a_exp_goals, team_b_exp_goals, max_goals, rho
+    )
+    matrix = np.outer(team_a_pmf, team_b_pmf)
+    corner = corner_delta.shape[0]
+    matrix[:corner, :corner] += corner_delta
+
+    if normalizer > 0:
+        matrix /= normalizer
+
+    return matrix
+
+
+def _total_goals_distribution(team_a_exp_goals, team_b_exp_goals, max_goals, rho=LOW_SCORE_RHO):
+    """
+    Total goals distribution by convolving the pmf vectors.
+
+    Only the 0-0, 0-1, 1-0 and 1-1 cells need correcting afterwards, so the
+    full score grid is never materialized.
+    """
+    team_a_pmf, team_b_pmf, corner_delta, normalizer = _score_components(
+        team_a_exp_goals, team_b_exp_goals, max_goals, rho
+    )
+    totals = np.convolve(team_a_pmf, team_b_pmf)
+    corner = corner_delta.shape[0]
+    for home_goals in range(corner):
+        totals[home_goals:home_goals + corner] += corner_delta[home_goals]
+
+    if normalizer > 0:
+        totals /= normalizer
 
-    prob_df = pd.DataFrame(probabilities)
-    total_probability = prob_df['probability'].sum()
-    if total_probability > 0:
-        prob_df['probability'] = prob_df['probability'] / total_probability
+    return totals
 
-    return prob_df
+
+def enable_score_matrix_cache(maxsize=SCORE_MATRIX_CACHE_SIZE, precision=SCORE_MATRIX_CACHE_PRECISION):
+    """
+    Turn on the bounded LRU cache of normalized score matrices.
+
+    Expected goals are rounded to the nearest multiple of ``precision``
+    before the matrix is built, and the cache key is the rounded pair plus
+    ``max_goals`` and ``rho``. Rounding moves each lambda by at most
+    ``precision / 2``; since the total variation distance between
+    Poisson(l) and Poisson(l + d) is at most ``|d|``, any market probability
+    derived from a cached matrix is off by at most about ``precision`` in
+    absolute terms (one percentage point at the default 0.01), and in
+    practice by much less.
+    """
+    global _score_matrix_cache, _score_matrix_cache_precision
+    _score_matrix_cache = LRUCache(maxsize)
+    _score_matrix_cache_precision = precision
+
+
+def disable_score_matrix_cache():
+    """Turn off and drop the score matrix cache."""
+    global _score_matrix_cache
+    _score_matrix_cache = None
+
+
+def score_matrix_cache_info():
+    """Hit/miss counters for the score matrix cache, or None when it is disabled."""
+    if _score_matrix_cache is None:
+        return None
+    return dict(_score_matrix_cache.stats(), precision=_score_matrix_cache_precision)
+
+
+def _quantize_lambdas(team_a_exp_goals, team_b_exp_goals):
+    """Round expected goals to the cache grid when the score matrix cache is enabled."""
+    if _score_matrix_cache is None:
+        return team_a_exp_goals, team_b_exp_goals
+    precision = _score_matrix_cache_precision
+    return (
+        round(team_a_exp_goals / precision) * precision,
+        round(team_b_exp_goals / precision) * precision,
+    )
+
+
+def _score_matrix(team_a_exp_goals, team_b_exp_goals, max_goals, rho=LOW_SCORE_RHO):
+    """Normalized score matrix, served from the quantized LRU cache when it is enabled."""
+    cache = _score_matrix_cache
+    if cache is None:
+        return _compute_score_matrix(team_a_exp_goals, team_b_exp_goals, max_goals, rho)
+
+    precision = _score_matrix_cache_precision
+    team_a_steps = int(round(team_a_exp_goals / precision))
+    team_b_steps = int(round(team_b_exp_goals / precision))
+
+    def compute():
+        matrix = _compute_score_matrix(team_a_steps * precision, team_b_steps * precision, max_goals, rho)
+        matrix.flags.writeable = False
+        return matrix
+
+    return cache.get_or_compute((team_a_steps, team_b_steps, max_goals, rho), compute)
 
 
 def predict_goals(team_a_stats, team_b_stats, is_neutral_venue=False):
@@ -173,21 +292,390 @@ def predict_goals(team_a_stats, team_b_stats, is_neutral_venue=False):
     return team_a_exp_goals, team_b_exp_goals
 
 
-def calculate_total_goals_probabilities(team_a_exp_goals, team_b_exp_goals, max_goals=10):
+def _stat_column(table, name):
+    """Read one column from a DataFrame or structured array as floats; NaN marks a missing value."""
+    names = table.columns if isinstance(table, pd.DataFrame) else table.dtype.names
+    if name not in names:
+        return np.full(len(table), np.nan)
+    return np.asarray(table[name], dtype=float)
+
+
+def _has_stat_column(table, name):
+    names = table.columns if isinstance(table, pd.DataFrame) else table.dtype.names
+    return name in names
+
+
+def _stat_or_default(table, name, default):
+    values = _stat_column(table, name)
+    return np.where(np.isnan(values), default, values)
+
+
+def _safe_rate_batch(values, fallback, minimum=0.1):
+    """Vectorized ``_safe_rate``."""
+    values = np.where(np.isnan(values) | (values <= 0), fallback, values)
+    return np.fmax(minimum, values)
+
+
+def _blend_with_overall_batch(split_value, split_matches, overall_value, min_matches=6):
+    """Vectorized ``_blend_with_overall``."""
+    reliability = np.minimum(1.0, np.maximum(0.0, split_matches / float(min_matches)))
+    return (split_value * reliability) + (overall_value * (1.0 - reliability))
+
+
+def _h2h_match_counts(table):
+    """Number of H2H meetings per row, from ``num_h2h_matches`` or the ``h2h_history`` lists."""
+    if _has_stat_column(table, 'num_h2h_matches'):
+        return _stat_or_default(table, 'num_h2h_matches', 0)
+    if _has_stat_column(table, 'h2h_history'):
+        return np.array([
+            len(history) if isinstance(history, Sized) and not isinstance(history, str) else 0
+            for history in table['h2h_history']
+        ], dtype=float)
+    return np.zeros(len(table))
+
+
+def predict_goals_batch(team_a_stats, team_b_stats, is_neutral_venue=False):
+    """
+    Vectorized ``predict_goals`` for N fixtures at once.
+
+    Args:
+        team_a_stats: DataFrame, structured NumPy array or list of stats dicts
+            with one row per fixture, using the same keys as ``predict_goals``
+        team_b_stats: Same layout as ``team_a_stats`` for the other side
+        is_neutral_venue: A single flag or one flag per fixture
+
+    Missing columns and NaN cells are treated like keys absent from the
+    stats dict. H2H counts come from a ``num_h2h_matches`` column when
+    present, otherwise from the length of each ``h2h_history`` entry.
+
+    Returns:
+        Tuple of arrays (team_a_exp_goals, team_b_exp_goals), matching the
+        scalar function row for row.
+    """
+    if isinstance(team_a_stats, list):
+        team_a_stats = pd.DataFrame(team_a_stats)
+    if isinstance(team_b_stats, list):
+        team_b_stats = pd.DataFrame(team_b_stats)
+    if len(team_a_stats) != len(team_b_stats):
+        raise ValueError("team_a_stats and team_b_stats must have the same number of rows")
+
+    neutral = np.broadcast_to(np.asarray(is_neutral_venue, dtype=bool), (len(team_a_stats),))
+
+    def overall(table, weighted, simple):
+        return _safe_rate_batch(_stat_column(table, weighted), _stat_or_default(table, simple, 1.2))
+
+    team_a_overall_scored = overall(team_a_stats, 'weighted_goals_scored', 'avg_goals_scored')
+    team_a_overall_conceded = overall(team_a_stats, 'weighted_goals_conceded', 'avg_goals_conceded')
+    team_b_overall_scored = overall(team_b_stats, 'weighted_goals_scored', 'avg_goals_scored')
+    team_b_overall_conceded = overall(team_b_stats, 'weighted_goals_conceded', 'avg_goals_conceded')
+
+    league_avg_goals = np.maximum(0.8, (
+        team_a_overall_scored + team_a_overall_conceded + team_b_overall_scored + team_b_overall_conceded
+    ) / 4)
+
+    def neutral_rate(table, suffix, overall_value):
+        return _blend_with_overall_batch(
+            _safe_rate_batch(_stat_column(table, f'neutral_avg_goals_{suffix}'), overall_value),
+            _stat_or_default(table, 'num_neutral_matches', 0),
+            (overall_value + _stat_or_default(table, f'away_avg_goals_{suffix}', overall_value)) / 2,
+            min_matches=4,
+        )
+
+    def venue_rate(table, venue, suffix, overall_value):
+        return _blend_with_overall_batch(
+            _safe_rate_batch(_stat_column(table, f'{venue}_avg_goals_{suffix}'), overall_value),
+            _stat_or_default(table, f'num_{venue}_matches', 0),
+            overall_value,
+        )
+
+    team_a_attack = np.where(
+        neutral,
+        neutral_rate(team_a_stats, 'scored', team_a_overall_scored),
+        venue_rate(team_a_stats, 'home', 'scored', team_a_overall_scored),
+    )
+    team_a_defense = np.where(
+        neutral,
+        neutral_rate(team_a_stats, 'conceded', team_a_overall_conceded),
+        venue_rate(team_a_stats, 'home', 'conceded', team_a_overall_conceded),
+    )
+    team_b_attack = np.where(
+        neutral,
+        neutral_rate(team_b_stats, 'scored', team_b_overall_scored),
+        venue_rate(team_b_stats, 'away', 'scored', team_b_overall_scored),
+    )
+    team_b_defense = np.where(
+        neutral,
+        neutral_rate(team_b_stats, 'conceded', team_b_overall_conceded),
+        venue_rate(team_b_stats, 'away', 'conceded', team_b_overall_conceded),
+    )
+    home_advantage = np.where(neutral, 1.0, 1.08)
+
+    team_a_attack_strength = team_a_attack / league_avg_goals
+    team_a_defense_strength = team_a_defense / league_avg_goals
+    team_b_attack_strength = team_b_attack / league_avg_goals
+    team_b_defense_strength = team_b_defense / league_avg_goals
+
+    team_a_exp_goals = league_avg_goals * team_a_attack_strength * team_b_defense_strength * home_advantage
+    team_b_exp_goals = league_avg_goals * team_b_attack_strength * team_a_defense_strength
+
+    def form_scores(table):
+        if not _has_stat_column(table, 'recent_form'):
+            return np.zeros(len(table))
+        return np.array([
+            _form_score(form if isinstance(form, str) else '') for form in table['recent_form']
+        ])
+
+    form_delta = form_scores(team_a_stats) - form_scores(team_b_stats)
+    form_weight = np.where(neutral, 0.12, 0.16)
+    team_a_exp_goals = team_a_exp_goals * (1 + (form_delta * form_weight))
+    team_b_exp_goals = team_b_exp_goals * (1 - (form_delta * form_weight))
+
+    has_h2h = (
+        ~np.isnan(_stat_column(team_a_stats, 'h2h_avg_goals_scored'))
+        & ~np.isnan(_stat_column(team_b_stats, 'h2h_avg_goals_scored'))
+    )
+    h2h_neutral_matches = _stat_or_default(team_a_stats, 'h2h_neutral_matches', 0)
+    use_neutral_h2h = neutral & (h2h_neutral_matches > 0)
+
+    neutral_h2h_weight = 0.08 * (np.minimum(h2h_neutral_matches, 4) / 4)
+    h2h_weight = 0.12 * (np.minimum(_h2h_match_counts(team_a_stats), 5) / 5)
+    h2h_weight = np.where(use_neutral_h2h, neutral_h2h_weight, h2h_weight)
+
+    team_a_h2h = np.where(
+        use_neutral_h2h,
+        _safe_rate_batch(_stat_column(team_a_stats, 'h2h_neutral_avg_goals_scored'), team_a_exp_goals),
+        _safe_rate_batch(_stat_column(team_a_stats, 'h2h_avg_goals_scored'), team_a_exp_goals),
+    )
+    team_b_h2h = np.where(
+        use_neutral_h2h,
+        _safe_rate_batch(_stat_column(team_b_stats, 'h2h_neutral_avg_goals_scored'), team_b_exp_goals),
+        _safe_rate_batch(_stat_column(team_b_stats, 'h2h_avg_goals_scored'), team_b_exp_goals),
+    )
+
+    team_a_exp_goals = np.where(
+        has_h2h, (team_a_exp_goals * (1 - h2h_weight)) + (team_a_h2h * h2h_weight), team_a_exp_goals
+    )
+    team_b_exp_goals = np.where(
+        has_h2h, (team_b_exp_goals * (1 - h2h_weight)) + (team_b_h2h * h2h_weight), team_b_exp_goals
+    )
+
+    return (
+        np.clip(team_a_exp_goals, MIN_EXPECTED_GOALS, MAX_EXPECTED_GOALS),
+        np.clip(team_b_exp_goals, MIN_EXPECTED_GOALS, MAX_EXPECTED_GOALS),
+    )
+
+
+def _line_probabilities(probabilities, cumulative, lines):
+    """Over/under/push fractions for simple (whole or half) lines, read off the cumulative array."""
+    lines = np.asarray(lines, dtype=float)
+    last = len(cumulative) - 1
+    floor = np.floor(lines).astype(int)
+    whole = lines == floor
+
+    below = np.where(whole, floor - 1, floor)
+    under = np.where(below >= 0, cumulative[np.clip(below, 0, last)], 0.0)
+    push = np.where(whole & (floor >= 0) & (floor <= last), probabilities[np.clip(floor, 0, last)], 0.0)
+    over = cumulative[last] - under - push
+    return over, under, push
+
+
+def _over_under_ladder(probabilities, thresholds):
+    """
+    Over/under/push fractions for many lines over a goal distribution indexed from zero.
+
+    Each line costs O(1) after a single cumulative sum. Quarter lines such as
+    2.25 are settled as split stakes: half on 2.0 and half on 2.5, so the
+    push share is half of the whole-number push.
+    """
+    thresholds = np.atleast_1d(np.asarray(thresholds, dtype=float))
+    if not np.isfinite(thresholds).all():
+        raise ValueError("Over/under lines must be finite numbers")
+    cumulative = np.cumsum(probabilities)
+
+    quarter = (thresholds * 4) % 2 == 1
+    lower = np.where(quarter, thresholds - 0.25, thresholds)
+    upper = np.where(quarter, thresholds + 0.25, thresholds)
+
+    over_low, under_low, push_low = _line_probabilities(probabilities, cumulative, lower)
+    over_high, under_high, push_high = _line_probabilities(probabilities, cumulative, upper)
+    return (over_low + over_high) / 2, (under_low + under_high) / 2, (push_low + push_high) / 2
+
+
+def _over_under(probabilities, threshold):
+    """Over/under/push split (as fractions) for one line."""
+    over, under, push = _over_under_ladder(probabilities, [threshold])
+    return {'over': over[0], 'under': under[0], 'push': push[0]}
+
+
+def _ladder_table(probabilities, thresholds):
+    over, under, push = _over_under_ladder(probabilities, thresholds)
+    return pd.DataFrame({
+        'threshold': np.atleast_1d(np.asarray(thresholds, dtype=float)),
+        'over': over * 100,
+        'under': under * 100,
+        'push': push * 100,
+    })
+
+
+def _as_percentages(market):
+    return {key: value * 100 for key, value in market.items()}
+
+
+class MatchDistribution:
+    """
+    Score distribution for a single fixture.
+
+    The joint score matrix is built once and every market (correct scores,
+    1X2, both teams to score, team totals and handicaps) is derived from it
+    on first access and cached on the instance. Total goals come straight
+    from a convolution of the pmf vectors, so total-only callers never build
+    the grid. When ``max_goals`` is None the grid size is picked from
+    ``tail_tolerance``. Distribution arrays are plain probabilities; market
+    dictionaries are percentages, matching the rest of this module.
+    """
+
+    def __init__(self, team_a_exp_goals, team_b_exp_goals, max_goals=None, rho=LOW_SCORE_RHO,
+                 tail_tolerance=TAIL_MASS_TOLERANCE):
+        self.team_a_exp_goals = float(team_a_exp_goals)
+        self.team_b_exp_goals = float(team_b_exp_goals)
+        if max_goals is None:
+            max_goals = adaptive_max_goals(self.team_a_exp_goals, self.team_b_exp_goals, tail_tolerance)
+        self.max_goals = max_goals
+        self.rho = rho
+        self._lambdas = _quantize_lambdas(self.team_a_exp_goals, self.team_b_exp_goals)
+        self._markets = {}
+
+    def _memoize(self, key, compute):
+        if key not in self._markets:
+            self._markets[key] = compute()
+        return self._markets[key]
+
+    @cached_property
+    def matrix(self):
+        """Normalized joint score probabilities, rows team A goals and columns team B goals."""
+        return _score_matrix(*self._lambdas, self.max_goals, self.rho)
+
+    @cached_property
+    def total_goals(self):
+        """Probability of each match total, indexed by number of goals."""
+        return _total_goals_distribution(*self._lambdas, self.max_goals, self.rho)
+
+    @cached_property
+    def goal_difference(self):
+        """Probability of each team A minus team B margin, indexed from -max_goals."""
+        home_goals, away_goals = np.indices(self.matrix.shape)
+        offset = self.matrix.shape[1] - 1
+        return np.bincount((home_goals - away_goals + offset).ravel(), weights=self.matrix.ravel())
+
+    @cached_property
+    def team_a_goals(self):
+        """Marginal distribution of team A goals."""
+        return self.matrix.sum(axis=1)
+
+    @cached_property
+    def team_b_goals(self):
+        """Marginal distribution of team B goals."""
+        return self.matrix.sum(axis=0)
+
+    @cached_property
+    def outcome(self):
+        """1X2 probabilities as percentages."""
+        return _as_percentages({
+            'team_a_win': np.tril(self.matrix, -1).sum(),
+            'draw': np.trace(self.matrix),
+            'team_b_win': np.triu(self.matrix, 1).sum(),
+        })
+
+    @cached_property
+    def both_teams_to_score(self):
+        """Both-teams-to-score probabilities as percentages."""
+        yes = self.matrix[1:, 1:].sum()
+        return _as_percentages({'yes': yes, 'no': 1.0 - yes})
+
+    def over_under(self, threshold):
+        """Over/under probabilities for the match total, as percentages."""
+        return self._memoize(('over_under', float(threshold)), lambda: _as_percentages(
+            _over_under(self.total_goals, threshold)
+        ))
+
+    def over_under_ladder(self, thresholds=DEFAULT_OVER_UNDER_LINES):
+        """Over/under/push percentages for every requested line as a DataFrame."""
+        return _ladder_table(self.total_goals, thresholds)
+
+    def over_under_lines(self, thresholds=DEFAULT_OVER_UNDER_LINES):
+        """Over, under and push percentage arrays for every requested line."""
+        over, under, push = _over_under_ladder(self.total_goals, thresholds)
+        return over * 100, under * 100, push * 100
+
+    def team_totals(self, threshold):
+        """Over/under probabilities for each side's own goals, as percentages."""
+        def compute():
+            return {
+                'team_a': _as_percentages(_over_under(self.team_a_goals, threshold)),
+                'team_b': _as_percentages(_over_under(self.team_b_goals, threshold)),
+            }
+        return self._memoize(('team_totals', float(threshold)), compute)
+
+    def handicap(self, line):
+        """
+        Handicap market from team A's point of view, as percentages.
+
+        ``line`` is added to team A's score, so -1.5 means team A must win by
+        two or more. Whole-number lines can push.
+        """
+        def compute():
+            margins = np.arange(len(self.goal_difference)) - (self.matrix.shape[1] - 1) + float(line)
+            return _as_percentages({
+                'team_a': self.goal_difference[margins > 0].sum(),
+                'team_b': self.goal_difference[margins < 0].sum(),
+                'push': self.goal_difference[margins == 0].sum(),
+            })
+        return self._memoize(('handicap', float(line)), compute)
+
+    def total_goals_table(self):
+        """Total goals distribution as a DataFrame of percentages."""
+        return pd.DataFrame({
+            'total_goals': np.arange(len(self.total_goals)),
+            'probability': self.total_goals * 100,
+        })
+
+    def top_scores(self, top=10):
+        """Team A goals, team B goals and percentage arrays of the most likely scores, best first."""
+        def compute():
+            flat = self.matrix.ravel()
+            order = np.arange(flat.size)
+            if top < flat.size:
+                order = np.argpartition(-flat, top - 1)[:top]
+            order = order[np.lexsort((order, -flat[order]))]
+            home_goals, away_goals = np.divmod(order, self.matrix.shape[1])
+            return home_goals, away_goals, flat[order] * 100
+        return self._memoize(('top_scores', top), compute)
+
+    def score_table(self, top=10):
+        """Most likely correct scores as a DataFrame of percentages."""
+        home_goals, away_goals, probabilities = self.top_scores(top)
+        return pd.DataFrame({
+            'home_goals': home_goals,
+            'away_goals': away_goals,
+            'probability': probabilities,
+            'score': [f"{h}-{a}" for h, a in zip(home_goals, away_goals)],
+        })
+
+
+def calculate_total_goals_probabilities(team_a_exp_goals, team_b_exp_goals, max_goals=None):
     """
     Calculate probability distribution for total goals in a match.
-    Uses a normalized joint score matrix instead of assuming independence only.
+    Uses a normalized joint score distribution instead of assuming independence only.
+    The grid size is chosen from TAIL_MASS_TOLERANCE unless max_goals is given.
     """
-    joint_df = _build_joint_probability_matrix(team_a_exp_goals, team_b_exp_goals, max_goals)
-    joint_df['total_goals'] = joint_df['home_goals'] + joint_df['away_goals']
+    return MatchDistribution(team_a_exp_goals, team_b_exp_goals, max_goals).total_goals_table()
+
 
-    prob_df = (
-        joint_df.groupby('total_goals', as_index=False)['probability']
-        .sum()
-        .sort_values('total_goals')
+def _total_goals_array(total_goals_df):
+    return np.bincount(
+        total_goals_df['total_goals'].to_numpy(dtype=int),
+        weights=total_goals_df['probability'].to_numpy(dtype=float) / 100,
     )
-    prob_df['probability'] = prob_df['probability'] * 100
-    return prob_df
 
 
 def calculate_over_under_probability(total_goals_df, threshold):
@@ -196,82 +684,157 @@ def calculate_over_under_probability(total_goals_df, threshold):
     
     Args:
         total_goals_df: DataFrame with total_goals and probability columns
-        threshold: The number of goals to calculate over/under probabilities for
+        threshold: The number of goals to calculate over/under probabilities for.
+            Quarter lines (e.g. 2.25) are settled as split stakes.
     
     Returns:
         Dictionary with over and under probabilities as percentages
     """
-    threshold = float(threshold)
-    total_goals = total_goals_df['total_goals'].values
-    probabilities = total_goals_df['probability'].values / 100
+    return _as_percentages(_over_under(_total_goals_array(total_goals_df), threshold))
 
-    over_prob = 0
-    under_prob = 0
-    equal_prob = 0
 
-    for goals, prob in zip(total_goals, probabilities):
-        if goals > threshold:
-            over_prob += prob
-        elif goals < threshold:
-            under_prob += prob
-        else:
-            equal_prob += prob
-
-    if threshold == int(threshold):
-        result = {
-            'over': over_prob * 100,
-            'under': under_prob * 100,
-            'push': equal_prob * 100
-        }
-    else:
-        result = {
-            'over': over_prob * 100,
-            'under': (under_prob + equal_prob) * 100,
-            'push': 0
-        }
+def calculate_over_under_ladder(total_goals_df, thresholds=DEFAULT_OVER_UNDER_LINES):
+    """
+    Calculate over/under probabilities for a whole ladder of lines at once
 
-    return result
+    Args:
+        total_goals_df: DataFrame with total_goals and probability columns
+        thresholds: Iterable of lines; whole numbers include a push and
+            quarter lines are settled as split stakes
+
+    Returns:
+        DataFrame with threshold, over, under and push columns as percentages
+    """
+    return _ladder_table(_total_goals_array(total_goals_df), thresholds)
 
 
-def calculate_score_probabilities(team_a_exp_goals, team_b_exp_goals, max_goals=5):
+def calculate_score_probabilities(team_a_exp_goals, team_b_exp_goals, max_goals=None):
     """Calculate probability distribution for specific scores."""
-    prob_df = _build_joint_probability_matrix(team_a_exp_goals, team_b_exp_goals, max_goals)
-    prob_df['score'] = prob_df['home_goals'].astype(str) + '-' + prob_df['away_goals'].astype(str)
-    prob_df['probability'] = prob_df['probability'] * 100
-    return prob_df.sort_values('probability', ascending=False).head(10)
+    return MatchDistribution(team_a_exp_goals, team_b_exp_goals, max_goals).score_table()
 
 
 def predict_match(team_a_id, team_b_id, is_neutral_venue=False, goal_threshold=None):
     """
     Main prediction function with added over/under threshold
     """
-    from data_fetcher import get_match_prediction_data, get_team_name
+    from data_fetcher import get_match_inputs
+
+    inputs = get_match_inputs(team_a_id, team_b_id)
+    key = prediction_cache_key(inputs, is_neutral_venue, goal_threshold)
+
+    prediction = _cached_prediction(key)
+    if prediction is None:
+        prediction = _predict_and_cache(key, inputs, is_neutral_venue, goal_threshold)
+    return prediction
+
+
+async def predict_match_async(team_a_id, team_b_id, is_neutral_venue=False, goal_threshold=None):
+    """
+    Async ``predict_match`` that fetches both teams and the H2H list concurrently;
+    the model math runs in the serving pool, off the event loop, and only
+    when the prediction is not cached
+    """
+    from async_data_fetcher import get_match_inputs_async
+    from serving import run_blocking
+
+    inputs = await get_match_inputs_async(team_a_id, team_b_id)
+    key = prediction_cache_key(inputs, is_neutral_venue, goal_threshold)
+
+    prediction = _cached_prediction(key)
+    if prediction is None:
+        prediction = await run_blocking(_predict_and_cache, key, inputs, is_neutral_venue, goal_threshold)
+    return prediction
+
+
+def prediction_cache_key(inputs, is_neutral_venue=False, goal_threshold=None, lines=DEFAULT_OVER_UNDER_LINES):
+    """
+    Cache key of a prediction: the fixture, venue, over/under threshold and
+    ladder, MODEL_VERSION and the data version of its inputs (see
+    data_fetcher.prediction_data_version), so new matches for either team or
+    the pair lead to a different key
+    """
+    from data_fetcher import prediction_data_version
+
+    try:
+        threshold = None if goal_threshold is None else float(goal_threshold)
+    except (ValueError, TypeError):
+        threshold = str(goal_threshold)
+
+    return (
+        MODEL_VERSION,
+        inputs['team_a_id'],
+        inputs['team_b_id'],
+        bool(is_neutral_venue),
+        threshold,
+        tuple(lines),
+        prediction_data_version(inputs),
+    )
+
 
-    team_a_name = get_team_name(team_a_id)
-    team_b_name = get_team_name(team_b_id)
+def _cached_prediction(key):
+    """The cached prediction for key (a copy, so callers may add to it), or None."""
+    prediction = _prediction_cache.get(key)
+    return dict(prediction) if prediction is not None else None
 
-    prediction_data = get_match_prediction_data(team_a_id, team_b_id)
+
+def _predict_and_cache(key, inputs, is_neutral_venue=False, goal_threshold=None):
+    from data_fetcher import prediction_data_from_inputs
+
+    prediction_data = prediction_data_from_inputs(inputs)
 
     if not prediction_data:
         return None
 
-    team_a_stats = prediction_data['team_a']
-    team_b_stats = prediction_data['team_b']
+    prediction = predict_from_data(prediction_data, is_neutral_venue, goal_threshold)
+    _prediction_cache.set(key, prediction)
+    return dict(prediction)
+
 
+def prediction_cache_info():
+    """Hit/miss counters and size of the prediction cache."""
+    return _prediction_cache.stats()
+
+
+def clear_prediction_cache():
+    """Drop every cached prediction."""
+    _prediction_cache.clear()
+
+
+def predict_from_data(prediction_data, is_neutral_venue=False, goal_threshold=None):
+    """
+    Run the model on already-fetched prediction data
+    """
     team_a_exp_goals, team_b_exp_goals = predict_goals(
-        team_a_stats, team_b_stats, is_neutral_venue
+        prediction_data['team_a'], prediction_data['team_b'], is_neutral_venue
+    )
+
+    return prediction_from_expected_goals(
+        prediction_data, team_a_exp_goals, team_b_exp_goals, is_neutral_venue, goal_threshold
     )
 
+
+def prediction_from_expected_goals(prediction_data, team_a_exp_goals, team_b_exp_goals,
+                                   is_neutral_venue=False, goal_threshold=None):
+    """
+    Build the prediction (distribution, tables and markets) for expected goals
+    that were already computed, e.g. by predict_goals_batch
+    """
+    team_a_stats = prediction_data['team_a']
+    team_b_stats = prediction_data['team_b']
+    team_a_name = team_a_stats['team_name']
+    team_b_name = team_b_stats['team_name']
+
     print(f"Expected goals - {team_a_name}: {team_a_exp_goals:.2f}, {team_b_name}: {team_b_exp_goals:.2f}")
 
-    prob_table = calculate_total_goals_probabilities(team_a_exp_goals, team_b_exp_goals)
-    score_probabilities = calculate_score_probabilities(team_a_exp_goals, team_b_exp_goals)
+    distribution = MatchDistribution(team_a_exp_goals, team_b_exp_goals)
+    prob_table = distribution.total_goals_table()
+    score_probabilities = distribution.score_table()
 
     over_under_result = None
     if goal_threshold is not None:
         try:
             goal_threshold = float(goal_threshold)
-            over_under_result = calculate_over_under_probability(prob_table, goal_threshold)
+            over_under_result = distribution.over_under(goal_threshold)
             print(f"Over/Under {goal_threshold} goals - Over: {over_under_result['over']:.2f}%, Under: {over_under_result['under']:.2f}%")
         except (ValueError, TypeError) as e:
             print(f"Error calculating over/under: {e}")
@@ -285,7 +848,11 @@ def predict_match(team_a_id, team_b_id, is_neutral_venue=False, goal_threshold=N
         'score_probabilities': score_probabilities,
         'most_likely_total': prob_table.loc[prob_table['probability'].idxmax(), 'total_goals'],
         'most_likely_score': score_probabilities.iloc[0]['score'] if not score_probabilities.empty else "Unknown",
+        'outcome_probabilities': distribution.outcome,
+        'both_teams_to_score': distribution.both_teams_to_score,
+        'distribution': distribution,
         'is_neutral_venue': is_neutral_venue,
         'over_under_result': over_under_result,
+        'over_under_ladder': distribution.over_under_ladder(),
         'goal_threshold': goal_threshold
     }
@@ -0,0 +1,123 @@
+"""
+Versioned JSON documents for the prediction API.
+
+Documents are built straight from the MatchDistribution arrays instead of
+the DataFrames the HTML page formats, and clients pick the sections they
+need with ``fields``. Serialization uses orjson (a requirement); the
+standard library encoder is only a fallback for installs without it.
+"""
+
+import json
+
+import numpy as np
+
+from model import DEFAULT_OVER_UNDER_LINES
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+API_VERSION = "v1"
+
+# Sections a client can ask for; fixture and version are always included
+PREDICTION_FIELDS = ('lambdas', 'markets', 'top_scores', 'total_goals', 'over_under', 'history')
+DEFAULT_FIELDS = ('lambdas', 'markets', 'top_scores', 'total_goals', 'over_under')
+
+TOP_SCORES = 10
+
+
+def parse_fields(fields=None):
+    """
+    Requested sections from a comma-separated list ("all" for every one),
+    DEFAULT_FIELDS when empty. Raises ValueError for unknown names.
+    """
+    if not fields:
+        return set(DEFAULT_FIELDS)
+    requested = {field.strip() for field in fields.split(',') if field.strip()}
+    if 'all' in requested:
+        return set(PREDICTION_FIELDS)
+    unknown = requested - set(PREDICTION_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return requested
+
+
+def _rounded(values, digits=2):
+    return np.round(np.asarray(values, dtype=float), digits).tolist()
+
+
+def _market(market, digits=2):
+    return {key: round(float(value), digits) for key, value in market.items()}
+
+
+def _team(stats):
+    return {'id': int(stats['team_id']), 'name': stats['team_name']}
+
+
+def prediction_document(prediction, fields=DEFAULT_FIELDS):
+    """
+    Compact JSON-ready document for a predict_from_data result, with only
+    the requested sections. Probabilities are percentages.
+    """
+    distribution = prediction['distribution']
+    document = {
+        'version': API_VERSION,
+        'fixture': {
+            'team_a': _team(prediction['team_a']),
+            'team_b': _team(prediction['team_b']),
+            'neutral_venue': bool(prediction['is_neutral_venue']),
+        },
+    }
+
+    if 'lambdas' in fields:
+        document['lambdas'] = {
+            'team_a': round(distribution.team_a_exp_goals, 4),
+            'team_b': round(distribution.team_b_exp_goals, 4),
+        }
+
+    if 'markets' in fields:
+        over_under = prediction.get('over_under_result')
+        document['markets'] = {
+            'outcome': _market(distribution.outcome),
+            'both_teams_to_score': _market(distribution.both_teams_to_score),
+            'most_likely_score': prediction['most_likely_score'],
+            'most_likely_total': int(np.argmax(distribution.total_goals)),
+            'over_under': dict(_market(over_under), threshold=prediction['goal_threshold']) if over_under else None,
+        }
+
+    if 'top_scores' in fields:
+        home_goals, away_goals, probabilities = distribution.top_scores(TOP_SCORES)
+        document['top_scores'] = [
+            {'team_a': int(h), 'team_b': int(a), 'probability': p}
+            for h, a, p in zip(home_goals, away_goals, _rounded(probabilities))
+        ]
+
+    if 'total_goals' in fields:
+        # Index is the number of goals
+        document['total_goals'] = _rounded(distribution.total_goals * 100)
+
+    if 'over_under' in fields:
+        over, under, push = distribution.over_under_lines(DEFAULT_OVER_UNDER_LINES)
+        document['over_under'] = {
+            'threshold': [float(threshold) for threshold in DEFAULT_OVER_UNDER_LINES],
+            'over': _rounded(over),
+            'under': _rounded(under),
+            'push': _rounded(push),
+        }
+
+    if 'history' in fields:
+        document['history'] = {
+            'team_a': list(prediction['team_a'].get('match_history', [])),
+            'team_b': list(prediction['team_b'].get('match_history', [])),
+            'head_to_head': list(prediction['team_a'].get('h2h_history', [])),
+        }
+
+    return document
+
+
+def dumps(document):
+    """Serialize a document to JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(document)
+    return json.dumps(document, separators=(',', ':')).encode()
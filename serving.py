@@ -0,0 +1,139 @@
+"""
+Keeping blocking work off the event loop, and bounding how much work the
+web app accepts.
+
+Store lookups, pandas aggregation and the model math all block, so the
+async serving path hands them to one bounded thread pool via run_blocking.
+Each route also gets a RouteLimiter: a fixed number of requests run at
+once, a bounded number wait for a slot, and anything beyond that (or
+waiting too long) is rejected with Overloaded, which the app turns into a
+503 instead of letting requests pile up behind slow ones.
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from config import BLOCKING_WORKERS, ROUTE_QUEUE_TIMEOUT
+
+_executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) in the blocking-work pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+class Overloaded(Exception):
+    """Raised when a route has no free slot and its wait queue is full."""
+
+    def __init__(self, route, retry_after=1):
+        super().__init__(f"{route} is overloaded, try again later")
+        self.route = route
+        self.retry_after = retry_after
+
+
+class RouteLimiter:
+    """
+    Per-route concurrency limit with queue-depth backpressure.
+
+    Use as ``async with limiter:``, or call the function acquire() returns
+    for work that outlives the handler (a streamed response). At most ``concurrency``
+    requests are inside at once; up to ``max_waiting`` more wait for a slot,
+    for at most ``timeout`` seconds. Requests beyond that raise Overloaded
+    right away.
+    """
+
+    def __init__(self, name, concurrency, max_waiting, timeout=ROUTE_QUEUE_TIMEOUT):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.rejected = 0
+        self._active = 0
+        self._waiting = 0
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def acquire(self):
+        """
+        Take a slot, waiting if allowed; raises Overloaded otherwise. Returns
+        a function that gives the slot back, only once however often it is
+        called, so every way a request can end may call it.
+        """
+        if not self._semaphore.locked():
+            # A free slot is taken without suspending
+            await self._semaphore.acquire()
+        else:
+            if self._waiting >= self.max_waiting:
+                self.rejected += 1
+                raise Overloaded(self.name)
+
+            self._waiting += 1
+            try:
+                acquired = await self._wait_for_slot()
+            finally:
+                self._waiting -= 1
+            if not acquired:
+                self.rejected += 1
+                raise Overloaded(self.name)
+
+        self._active += 1
+
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.release()
+
+        return release
+
+    async def _wait_for_slot(self):
+        """
+        Wait up to ``timeout`` for the semaphore; True once it is held. Unlike
+        wait_for, a slot granted just as the wait gives up (or is cancelled)
+        is handed back instead of leaked.
+        """
+        acquiring = asyncio.ensure_future(self._semaphore.acquire())
+        try:
+            await asyncio.wait({acquiring}, timeout=self.timeout)
+        except BaseException:
+            self._abandon(acquiring)
+            raise
+        if acquiring.done():
+            return True
+        self._abandon(acquiring)
+        return False
+
+    def _abandon(self, acquiring):
+        """Stop waiting on an acquire, returning the slot if it was granted meanwhile."""
+        def give_back(task):
+            if not task.cancelled() and task.exception() is None:
+                self._semaphore.release()
+
+        acquiring.cancel()
+        acquiring.add_done_callback(give_back)
+
+    def release(self):
+        """Give back a slot taken by ``async with``."""
+        self._active -= 1
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def stats(self):
+        """Requests running, waiting and rejected so far."""
+        return {
+            'active': self._active,
+            'waiting': self._waiting,
+            'rejected': self.rejected,
+            'concurrency': self.concurrency,
+            'max_waiting': self.max_waiting,
+        }
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one in-flight execution.
+
+    The first caller for a key (the leader) runs the work; callers that
+    arrive while it is running wait for and share its result or exception.
+    In-flight calls are tracked as ``concurrent.futures.Future`` objects, so
+    sync callers in worker threads and async callers on the event loop can
+    join each other's flights. A sync caller must not be running on the
+    event loop thread while an async leader for the same key is pending, and
+    should not hold a thread the leader needs to finish (such as a serving
+    pool thread): sync followers wait at most ``wait_timeout`` seconds and
+    then run the work themselves, so a stuck flight cannot hold them forever.
+    """
+
+    def __init__(self, wait_timeout=None):
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = set()
+
+    def _join(self, key):
+        """Return (future, is_leader) for key."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def in_flight(self, key):
+        """Whether a call for key is currently running."""
+        with self._lock:
+            return key in self._calls
+
+    def do(self, key, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) unless a call for key is already in flight."""
+        future, is_leader = self._join(key)
+        if not is_leader:
+            try:
+                return future.result(timeout=self.wait_timeout)
+            except FutureTimeoutError:
+                print(f"Gave up waiting for in-flight {key}, running it directly")
+                return fn(*args, **kwargs)
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def do_async(self, key, fn, *args, **kwargs):
+        """
+        Await fn(*args, **kwargs) unless a call for key is already in flight.
+
+        The leader's call runs in a task of its own and every caller only
+        waits on its result, so cancelling one caller (leader or follower)
+        stops that caller waiting without cancelling the shared call.
+        """
+        future, is_leader = self._join(key)
+        if is_leader:
+            task = asyncio.ensure_future(self._lead_async(key, future, fn, *args, **kwargs))
+            # The event loop only keeps weak references to tasks
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    async def _lead_async(self, key, future, fn, *args, **kwargs):
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            # Only happens when the loop shuts down; followers get an error, not the cancellation
+            self._finish(key, future, error=RuntimeError(f"In-flight call for {key} was cancelled"))
+            raise
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            return
+        self._finish(key, future, result)
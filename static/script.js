@@ -10,6 +10,11 @@ document.addEventListener('DOMContentLoaded', function() {
     const teamBInput = document.getElementById('team_b_input');
     const predictBtn = document.getElementById('predict-btn');
     
+    // Only the prediction form page has these elements
+    if (!teamASearch || !teamBSearch) {
+        return;
+    }
+    
     // Timer for delayed search
     let searchTimer;
     
@@ -137,8 +142,8 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initialize the goal threshold input
     const goalThresholdInput = document.getElementById('goal_threshold');
     if (goalThresholdInput) {
-        // Set default step to 0.5
-        goalThresholdInput.step = "0.5";
+        // Set default step to 0.25 so quarter lines can be entered
+        goalThresholdInput.step = "0.25";
         
         // Add event to validate input
         goalThresholdInput.addEventListener('input', function() {
@@ -169,9 +174,9 @@ document.addEventListener('DOMContentLoaded', function() {
             input.value = '0';
         }
         
-        // If it's not a multiple of 0.5, round to nearest 0.5
-        if (numValue % 0.5 !== 0) {
-            input.value = (Math.round(numValue * 2) / 2).toFixed(1);
+        // If it's not a multiple of 0.25, round to nearest quarter line
+        if (numValue % 0.25 !== 0) {
+            input.value = (Math.round(numValue * 4) / 4).toFixed(2);
         }
     }
     
@@ -201,4 +206,151 @@ document.addEventListener('DOMContentLoaded', function() {
     const tooltipList = tooltipTriggerList.map(function (tooltipTriggerEl) {
         return new bootstrap.Tooltip(tooltipTriggerEl);
     });
-});
\ No newline at end of file
+});
+
+// Batch page: stream predictions and fill in each row as its result arrives
+document.addEventListener('DOMContentLoaded', function() {
+    const batchForm = document.getElementById('batch-form');
+    if (!batchForm) {
+        return;
+    }
+    
+    const fixturesInput = document.getElementById('batch-fixtures');
+    const neutralInput = document.getElementById('batch-neutral');
+    const thresholdInput = document.getElementById('batch-threshold');
+    const batchBtn = document.getElementById('batch-btn');
+    const progressBar = document.getElementById('batch-progress');
+    const statusText = document.getElementById('batch-status');
+    const resultsBody = document.getElementById('batch-results');
+    
+    batchForm.addEventListener('submit', function(event) {
+        event.preventDefault();
+        
+        // One fixture per line: "Team A, Team B"
+        const fixtures = fixturesInput.value.split('\n')
+            .map(line => line.split(',').map(part => part.trim()))
+            .filter(parts => parts.length >= 2 && parts[0] && parts[1])
+            .map(parts => ({team_a: parts[0], team_b: parts[1]}));
+        
+        if (fixtures.length === 0) {
+            statusText.textContent = 'Enter at least one fixture as "Team A, Team B".';
+            return;
+        }
+        
+        // One placeholder row per fixture, filled in as results arrive
+        resultsBody.innerHTML = '';
+        fixtures.forEach(function(fixture, index) {
+            const row = document.createElement('tr');
+            row.id = `batch-row-${index}`;
+            row.innerHTML = `
+                <td>${index + 1}</td>
+                <td>${escapeHtml(fixture.team_a)} vs ${escapeHtml(fixture.team_b)}</td>
+                <td colspan="4" class="text-muted"><i class="fas fa-spinner fa-spin me-2"></i>Waiting...</td>
+            `;
+            resultsBody.appendChild(row);
+        });
+        
+        const threshold = thresholdInput.value.trim();
+        const body = {
+            fixtures: fixtures,
+            neutral: neutralInput.checked,
+            threshold: threshold === '' ? null : parseFloat(threshold),
+            fields: 'lambdas,markets'
+        };
+        
+        batchBtn.disabled = true;
+        updateProgress(0, fixtures.length);
+        statusText.textContent = 'Predicting...';
+        
+        streamBatch(body, handleEvent)
+            .catch(function(error) {
+                console.error('Error streaming batch predictions:', error);
+                statusText.textContent = `Error: ${error.message}`;
+            })
+            .finally(function() {
+                batchBtn.disabled = false;
+            });
+    });
+    
+    // POST the batch and call onEvent for every NDJSON line as it arrives
+    async function streamBatch(body, onEvent) {
+        const response = await fetch('/api/v1/predict/batch/stream', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(body)
+        });
+        if (!response.ok) {
+            throw new Error(response.status === 503 ? 'Server busy, try again shortly' : `HTTP ${response.status}`);
+        }
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const {value, done} = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, {stream: true});
+            
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.filter(line => line.trim() !== '').forEach(line => onEvent(JSON.parse(line)));
+        }
+        if (buffer.trim() !== '') {
+            onEvent(JSON.parse(buffer));
+        }
+    }
+    
+    function handleEvent(event) {
+        if (event.type === 'result') {
+            renderResult(event);
+            updateProgress(event.done, event.total);
+        } else if (event.type === 'end') {
+            statusText.textContent = `Done: ${event.done} fixtures, ${event.cached} served from cached team data.`;
+        }
+    }
+    
+    function renderResult(result) {
+        const row = document.getElementById(`batch-row-${result.index}`);
+        if (!row) {
+            return;
+        }
+        
+        if (result.error) {
+            row.innerHTML = `
+                <td>${result.index + 1}</td>
+                <td colspan="5" class="text-danger"><i class="fas fa-exclamation-triangle me-2"></i>${escapeHtml(result.error)}</td>
+            `;
+            return;
+        }
+        
+        const prediction = result.prediction;
+        const outcome = prediction.markets.outcome;
+        const overUnder = prediction.markets.over_under;
+        row.innerHTML = `
+            <td>${result.index + 1}</td>
+            <td>
+                ${escapeHtml(prediction.fixture.team_a.name)} vs ${escapeHtml(prediction.fixture.team_b.name)}
+                ${result.cached ? '<span class="badge bg-light text-dark ms-1">cached</span>' : ''}
+            </td>
+            <td>${prediction.lambdas.team_a.toFixed(2)} - ${prediction.lambdas.team_b.toFixed(2)}</td>
+            <td>${escapeHtml(prediction.markets.most_likely_score)}</td>
+            <td>${outcome.team_a_win.toFixed(1)}% / ${outcome.draw.toFixed(1)}% / ${outcome.team_b_win.toFixed(1)}%</td>
+            <td>${overUnder ? `O ${overUnder.threshold}: ${overUnder.over.toFixed(1)}%` : '-'}</td>
+        `;
+    }
+    
+    function updateProgress(done, total) {
+        const percent = total ? Math.round((done / total) * 100) : 0;
+        progressBar.style.width = `${percent}%`;
+        progressBar.textContent = `${done} / ${total}`;
+    }
+    
+    function escapeHtml(text) {
+        const element = document.createElement('div');
+        element.textContent = String(text);
+        return element.innerHTML;
+    }
+});
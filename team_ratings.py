@@ -0,0 +1,154 @@
+"""
+Decay-weighted team ratings maintained one match at a time.
+
+Each team keeps running sums of goals, results and weights per venue, where a
+match's weight is its competition importance times an exponential recency
+factor. The factor is anchored at a fixed epoch (2 ** (days since epoch /
+half-life)) instead of at "now", so adding a match never touches the others
+and the state can be rescaled to any as-of date with a single multiplication.
+Weighted averages are ratios of sums and do not depend on the as-of date;
+the effective match counts do.
+"""
+
+from datetime import datetime
+
+from config import RATING_HALF_LIFE_DAYS
+
+RATING_EPOCH = datetime(2000, 1, 1)
+RATING_FORM_LENGTH = 5
+
+# Index of each venue in the per-venue sums
+HOME, AWAY, NEUTRAL = 0, 1, 2
+
+
+def new_rating():
+    """Empty rating state (plain lists and numbers, so it stores as JSON)."""
+    return {
+        'count': [0, 0, 0],                 # matches per venue
+        'decay': [0.0, 0.0, 0.0],           # sum of recency factors (effective matches)
+        'weight': [0.0, 0.0, 0.0],          # sum of importance * recency
+        'scored': [0.0, 0.0, 0.0],          # weighted goals scored
+        'conceded': [0.0, 0.0, 0.0],        # weighted goals conceded
+        'wins': [0.0, 0.0, 0.0],            # weighted wins
+        'goals_scored': 0,                  # plain totals for the simple averages
+        'goals_conceded': 0,
+        'form': [],                         # [[utcDate, result], ...], most recent first
+    }
+
+
+def _days_since_epoch(when):
+    if isinstance(when, str):
+        when = datetime.strptime(when[:10], '%Y-%m-%d')
+    return (when - RATING_EPOCH).total_seconds() / 86400
+
+
+def recency_factor(when, half_life_days=RATING_HALF_LIFE_DAYS):
+    """Anchored recency factor of a date; doubles every half-life."""
+    return 2 ** (_days_since_epoch(when) / half_life_days)
+
+
+def is_rated(match):
+    """Finished, non-friendly matches count towards ratings."""
+    return (match.get('status', 'FINISHED') == 'FINISHED'
+            and (match.get('competition') or {}).get('type') != 'FRIENDLY')
+
+
+def add_match(rating, match, team_id, importance, half_life_days=RATING_HALF_LIFE_DAYS):
+    """Fold one match into a team's rating state in place and return it."""
+    is_home = match['homeTeam']['id'] == team_id
+    home_score = match['score']['fullTime']['home'] or 0
+    away_score = match['score']['fullTime']['away'] or 0
+    scored, conceded = (home_score, away_score) if is_home else (away_score, home_score)
+
+    venue = match.get('venue')
+    if isinstance(venue, dict) and venue.get('neutral', False):
+        index = NEUTRAL
+    else:
+        index = HOME if is_home else AWAY
+
+    factor = recency_factor(match['utcDate'], half_life_days)
+    weight = importance * factor
+
+    rating['count'][index] += 1
+    rating['decay'][index] += factor
+    rating['weight'][index] += weight
+    rating['scored'][index] += weight * scored
+    rating['conceded'][index] += weight * conceded
+    rating['wins'][index] += weight * (scored > conceded)
+    rating['goals_scored'] += scored
+    rating['goals_conceded'] += conceded
+
+    result = 'W' if scored > conceded else 'L' if scored < conceded else 'D'
+    form = rating['form'] + [[match['utcDate'], result]]
+    form.sort(key=lambda entry: entry[0], reverse=True)
+    rating['form'] = form[:RATING_FORM_LENGTH]
+
+    return rating
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator > 0 else 0
+
+
+def rating_stats(rating, team_id, team_name, as_of=None, half_life_days=RATING_HALF_LIFE_DAYS):
+    """
+    Team statistics from a rating state, with the keys build_team_stats
+    produces for predict_goals. The num_* counts are raw match counts, as in
+    build_team_stats; effective_num_* hold the decayed counts as of `as_of`
+    (default now).
+    """
+    scale = 1 / recency_factor(as_of or datetime.now(), half_life_days)
+    matches = sum(rating['count'])
+    total_weight = sum(rating['weight'])
+    effective = [decay * scale for decay in rating['decay']]
+
+    return {
+        'team_id': team_id,
+        'team_name': team_name,
+        'num_matches': matches,
+        'num_home_matches': rating['count'][HOME],
+        'num_away_matches': rating['count'][AWAY],
+        'num_neutral_matches': rating['count'][NEUTRAL],
+        'effective_num_matches': sum(effective),
+        'effective_num_home_matches': effective[HOME],
+        'effective_num_away_matches': effective[AWAY],
+        'effective_num_neutral_matches': effective[NEUTRAL],
+        'avg_goals_scored': _ratio(rating['goals_scored'], matches),
+        'avg_goals_conceded': _ratio(rating['goals_conceded'], matches),
+        'avg_total_goals': _ratio(rating['goals_scored'] + rating['goals_conceded'], matches),
+        'weighted_goals_scored': _ratio(sum(rating['scored']), total_weight),
+        'weighted_goals_conceded': _ratio(sum(rating['conceded']), total_weight),
+        'home_avg_goals_scored': _ratio(rating['scored'][HOME], rating['weight'][HOME]),
+        'home_avg_goals_conceded': _ratio(rating['conceded'][HOME], rating['weight'][HOME]),
+        'away_avg_goals_scored': _ratio(rating['scored'][AWAY], rating['weight'][AWAY]),
+        'away_avg_goals_conceded': _ratio(rating['conceded'][AWAY], rating['weight'][AWAY]),
+        'neutral_avg_goals_scored': _ratio(rating['scored'][NEUTRAL], rating['weight'][NEUTRAL]),
+        'neutral_avg_goals_conceded': _ratio(rating['conceded'][NEUTRAL], rating['weight'][NEUTRAL]),
+        'win_rate': _ratio(sum(rating['wins']), total_weight),
+        'neutral_win_rate': _ratio(rating['wins'][NEUTRAL], rating['weight'][NEUTRAL]),
+        'recent_form': ''.join(result for _, result in rating['form']),
+        'rated_matches': matches,
+    }
+
+
+def rate_matches(store, matches, importance, half_life_days=RATING_HALF_LIFE_DAYS):
+    """
+    Fold matches into both participants' stored ratings. Each (team, match)
+    is applied at most once, so re-ingesting a match is a no-op.
+    importance(competition_id) gives each match's competition weight.
+    """
+    entries = [
+        (match[side]['id'], match)
+        for match in matches if is_rated(match)
+        for side in ('homeTeam', 'awayTeam')
+        if match[side].get('id') is not None
+    ]
+    if not entries:
+        return 0
+
+    def update(rating, match, team_id):
+        competition_id = (match.get('competition') or {}).get('id', 0)
+        return add_match(rating or new_rating(), match, team_id, importance(competition_id), half_life_days)
+
+    return store.update_ratings(entries, update)
+
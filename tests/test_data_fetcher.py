@@ -0,0 +1,641 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import async_data_fetcher
+import data_fetcher
+import model
+from background_refresh import RefreshQueue
+from config import RATING_HALF_LIFE_DAYS
+from match_store import MATCH_SCHEMA_VERSION, MatchStore, project_match
+from singleflight import SingleFlight
+
+
+def make_match(match_id, days_ago, home, away, home_score, away_score, competition_id=2021):
+    """Minimal football-data.org match payload."""
+    return {
+        'id': match_id,
+        'utcDate': (datetime.now() - timedelta(days=days_ago)).strftime('%Y-%m-%dT15:00:00Z'),
+        'status': 'FINISHED',
+        'homeTeam': {'id': home[0], 'name': home[1]},
+        'awayTeam': {'id': away[0], 'name': away[1]},
+        'score': {'fullTime': {'home': home_score, 'away': away_score}},
+        'competition': {'id': competition_id, 'name': 'Premier League', 'type': 'LEAGUE'},
+    }
+
+
+ARSENAL = (57, 'Arsenal FC')
+CHELSEA = (61, 'Chelsea FC')
+EVERTON = (62, 'Everton FC')
+
+MATCHES = {
+    ARSENAL[0]: [
+        make_match(1, 3, ARSENAL, EVERTON, 2, 0),
+        make_match(2, 10, CHELSEA, ARSENAL, 1, 1),
+        make_match(3, 17, ARSENAL, CHELSEA, 3, 1),
+    ],
+    CHELSEA[0]: [
+        make_match(2, 10, CHELSEA, ARSENAL, 1, 1),
+        make_match(4, 14, EVERTON, CHELSEA, 0, 2),
+        make_match(3, 17, ARSENAL, CHELSEA, 3, 1),
+    ],
+}
+NAMES = {ARSENAL[0]: ARSENAL[1], CHELSEA[0]: CHELSEA[1], EVERTON[0]: EVERTON[1]}
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self._body = body
+        self.text = str(body)
+
+    def json(self):
+        return self._body
+
+
+def fake_api_body(url, params):
+    """Answer /teams/{id}, /teams/{id}/matches and /competitions/{id}/matches like the real API."""
+    parts = url.rstrip('/').split('/')
+    if parts[-1] == 'matches' and parts[-3] == 'competitions':
+        matches = {m['id']: m for team_matches in MATCHES.values() for m in team_matches}
+        return {'matches': [m for m in matches.values() if m['competition']['id'] == int(parts[-2])]}
+    if parts[-1] == 'matches':
+        team_id = int(parts[-2])
+        matches = MATCHES[team_id]
+        if params and 'teams' in params:
+            other = int(params['teams'])
+            matches = [m for m in matches if other in (m['homeTeam']['id'], m['awayTeam']['id'])]
+        if params and 'dateFrom' in params:
+            matches = [m for m in matches if m['utcDate'][:10] >= params['dateFrom']]
+        return {'matches': matches}
+    return {'name': NAMES[int(parts[-1])]}
+
+
+class FakeAsyncClient:
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = []
+
+    async def get(self, url, params=None):
+        self.calls.append(url)
+        await asyncio.sleep(self.delay)
+        return FakeResponse(fake_api_body(url, params))
+
+
+class FakeSyncClient:
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = []
+        self.params = []
+
+    def get(self, url, params=None):
+        self.calls.append(url)
+        self.params.append(params)
+        time.sleep(self.delay)
+        return FakeResponse(fake_api_body(url, params))
+
+
+class DataFetcherTestCase(unittest.TestCase):
+    """Points the file cache and match store at a temporary directory for each test."""
+
+    def setUp(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        patcher = mock.patch.object(data_fetcher, 'CACHE_DIR', cache_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.store = MatchStore(os.path.join(cache_dir.name, 'matches.sqlite3'))
+        self.addCleanup(self.store.close)
+        patcher = mock.patch.object(data_fetcher, 'get_store', return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Let background refreshes finish before the store goes away
+        self.addCleanup(data_fetcher.refresh_queue.join)
+        data_fetcher.clear_memory_cache()
+        self.addCleanup(data_fetcher.clear_memory_cache)
+
+
+class AsyncPredictionDataTests(DataFetcherTestCase):
+    def test_cold_fetches_run_concurrently_and_names_are_fetched_once(self):
+        client = FakeAsyncClient(delay=0.2)
+        with mock.patch.object(async_data_fetcher, 'get_async_client', return_value=client):
+            started = time.perf_counter()
+            data = asyncio.run(async_data_fetcher.get_match_prediction_data_async(ARSENAL[0], CHELSEA[0]))
+            elapsed = time.perf_counter() - started
+
+        self.assertLess(elapsed, 0.35)
+        self.assertEqual(len(client.calls), 5)
+        self.assertEqual(sum(url.endswith('/teams/57') for url in client.calls), 1)
+        self.assertEqual(data['team_a']['team_name'], 'Arsenal FC')
+        self.assertEqual(data['team_a']['num_matches'], 3)
+        self.assertEqual(len(data['team_b']['h2h_history']), 2)
+
+    def test_many_teams_are_fetched_concurrently(self):
+        client = FakeAsyncClient(delay=0.2)
+        with mock.patch.object(async_data_fetcher, 'get_async_client', return_value=client):
+            started = time.perf_counter()
+            histories = asyncio.run(async_data_fetcher.get_team_histories_async([ARSENAL[0], CHELSEA[0], ARSENAL[0]]))
+            elapsed = time.perf_counter() - started
+
+        self.assertLess(elapsed, 0.35)
+        self.assertEqual(len(client.calls), 4)
+        self.assertEqual([(team_id, name) for team_id, name, _ in histories], [ARSENAL, CHELSEA])
+        self.assertEqual([len(matches) for _, _, matches in histories], [3, 3])
+
+    def test_async_result_matches_sync_path(self):
+        client = FakeAsyncClient(delay=0)
+        with mock.patch.object(async_data_fetcher, 'get_async_client', return_value=client):
+            async_data = asyncio.run(async_data_fetcher.get_match_prediction_data_async(ARSENAL[0], CHELSEA[0]))
+
+        sync_data = data_fetcher.get_match_prediction_data(ARSENAL[0], CHELSEA[0])
+        for key in ('weighted_goals_scored', 'h2h_avg_goals_scored', 'recent_form'):
+            self.assertEqual(async_data['team_a'][key], sync_data['team_a'][key])
+
+
+class MemoryCacheTierTests(DataFetcherTestCase):
+    def test_repeated_reads_skip_the_disk(self):
+        data_fetcher.save_to_cache('team_name_57', 'Arsenal FC')
+        with mock.patch.object(data_fetcher.json, 'load', side_effect=AssertionError('disk read')):
+            for _ in range(3):
+                self.assertEqual(data_fetcher.get_cached_data('team_name_57'), 'Arsenal FC')
+        self.assertEqual(data_fetcher.get_memory_cache_stats()['hits'], 3)
+
+    def test_disk_hit_populates_memory_tier(self):
+        data_fetcher.save_to_cache('team_name_61', 'Chelsea FC')
+        data_fetcher.clear_memory_cache()
+
+        self.assertEqual(data_fetcher.get_cached_data('team_name_61'), 'Chelsea FC')
+        self.assertEqual(data_fetcher.get_memory_cache_stats()['misses'], 1)
+        self.assertEqual(data_fetcher.get_cached_data('team_name_61'), 'Chelsea FC')
+        self.assertEqual(data_fetcher.get_memory_cache_stats()['hits'], 1)
+
+    def test_max_age_applies_to_memory_tier(self):
+        data_fetcher.save_to_cache('team_name_62', 'Everton FC')
+        self.assertIsNone(data_fetcher.get_cached_data('team_name_62', max_age_hours=0))
+
+
+class TeamStatsCacheTests(DataFetcherTestCase):
+    def test_stats_computed_once_per_team_and_data_version(self):
+        client = FakeSyncClient(delay=0)
+        build = mock.Mock(wraps=data_fetcher.build_many_team_stats)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client), \
+                mock.patch.object(data_fetcher, 'build_many_team_stats', build):
+            # Every pairing, both ways round
+            for team_a, team_b in [(ARSENAL, CHELSEA), (CHELSEA, ARSENAL)] * 2:
+                stats_a = data_fetcher.get_team_stats(team_a[0], team_a[1])
+                stats_a['h2h_avg_goals_scored'] = 9.0
+                self.assertNotIn('h2h_avg_goals_scored', data_fetcher.get_team_stats(team_a[0], team_a[1]))
+                data_fetcher.get_many_team_stats([team_a[0], team_b[0]])
+
+            self.assertEqual(build.call_count, 2)
+
+            # New matches for a team drop its entry
+            data_fetcher.save_matches([make_match(5, 0, EVERTON, ARSENAL, 0, 1)])
+            data_fetcher.get_many_team_stats([ARSENAL[0], CHELSEA[0]])
+
+        self.assertEqual(build.call_count, 3)
+        self.assertEqual([team_id for team_id, _, _ in build.call_args[0][0]], [ARSENAL[0]])
+
+
+class PredictionCacheTests(DataFetcherTestCase):
+    def setUp(self):
+        super().setUp()
+        model.clear_prediction_cache()
+        self.addCleanup(model.clear_prediction_cache)
+
+    def test_repeated_predictions_are_served_from_cache(self):
+        client = FakeSyncClient(delay=0)
+        predict = mock.Mock(wraps=model.predict_from_data)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client), \
+                mock.patch.object(model, 'predict_from_data', predict):
+            first = model.predict_match(ARSENAL[0], CHELSEA[0], False, 2.5)
+            first['extra'] = 'caller data'
+            for _ in range(3):
+                again = model.predict_match(ARSENAL[0], CHELSEA[0], False, 2.5)
+            self.assertEqual(predict.call_count, 1)
+            self.assertNotIn('extra', again)
+            self.assertEqual(again['team_a_expected_goals'], first['team_a_expected_goals'])
+
+            # Venue and threshold are part of the key
+            model.predict_match(ARSENAL[0], CHELSEA[0], True, 2.5)
+            model.predict_match(ARSENAL[0], CHELSEA[0], False, 3)
+            self.assertEqual(predict.call_count, 3)
+
+            # The async path shares the cache
+            fake_async = FakeAsyncClient(delay=0)
+            with mock.patch.object(async_data_fetcher, 'get_async_client', return_value=fake_async):
+                asyncio.run(model.predict_match_async(ARSENAL[0], CHELSEA[0], False, 2.5))
+            self.assertEqual(predict.call_count, 3)
+
+            # New matches for either team retire its cached predictions
+            data_fetcher.save_matches([make_match(5, 0, CHELSEA, EVERTON, 2, 2)])
+            model.predict_match(ARSENAL[0], CHELSEA[0], False, 2.5)
+            self.assertEqual(predict.call_count, 4)
+
+    def test_resaving_identical_matches_keeps_cached_predictions(self):
+        client = FakeSyncClient(delay=0)
+        predict = mock.Mock(wraps=model.predict_from_data)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client), \
+                mock.patch.object(model, 'predict_from_data', predict):
+            model.predict_match(ARSENAL[0], CHELSEA[0], False, 2.5)
+
+            # A refresh that brings back the same rows changes nothing
+            self.assertEqual(data_fetcher.save_matches(MATCHES[CHELSEA[0]]), set())
+            model.predict_match(ARSENAL[0], CHELSEA[0], False, 2.5)
+            self.assertEqual(predict.call_count, 1)
+
+            # A corrected score does
+            corrected = dict(MATCHES[CHELSEA[0]][1], score={'fullTime': {'home': 1, 'away': 2}})
+            self.assertEqual(data_fetcher.save_matches([corrected]), {EVERTON[0], CHELSEA[0]})
+
+        self.assertEqual([m['id'] for m in self.store.upsert_matches(MATCHES[ARSENAL[0]])], [])
+
+    def test_model_version_is_part_of_the_key(self):
+        inputs = data_fetcher.match_inputs(ARSENAL[0], 'Arsenal FC', [], CHELSEA[0], 'Chelsea FC', [], [])
+        key = model.prediction_cache_key(inputs, False, 2.5)
+        with mock.patch.object(model, 'MODEL_VERSION', model.MODEL_VERSION + 1):
+            self.assertNotEqual(model.prediction_cache_key(inputs, False, 2.5), key)
+        self.assertEqual(model.prediction_cache_key(inputs, False, '2.5'), key)
+
+
+class MatchFeatureTests(unittest.TestCase):
+    def test_features_from_team_point_of_view(self):
+        matches = MATCHES[CHELSEA[0]] + [make_match(7, 400, ARSENAL, EVERTON, 0, 0)]
+        matches[1] = dict(matches[1], venue={'neutral': True})
+        features = data_fetcher.extract_match_features(matches, CHELSEA[0])
+
+        self.assertEqual([f['match_id'] for f in features], [2, 4, 3])
+        self.assertEqual([f['result'] for f in features], ['D', 'W', 'L'])
+        self.assertEqual([f['is_home'] for f in features], [True, False, False])
+        self.assertEqual([f['opponent_name'] for f in features], ['Arsenal FC', 'Everton FC', 'Arsenal FC'])
+        self.assertEqual(features[1]['goals_scored'], 2)
+        self.assertTrue(features[1]['is_neutral'])
+        self.assertAlmostEqual(features[0]['recency_score'], 1 - 10 / 365)
+        self.assertIsInstance(features[0]['date'], datetime)
+        self.assertEqual(features[1]['match_info'],
+                         f"{matches[1]['utcDate'][:10]} - Everton FC 0-2 Chelsea FC (Neutral) (Premier League)")
+
+    def test_match_history_is_formatted_on_access(self):
+        with mock.patch.object(data_fetcher, 'format_match_info', side_effect=lambda m: str(m['id'])) as fmt:
+            stats = data_fetcher.build_team_stats(ARSENAL[0], 'Arsenal FC', MATCHES[ARSENAL[0]])
+            self.assertEqual(fmt.call_count, 0)
+            self.assertEqual(stats['match_history'][:2], ['1', '2'])
+            self.assertEqual(fmt.call_count, 2)
+            self.assertEqual(stats['match_history'], ['1', '2', '3'])
+
+    def test_many_team_stats_match_single_team_stats(self):
+        teams = [(ARSENAL[0], 'Arsenal FC', MATCHES[ARSENAL[0]]),
+                 (CHELSEA[0], 'Chelsea FC', MATCHES[CHELSEA[0]]),
+                 (EVERTON[0], 'Everton FC', [])]
+        many = data_fetcher.build_many_team_stats(teams)
+
+        self.assertIsNone(many[EVERTON[0]])
+        for team_id, team_name, matches in teams[:2]:
+            single = data_fetcher.build_team_stats(team_id, team_name, matches)
+            self.assertEqual(many[team_id]['recent_form'], single['recent_form'])
+            self.assertEqual(many[team_id]['match_history'], single['match_history'])
+            self.assertAlmostEqual(many[team_id]['weighted_goals_scored'], single['weighted_goals_scored'])
+
+        # Chelsea: D at home (10 days ago), W away (14), L away (17)
+        chelsea = many[CHELSEA[0]]
+        self.assertEqual(chelsea['recent_form'], 'DWL')
+        self.assertEqual((chelsea['num_home_matches'], chelsea['num_away_matches']), (1, 2))
+        self.assertEqual(chelsea['home_avg_goals_scored'], 1)
+
+    def test_batch_and_scalar_predictions_agree_on_combined_data(self):
+        h2h = [m for m in MATCHES[ARSENAL[0]] if m['homeTeam']['id'] == CHELSEA[0] or m['awayTeam']['id'] == CHELSEA[0]]
+        data = data_fetcher.combine_prediction_data(
+            data_fetcher.build_team_stats(ARSENAL[0], 'Arsenal FC', MATCHES[ARSENAL[0]]),
+            data_fetcher.build_team_stats(CHELSEA[0], 'Chelsea FC', MATCHES[CHELSEA[0]]),
+            h2h,
+        )
+        self.assertIsInstance(data['team_a']['h2h_history'], data_fetcher.MatchHistory)
+
+        batch_a, batch_b = model.predict_goals_batch([data['team_a']], [data['team_b']])
+        self.assertEqual((batch_a[0], batch_b[0]), model.predict_goals(data['team_a'], data['team_b']))
+
+    def test_unweighted_matches_fall_back_to_simple_averages(self):
+        old = [make_match(1, 400, ARSENAL, EVERTON, 3, 0), make_match(2, 500, EVERTON, ARSENAL, 1, 1)]
+        stats = data_fetcher.build_team_stats(ARSENAL[0], 'Arsenal FC', old)
+
+        self.assertEqual(stats['weighted_goals_scored'], 2)
+        self.assertEqual(stats['away_avg_goals_conceded'], 1)
+        self.assertEqual(stats['win_rate'], 0.5)
+        self.assertEqual(stats['neutral_win_rate'], 0)
+
+class MatchStoreTests(DataFetcherTestCase):
+    def test_fetched_matches_are_stored_once_and_queried_back(self):
+        client = FakeSyncClient(delay=0)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client):
+            arsenal = data_fetcher.get_recent_team_matches(ARSENAL[0], team_name='Arsenal FC')
+            chelsea = data_fetcher.get_recent_team_matches(CHELSEA[0], team_name='Chelsea FC')
+            data_fetcher.clear_memory_cache()
+            self.assertEqual(data_fetcher.get_recent_team_matches(ARSENAL[0], team_name='Arsenal FC'), arsenal)
+            self.assertEqual(data_fetcher.get_recent_team_matches(CHELSEA[0], team_name='Chelsea FC'), chelsea)
+
+        self.assertEqual(len(client.calls), 2)
+        # Matches 2 and 3 belong to both teams but are stored once
+        count = self.store._connection().execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+        self.assertEqual(count, 4)
+        self.assertEqual([m['id'] for m in self.store.head_to_head(CHELSEA[0], ARSENAL[0])], [2, 3])
+
+    def test_team_name_is_stored(self):
+        client = FakeSyncClient(delay=0)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client):
+            self.assertEqual(data_fetcher.get_team_name(CHELSEA[0]), 'Chelsea FC')
+            data_fetcher.clear_memory_cache()
+            self.assertEqual(data_fetcher.get_team_name(CHELSEA[0]), 'Chelsea FC')
+
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual(self.store.team_name(CHELSEA[0]), 'Chelsea FC')
+
+    def test_head_to_head_answered_from_team_histories(self):
+        client = FakeSyncClient(delay=0)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client):
+            data_fetcher.get_recent_team_matches(ARSENAL[0], team_name='Arsenal FC')
+            h2h = data_fetcher.get_head_to_head_matches(ARSENAL[0], CHELSEA[0], limit=2,
+                                                        team_a_name='Arsenal FC', team_b_name='Chelsea FC')
+            self.assertEqual([m['id'] for m in h2h], [2, 3])
+            self.assertEqual(len(client.calls), 1)
+
+            # Fewer local meetings than requested: ask the API
+            data_fetcher.get_head_to_head_matches(ARSENAL[0], CHELSEA[0], limit=5,
+                                                  team_a_name='Arsenal FC', team_b_name='Chelsea FC')
+            self.assertEqual(len(client.calls), 2)
+
+            # ...after which the pair itself counts as synced
+            data_fetcher.clear_memory_cache()
+            data_fetcher.get_head_to_head_matches(ARSENAL[0], CHELSEA[0], limit=5,
+                                                  team_a_name='Arsenal FC', team_b_name='Chelsea FC')
+            self.assertEqual(len(client.calls), 2)
+
+    def test_synced_pair_without_meetings_is_not_refetched(self):
+        client = FakeSyncClient(delay=0)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client):
+            # Arsenal have never played team 99
+            self.assertEqual(data_fetcher.get_head_to_head_matches(ARSENAL[0], 99, team_a_name='Arsenal FC',
+                                                                   team_b_name='Team 99'), [])
+            self.assertEqual(len(client.calls), 1)
+
+            self.assertEqual(data_fetcher.get_head_to_head_matches(ARSENAL[0], 99, team_a_name='Arsenal FC',
+                                                                   team_b_name='Team 99'), [])
+            data_fetcher.clear_memory_cache()
+            self.assertEqual(data_fetcher.get_head_to_head_matches(ARSENAL[0], 99, team_a_name='Arsenal FC',
+                                                                   team_b_name='Team 99'), [])
+
+        self.assertEqual(len(client.calls), 1)
+
+    def test_expired_team_syncs_incrementally(self):
+        client = FakeSyncClient(delay=0)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client):
+            first = data_fetcher.get_recent_team_matches(ARSENAL[0], team_name='Arsenal FC')
+
+            # A new match is played and the team's sync expires
+            new_match = make_match(5, 0, EVERTON, ARSENAL, 0, 1)
+            self.store.mark_team_synced(ARSENAL[0], synced_at=0)
+            data_fetcher.clear_memory_cache()
+            with mock.patch.dict(MATCHES, {ARSENAL[0]: [new_match] + MATCHES[ARSENAL[0]]}):
+                second = data_fetcher.get_recent_team_matches(ARSENAL[0], team_name='Arsenal FC')
+
+        self.assertNotIn('dateFrom', client.params[0])
+        self.assertEqual(client.params[1]['dateFrom'], first[0]['utcDate'][:10])
+        self.assertEqual([m['id'] for m in second], [5] + [m['id'] for m in first])
+        self.assertEqual(self.store.team_synced_through(ARSENAL[0]), new_match['utcDate'])
+
+    def test_competition_ingest_covers_teams_that_only_play_in_it(self):
+        client = FakeSyncClient(delay=0)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client):
+            teams = data_fetcher.ingest_competition(2021)
+            self.assertEqual(sorted(teams), [ARSENAL[0], CHELSEA[0], EVERTON[0]])
+
+            arsenal = data_fetcher.get_team_stats(ARSENAL[0])
+            chelsea = data_fetcher.get_team_stats(CHELSEA[0])
+            h2h = data_fetcher.get_head_to_head_matches(ARSENAL[0], CHELSEA[0])
+            self.assertEqual(len(client.calls), 1)
+
+            # A match in a competition that was never ingested: Arsenal syncs on its own again
+            self.store.upsert_matches([make_match(8, 5, ARSENAL, EVERTON, 1, 0, competition_id=2001)])
+            data_fetcher.clear_memory_cache()
+            data_fetcher.get_recent_team_matches(CHELSEA[0], team_name='Chelsea FC')
+            self.assertEqual(len(client.calls), 1)
+            data_fetcher.get_recent_team_matches(ARSENAL[0], team_name='Arsenal FC')
+            self.assertEqual(len(client.calls), 2)
+
+        self.assertTrue(client.calls[0].endswith('/competitions/2021/matches'))
+        self.assertEqual(arsenal['team_name'], 'Arsenal FC')
+        self.assertEqual(chelsea['num_matches'], 3)
+        self.assertEqual([m['id'] for m in h2h], [2, 3])
+        self.assertIsNotNone(self.store.competition_synced_at(2021))
+        self.assertIsNone(self.store.team_synced_at(CHELSEA[0]))
+
+    def test_competition_ingest_only_drops_its_teams_cache_entries(self):
+        data_fetcher.save_to_cache('team_search_results', [{'id': 1, 'name': 'Other FC'}])
+        data_fetcher._memory_cache.set('team_matches_1:20', (time.time(), []))
+        data_fetcher._memory_cache.set(f'team_matches_{ARSENAL[0]}:20', (time.time(), []))
+        data_fetcher._memory_cache.set(f'h2h_1_{CHELSEA[0]}:10', (time.time(), []))
+
+        data_fetcher.handle_competition_matches_response(
+            2021, 200, lambda: fake_api_body('/competitions/2021/matches', None), ''
+        )
+
+        self.assertIn('team_search_results', data_fetcher._memory_cache)
+        self.assertIn('team_matches_1:20', data_fetcher._memory_cache)
+        self.assertNotIn(f'team_matches_{ARSENAL[0]}:20', data_fetcher._memory_cache)
+        self.assertNotIn(f'h2h_1_{CHELSEA[0]}:10', data_fetcher._memory_cache)
+
+    def test_matches_are_projected_at_ingest(self):
+        raw = dict(make_match(9, 2, ARSENAL, EVERTON, 1, 0),
+                   referees=[{'id': 1, 'name': 'Ref'}], odds={'homeWin': 1.5}, season={'id': 1})
+        raw['homeTeam'] = dict(raw['homeTeam'], crest='https://example.org/57.png')
+
+        projected = project_match(raw)
+        self.assertEqual(projected['_v'], MATCH_SCHEMA_VERSION)
+        self.assertNotIn('referees', projected)
+        self.assertNotIn('crest', projected['homeTeam'])
+        self.assertEqual(data_fetcher.extract_match_features([projected], ARSENAL[0]),
+                         data_fetcher.extract_match_features([raw], ARSENAL[0]))
+
+        self.store.upsert_matches([raw])
+        self.assertEqual(self.store.team_matches(ARSENAL[0]), [projected])
+
+class TeamRatingsTests(DataFetcherTestCase):
+    def test_stored_matches_are_rated_once(self):
+        client = FakeSyncClient(delay=0)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client):
+            data_fetcher.get_recent_team_matches(ARSENAL[0], team_name='Arsenal FC')
+            data_fetcher.get_recent_team_matches(CHELSEA[0], team_name='Chelsea FC')
+
+        # Both sides of each of the 4 matches, with the shared ones applied once
+        self.assertEqual(self.store.team_rating(ARSENAL[0])['count'], [2, 1, 0])
+        self.assertEqual(sum(self.store.team_rating(EVERTON[0])['count']), 2)
+        self.assertEqual(data_fetcher.rebuild_team_ratings(), 0)
+
+        stats = data_fetcher.get_team_ratings(ARSENAL[0], 'Arsenal FC')
+        self.assertEqual(stats['rated_matches'], 3)
+        self.assertEqual(stats['recent_form'], 'WDW')
+        self.assertAlmostEqual(stats['avg_goals_scored'], 2.0)
+
+    def test_ratings_match_team_stats_keys(self):
+        client = FakeSyncClient(delay=0)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client):
+            built = data_fetcher.get_team_stats(ARSENAL[0], 'Arsenal FC')
+            with mock.patch.object(data_fetcher, 'USE_TEAM_RATINGS', True):
+                rated = data_fetcher.get_team_stats(ARSENAL[0], 'Arsenal FC')
+
+        self.assertIn('rated_matches', rated)
+        self.assertLessEqual(set(built) - {'match_results', 'match_history'}, set(rated))
+        for key in ('num_matches', 'num_home_matches', 'num_away_matches', 'num_neutral_matches',
+                    'avg_goals_scored', 'avg_goals_conceded', 'recent_form'):
+            self.assertEqual(rated[key], built[key])
+
+    def test_effective_counts_rescale_to_as_of_date(self):
+        client = FakeSyncClient(delay=0)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client):
+            data_fetcher.get_recent_team_matches(ARSENAL[0], team_name='Arsenal FC')
+
+        now = datetime.now()
+        later = now + timedelta(days=RATING_HALF_LIFE_DAYS)
+        current = data_fetcher.get_team_ratings(ARSENAL[0], 'Arsenal FC', as_of=now)
+        aged = data_fetcher.get_team_ratings(ARSENAL[0], 'Arsenal FC', as_of=later)
+
+        self.assertAlmostEqual(aged['effective_num_matches'], current['effective_num_matches'] / 2)
+        self.assertEqual((aged['num_matches'], aged['num_home_matches']), (3, 2))
+        self.assertAlmostEqual(aged['weighted_goals_scored'], current['weighted_goals_scored'])
+
+
+class StaleWhileRevalidateTests(DataFetcherTestCase):
+    def age_team_sync(self, team_id, hours):
+        self.store.mark_team_synced(team_id, synced_at=time.time() - hours * 3600)
+        data_fetcher.clear_memory_cache()
+
+    def test_stale_matches_are_served_and_refreshed_in_background(self):
+        client = FakeSyncClient(delay=0)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client):
+            first = data_fetcher.get_recent_team_matches(ARSENAL[0], team_name='Arsenal FC')
+            self.age_team_sync(ARSENAL[0], data_fetcher.CACHE_MAX_AGE + 1)
+
+            client.delay = 0.3
+            started = time.perf_counter()
+            stale = data_fetcher.get_recent_team_matches(ARSENAL[0], team_name='Arsenal FC')
+            self.assertLess(time.perf_counter() - started, 0.2)
+            self.assertEqual(stale, first)
+
+            data_fetcher.refresh_queue.join()
+
+        self.assertEqual(len(client.calls), 3)  # first fetch, refresh's name lookup, refresh
+        self.assertLess(time.time() - self.store.team_synced_at(ARSENAL[0]), 60)
+
+    def test_data_past_max_staleness_is_refetched_in_the_foreground(self):
+        client = FakeSyncClient(delay=0)
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client):
+            data_fetcher.get_recent_team_matches(ARSENAL[0], team_name='Arsenal FC')
+            self.age_team_sync(ARSENAL[0], data_fetcher.CACHE_MAX_STALENESS + 1)
+            data_fetcher.get_recent_team_matches(ARSENAL[0], team_name='Arsenal FC')
+
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual(len(data_fetcher.refresh_queue), 0)
+
+    def test_refresh_queue_is_bounded_and_deduplicated(self):
+        release = threading.Event()
+        refreshes = RefreshQueue(maxsize=1, workers=1)
+
+        self.assertTrue(refreshes.submit('a', release.wait))
+        self.assertFalse(refreshes.submit('a', release.wait))
+        time.sleep(0.05)  # the worker has taken 'a' off the queue
+        self.assertTrue(refreshes.submit('b', release.wait))
+        self.assertFalse(refreshes.submit('c', release.wait))
+
+        release.set()
+        refreshes.join()
+        self.assertEqual(len(refreshes), 0)
+
+
+class SingleFlightTests(DataFetcherTestCase):
+    def test_concurrent_thread_misses_share_one_request(self):
+        client = FakeSyncClient(delay=0.2)
+        results = []
+        with mock.patch.object(data_fetcher, 'get_client', return_value=client):
+            threads = [
+                threading.Thread(target=lambda: results.append(
+                    data_fetcher.get_recent_team_matches(ARSENAL[0], team_name='Arsenal FC')
+                ))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(client.calls), 1)
+        self.assertEqual([len(r) for r in results], [3] * 5)
+
+    def test_thread_follower_stops_waiting_on_a_stuck_flight(self):
+        flight = SingleFlight(wait_timeout=0.05)
+        release = threading.Event()
+        leader = threading.Thread(target=flight.do, args=('key', release.wait))
+        leader.start()
+        while not flight.in_flight('key'):
+            time.sleep(0.001)
+
+        self.assertEqual(flight.do('key', lambda: 'fetched'), 'fetched')
+        release.set()
+        leader.join()
+
+    def test_cancelling_the_leader_does_not_cancel_followers(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'fetched'
+
+        async def run():
+            leader = asyncio.ensure_future(flight.do_async('key', fetch))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.do_async('key', fetch))
+            await asyncio.sleep(0)
+
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            # A cancelled follower does not affect the others either
+            other = asyncio.ensure_future(flight.do_async('key', fetch))
+            await asyncio.sleep(0)
+            other.cancel()
+            return await follower
+
+        self.assertEqual(asyncio.run(run()), 'fetched')
+        self.assertEqual(len(calls), 1)
+
+    def test_async_and_thread_misses_share_one_request(self):
+        sync_client = FakeSyncClient(delay=0.2)
+        async_client = FakeAsyncClient(delay=0.2)
+
+        async def run():
+            name = asyncio.get_running_loop().create_future()
+            name.set_result('Arsenal FC')
+            thread_result = asyncio.to_thread(
+                data_fetcher.get_recent_team_matches, ARSENAL[0], team_name='Arsenal FC'
+            )
+            return await asyncio.gather(
+                async_data_fetcher.get_recent_team_matches_async(ARSENAL[0], name),
+                async_data_fetcher.get_recent_team_matches_async(ARSENAL[0], name),
+                thread_result,
+            )
+
+        with mock.patch.object(data_fetcher, 'get_client', return_value=sync_client), \
+                mock.patch.object(async_data_fetcher, 'get_async_client', return_value=async_client):
+            results = asyncio.run(run())
+
+        self.assertEqual(len(sync_client.calls) + len(async_client.calls), 1)
+        self.assertTrue(all(len(r) == 3 for r in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
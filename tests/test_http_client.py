@@ -0,0 +1,120 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from http_client import ApiClient, TokenBucket, retry_delay
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Replays the queued (status, headers, body) responses in order."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get('X-Auth-Token')))
+        status, headers, body = server.responses.pop(0) if server.responses else (200, {}, {})
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ApiClientTests(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.requests = []
+        self.server.responses = []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.sleeps = []
+        self.client = ApiClient(
+            base_url=f'http://127.0.0.1:{self.server.server_port}/v4',
+            headers={'X-Auth-Token': 'test-key'},
+            timeout=2,
+            max_retries=2,
+            backoff_factor=0.5,
+            rate_limit_per_minute=None,
+            sleep=self.sleeps.append,
+        )
+        self.addCleanup(self.client.close)
+
+    def test_sends_auth_header_and_params(self):
+        self.server.responses.append((200, {}, {'name': 'Arsenal FC'}))
+        response = self.client.get('/teams/57', params={'limit': 5})
+        self.assertEqual(response.json(), {'name': 'Arsenal FC'})
+        self.assertEqual(self.server.requests, [('/v4/teams/57?limit=5', 'test-key')])
+
+    def test_retries_server_errors_with_exponential_backoff(self):
+        self.server.responses.extend([(503, {}, {}), (502, {}, {}), (200, {}, {'ok': True})])
+        response = self.client.get('/teams/57')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.sleeps, [0.5, 1.0])
+
+    def test_honours_retry_after_on_429(self):
+        self.server.responses.extend([(429, {'Retry-After': '7'}, {}), (200, {}, {})])
+        self.assertEqual(self.client.get('/teams').status_code, 200)
+        self.assertEqual(self.sleeps, [7.0])
+
+    def test_caps_server_requested_delay(self):
+        self.server.responses.extend([(429, {'Retry-After': '3600'}, {}), (200, {}, {})])
+        self.assertEqual(self.client.get('/teams').status_code, 200)
+        self.assertEqual(self.sleeps, [self.client.max_retry_delay])
+
+    def test_returns_last_response_when_retries_run_out(self):
+        self.server.responses.extend([(500, {}, {})] * 3)
+        self.assertEqual(self.client.get('/teams').status_code, 500)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_does_not_retry_client_errors(self):
+        self.server.responses.append((404, {}, {}))
+        self.assertEqual(self.client.get('/teams/0').status_code, 404)
+        self.assertEqual(len(self.server.requests), 1)
+
+
+class RetryDelayTests(unittest.TestCase):
+    class Response:
+        def __init__(self, status_code, headers):
+            self.status_code = status_code
+            self.headers = headers
+
+    def test_request_counter_reset_only_applies_to_429(self):
+        headers = {'X-RequestCounter-Reset': '20'}
+        self.assertEqual(retry_delay(self.Response(429, headers), 0, backoff_factor=0.5), 20.0)
+        self.assertEqual(retry_delay(self.Response(503, headers), 0, backoff_factor=0.5), 0.5)
+
+    def test_delay_is_capped(self):
+        self.assertEqual(retry_delay(self.Response(503, {'Retry-After': '900'}), 0, max_delay=30), 30)
+        self.assertEqual(retry_delay(None, 10, backoff_factor=0.5, max_delay=30), 30)
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_blocks_once_the_quota_is_spent(self):
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        bucket = TokenBucket(rate_per_minute=6, clock=lambda: now[0], sleep=sleep)
+        for _ in range(6):
+            bucket.acquire()
+        self.assertEqual(sleeps, [])
+
+        bucket.acquire()
+        self.assertEqual(len(sleeps), 1)
+        self.assertAlmostEqual(sleeps[0], 10.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,23 @@
 import unittest
 
+import pandas as pd
+from scipy.stats import poisson
+
 from model import (
-    _apply_dixon_coles_adjustment,
+    MatchDistribution,
+    LOW_SCORE_RHO,
+    _compute_score_matrix,
+    _score_matrix,
+    adaptive_max_goals,
+    disable_score_matrix_cache,
+    enable_score_matrix_cache,
+    score_matrix_cache_info,
+    calculate_over_under_ladder,
     calculate_over_under_probability,
     calculate_score_probabilities,
     calculate_total_goals_probabilities,
     predict_goals,
+    predict_goals_batch,
 )
 
 
@@ -58,6 +70,16 @@ class ModelTests(unittest.TestCase):
         self.assertLessEqual(away_xg, 4.5)
         self.assertGreater(home_xg, away_xg)
 
+    def test_predict_goals_batch_matches_scalar(self):
+        sparse_team = {'avg_goals_scored': 1.3, 'recent_form': 'DW'}
+        team_a_rows = [self.team_a, self.team_b, sparse_team]
+        team_b_rows = [self.team_b, sparse_team, self.team_a]
+        for neutral in (False, True, [True, False, True]):
+            flags = neutral if isinstance(neutral, list) else [neutral] * 3
+            batch_a, batch_b = predict_goals_batch(pd.DataFrame(team_a_rows), team_b_rows, neutral)
+            for i, flag in enumerate(flags):
+                self.assertEqual((batch_a[i], batch_b[i]), predict_goals(team_a_rows[i], team_b_rows[i], flag))
+
     def test_total_goal_probabilities_sum_to_100(self):
         home_xg, away_xg = predict_goals(self.team_a, self.team_b, False)
         total_goals = calculate_total_goals_probabilities(home_xg, away_xg)
@@ -76,9 +98,103 @@ class ModelTests(unittest.TestCase):
         self.assertGreaterEqual(result['push'], 0)
         self.assertAlmostEqual(result['over'] + result['under'] + result['push'], 100.0, places=4)
 
+    def test_over_under_ladder_matches_single_lines(self):
+        total_goals = calculate_total_goals_probabilities(1.4, 1.1)
+        ladder = calculate_over_under_ladder(total_goals, [1.5, 2.0, 3.5])
+        for row in ladder.itertuples():
+            single = calculate_over_under_probability(total_goals, row.threshold)
+            self.assertAlmostEqual(row.over, single['over'], places=8)
+            self.assertAlmostEqual(row.under, single['under'], places=8)
+            self.assertAlmostEqual(row.push, single['push'], places=8)
+
+    def test_over_under_quarter_line_splits_stake(self):
+        total_goals = calculate_total_goals_probabilities(1.4, 1.1)
+        two = calculate_over_under_probability(total_goals, 2.0)
+        two_half = calculate_over_under_probability(total_goals, 2.5)
+        quarter = calculate_over_under_probability(total_goals, 2.25)
+        for key in ('over', 'under', 'push'):
+            self.assertAlmostEqual(quarter[key], (two[key] + two_half[key]) / 2, places=8)
+
+    def test_non_finite_over_under_line_is_rejected(self):
+        distribution = MatchDistribution(1.4, 1.1)
+        for threshold in (float('nan'), float('inf'), float('-inf')):
+            with self.assertRaises(ValueError):
+                distribution.over_under(threshold)
+
     def test_dixon_coles_only_changes_low_scores(self):
-        self.assertNotEqual(_apply_dixon_coles_adjustment(0, 0, 1.2, 1.1), 1.0)
-        self.assertEqual(_apply_dixon_coles_adjustment(2, 2, 1.2, 1.1), 1.0)
+        adjusted = _compute_score_matrix(1.2, 1.1, 6)
+        independent = _compute_score_matrix(1.2, 1.1, 6, rho=0.0)
+        # Outside the 2x2 block the cells only differ by the normalizing constant
+        ratio = adjusted / independent
+        self.assertAlmostEqual(ratio[2, 2], ratio[5, 3], places=12)
+        self.assertAlmostEqual(ratio[0, 4], ratio[3, 0], places=12)
+        self.assertNotAlmostEqual(ratio[0, 0], ratio[2, 2], places=6)
+
+    def test_score_matrix_matches_per_cell_calculation(self):
+        home_lambda, away_lambda, rho = 1.7, 0.9, LOW_SCORE_RHO
+        factors = {
+            (0, 0): 1 - (home_lambda * away_lambda * rho),
+            (0, 1): 1 + (home_lambda * rho),
+            (1, 0): 1 + (away_lambda * rho),
+            (1, 1): 1 - rho,
+        }
+        matrix = _score_matrix(home_lambda, away_lambda, 6)
+        expected = [
+            [
+                poisson.pmf(h, home_lambda) * poisson.pmf(a, away_lambda) * factors.get((h, a), 1.0)
+                for a in range(7)
+            ]
+            for h in range(7)
+        ]
+        total = sum(map(sum, expected))
+        for h in range(7):
+            for a in range(7):
+                self.assertAlmostEqual(matrix[h, a], expected[h][a] / total, places=12)
+
+    def test_match_distribution_markets_are_consistent(self):
+        distribution = MatchDistribution(1.6, 1.1)
+        outcome = distribution.outcome
+        self.assertAlmostEqual(sum(outcome.values()), 100.0, places=6)
+        self.assertAlmostEqual(distribution.handicap(-0.5)['team_a'], outcome['team_a_win'], places=6)
+        self.assertAlmostEqual(distribution.handicap(0)['push'], outcome['draw'], places=6)
+        self.assertAlmostEqual(sum(distribution.both_teams_to_score.values()), 100.0, places=6)
+
+        table_result = calculate_over_under_probability(distribution.total_goals_table(), 2.5)
+        for key, value in distribution.over_under(2.5).items():
+            self.assertAlmostEqual(value, table_result[key], places=6)
+
+    def test_total_goals_convolution_matches_score_matrix(self):
+        distribution = MatchDistribution(4.5, 3.2)
+        matrix = distribution.matrix
+        for total, probability in enumerate(distribution.total_goals):
+            diagonal = sum(
+                matrix[home, total - home]
+                for home in range(matrix.shape[0])
+                if 0 <= total - home < matrix.shape[1]
+            )
+            self.assertAlmostEqual(probability, diagonal, places=12)
+
+    def test_adaptive_grid_keeps_tail_mass_near_the_clip(self):
+        max_goals = adaptive_max_goals(4.5, 1.0, tolerance=1e-6)
+        self.assertGreater(max_goals, 10)
+        self.assertLess(poisson.sf(max_goals, 4.5), 1e-6)
+        self.assertLess(adaptive_max_goals(1.2, 1.0), max_goals)
+
+    def test_score_matrix_cache_reuses_quantized_lambdas(self):
+        enable_score_matrix_cache(maxsize=2, precision=0.01)
+        self.addCleanup(disable_score_matrix_cache)
+
+        first = _score_matrix(1.401, 1.1, 10)
+        second = _score_matrix(1.399, 1.1, 10)
+        self.assertIs(first, second)
+        self.assertFalse(first.flags.writeable)
+
+        info = score_matrix_cache_info()
+        self.assertEqual((info['hits'], info['misses']), (1, 1))
+
+        cached = MatchDistribution(1.401, 1.1).total_goals
+        disable_score_matrix_cache()
+        self.assertLess(abs(cached - MatchDistribution(1.401, 1.1).total_goals).max(), 0.01)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import app
+import batch_predictions
+import prediction_api
+from batch_predictions import predict_fixtures, stream_fixtures
+from model import predict_from_data
+from prediction_api import DEFAULT_FIELDS, dumps, parse_fields, prediction_document
+from singleflight import SingleFlight
+
+
+def make_stats():
+    team_a = {
+        'team_id': 57, 'team_name': 'Arsenal FC',
+        'weighted_goals_scored': 1.8, 'weighted_goals_conceded': 1.0,
+        'home_avg_goals_scored': 2.1, 'home_avg_goals_conceded': 0.9,
+        'num_home_matches': 8, 'recent_form': 'WWDLW',
+        'match_history': ['2024-05-01: Arsenal FC 2 - 0 Everton FC'],
+        'h2h_history': ['2024-04-01: Chelsea FC 1 - 1 Arsenal FC'],
+    }
+    team_b = {
+        'team_id': 61, 'team_name': 'Chelsea FC',
+        'weighted_goals_scored': 1.2, 'weighted_goals_conceded': 1.5,
+        'away_avg_goals_scored': 1.0, 'away_avg_goals_conceded': 1.8,
+        'num_away_matches': 7, 'recent_form': 'LDDLL',
+    }
+    return team_a, team_b
+
+
+def make_prediction(goal_threshold=2.5):
+    team_a, team_b = make_stats()
+    return predict_from_data({'team_a': team_a, 'team_b': team_b}, False, goal_threshold)
+
+
+def resolve_team(team_input):
+    if not team_input.isdigit():
+        raise ValueError(f"Could not find team ID for: {team_input}")
+    return int(team_input)
+
+
+class PredictionDocumentTests(unittest.TestCase):
+    def test_document_matches_prediction(self):
+        prediction = make_prediction()
+        document = prediction_document(prediction)
+
+        self.assertEqual(document['version'], 'v1')
+        self.assertEqual(document['fixture']['team_b'], {'id': 61, 'name': 'Chelsea FC'})
+        self.assertAlmostEqual(document['lambdas']['team_a'], prediction['team_a_expected_goals'], places=4)
+        self.assertEqual(document['markets']['most_likely_total'], prediction['most_likely_total'])
+        self.assertEqual(document['markets']['over_under']['threshold'], 2.5)
+        self.assertAlmostEqual(document['markets']['over_under']['over'],
+                               prediction['over_under_result']['over'], places=2)
+
+        top = document['top_scores'][0]
+        self.assertEqual(f"{top['team_a']}-{top['team_b']}", prediction['most_likely_score'])
+        self.assertAlmostEqual(sum(document['total_goals']), 100, delta=0.5)
+
+        ladder = prediction['over_under_ladder']
+        self.assertEqual(document['over_under']['threshold'], ladder['threshold'].tolist())
+        self.assertEqual(document['over_under']['over'], ladder['over'].round(2).tolist())
+        self.assertNotIn('history', document)
+
+    def test_field_selection(self):
+        self.assertEqual(parse_fields(None), set(DEFAULT_FIELDS))
+        self.assertIn('history', parse_fields('all'))
+        with self.assertRaises(ValueError):
+            parse_fields('lambdas,nope')
+
+        document = prediction_document(make_prediction(None), parse_fields('lambdas,history'))
+        self.assertEqual(set(document), {'version', 'fixture', 'lambdas', 'history'})
+        self.assertEqual(document['history']['head_to_head'], ['2024-04-01: Chelsea FC 1 - 1 Arsenal FC'])
+
+    @unittest.skipIf(prediction_api.orjson is None, "orjson is not installed")
+    def test_orjson_encodes_documents(self):
+        document = prediction_document(make_prediction(), parse_fields('all'))
+        with mock.patch.object(prediction_api.orjson, 'dumps', wraps=prediction_api.orjson.dumps) as encode:
+            encoded = dumps(document)
+        encode.assert_called_once_with(document)
+        self.assertEqual(json.loads(encoded), document)
+
+    def test_serializers_agree(self):
+        document = prediction_document(make_prediction(), parse_fields('all'))
+        encoded = dumps(document)
+        with mock.patch.object(prediction_api, 'orjson', None):
+            self.assertEqual(json.loads(dumps(document)), json.loads(encoded))
+
+
+class BatchPredictionTests(unittest.TestCase):
+    def setUp(self):
+        team_a, team_b = make_stats()
+        self.stats = {57: team_a, 61: team_b, 62: dict(team_b, team_id=62, team_name='Everton FC')}
+        self.fetched = []
+
+        async def get_team_histories_async(team_ids):
+            self.fetched.append(list(team_ids))
+            return [(team_id, f'Team {team_id}', []) for team_id in team_ids]
+
+        patches = [
+            mock.patch.object(batch_predictions, 'get_team_histories_async', get_team_histories_async),
+            mock.patch.object(batch_predictions, 'team_stats_from_histories', side_effect=lambda teams: {
+                team_id: self.stats.get(team_id) for team_id, _, _ in teams
+            }),
+            mock.patch.object(batch_predictions, 'stored_head_to_head', return_value=[]),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_results_keep_input_order_and_match_single_predictions(self):
+        fixtures = [
+            {'team_a': '57', 'team_b': '61', 'neutral': False, 'threshold': 2.5},
+            {'team_a': 'Nowhere FC', 'team_b': '61'},
+            {'team_a': '61', 'team_b': '62', 'neutral': True},
+            {'team_a': '57', 'team_b': '99'},
+            {'team_a': '62', 'team_b': '57'},
+        ]
+        results = asyncio.run(predict_fixtures(fixtures, resolve_team, {'lambdas', 'markets'}))
+
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3, 4])
+        self.assertIn('Nowhere FC', results[1]['error'])
+        self.assertIn('error', results[3])
+
+        # Each distinct team is fetched once for the whole slate, all in one concurrent batch
+        self.assertEqual(self.fetched, [[57, 61, 62, 99]])
+
+        for index in (0, 2, 4):
+            fixture = fixtures[index]
+            single = predict_from_data({
+                'team_a': dict(self.stats[int(fixture['team_a'])]),
+                'team_b': dict(self.stats[int(fixture['team_b'])]),
+            }, fixture.get('neutral', False), fixture.get('threshold'))
+            expected = prediction_document(single, {'lambdas', 'markets'})
+            self.assertEqual(results[index]['prediction']['lambdas'], expected['lambdas'])
+            self.assertEqual(results[index]['prediction']['markets'], expected['markets'])
+
+    def test_batch_endpoint(self):
+        with mock.patch.object(app, 'validate_team_input', resolve_team):
+            response = TestClient(app.app).post('/api/v1/predict/batch', json={
+                'fixtures': [{'team_a': 57, 'team_b': 61}, {'team_a': 'Nowhere FC', 'team_b': 61},
+                             {'team_a': 61, 'team_b': 57, 'neutral': False}],
+                'neutral': True,
+                'fields': 'lambdas',
+            })
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(set(results[0]['prediction']), {'version', 'fixture', 'lambdas'})
+        self.assertTrue(results[0]['prediction']['fixture']['neutral_venue'])
+        self.assertFalse(results[2]['prediction']['fixture']['neutral_venue'])
+        self.assertIn('error', results[1])
+
+
+class StreamedBatchTests(unittest.TestCase):
+    def setUp(self):
+        team_a, team_b = make_stats()
+        stats = {57: team_a, 61: team_b}
+
+        async def predict_match_async(team_a_id, team_b_id, is_neutral_venue, goal_threshold):
+            if team_a_id not in stats or team_b_id not in stats:
+                return None
+            prediction_data = {'team_a': dict(stats[team_a_id]), 'team_b': dict(stats[team_b_id])}
+            return predict_from_data(prediction_data, is_neutral_venue, goal_threshold)
+
+        patches = [
+            mock.patch.object(batch_predictions, 'predict_match_async', predict_match_async),
+            # Only Arsenal and Chelsea are already cached
+            mock.patch.object(batch_predictions, 'is_team_data_cached', side_effect=lambda team_id: team_id in stats),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def collect(self, fixtures, concurrency=2):
+        async def run():
+            return [event async for event in stream_fixtures(fixtures, resolve_team, {'lambdas'}, concurrency)]
+        return asyncio.run(run())
+
+    def test_every_fixture_streamed_once_with_progress(self):
+        fixtures = [
+            {'team_a': '99', 'team_b': '61'},
+            {'team_a': 'Nowhere FC', 'team_b': '61'},
+            {'team_a': '57', 'team_b': '61'},
+            {'team_a': '61', 'team_b': '57', 'neutral': True},
+        ]
+        events = self.collect(fixtures)
+
+        self.assertEqual(events[0], {'type': 'start', 'total': 4})
+        self.assertEqual(events[-1], {'type': 'end', 'done': 4, 'total': 4, 'cached': 2})
+        results = events[1:-1]
+        self.assertEqual(sorted(result['index'] for result in results), [0, 1, 2, 3])
+        self.assertEqual([result['done'] for result in results], [1, 2, 3, 4])
+
+        by_index = {result['index']: result for result in results}
+        self.assertTrue(by_index[2]['cached'])
+        self.assertTrue(by_index[3]['prediction']['fixture']['neutral_venue'])
+        self.assertIn('error', by_index[0])
+        self.assertIn('Nowhere FC', by_index[1]['error'])
+
+    def test_stream_endpoint_formats(self):
+        body = {'fixtures': [{'team_a': 57, 'team_b': 61}, {'team_a': 61, 'team_b': 57}], 'fields': 'lambdas'}
+        with mock.patch.object(app, 'validate_team_input', resolve_team):
+            client = TestClient(app.app)
+            ndjson = client.post('/api/v1/predict/batch/stream', json=body)
+            sse = client.post('/api/v1/predict/batch/stream', params={'format': 'sse'}, json=body)
+
+        self.assertEqual(ndjson.headers['content-type'], 'application/x-ndjson')
+        events = [json.loads(line) for line in ndjson.text.splitlines()]
+        self.assertEqual([event['type'] for event in events], ['start', 'result', 'result', 'end'])
+
+        self.assertTrue(sse.headers['content-type'].startswith('text/event-stream'))
+        messages = [message for message in sse.text.split('\n\n') if message]
+        self.assertEqual(messages[0].splitlines()[0], 'event: start')
+        self.assertEqual(json.loads(messages[-1].splitlines()[1][len('data: '):])['done'], 2)
+
+    def test_disconnected_stream_leaves_shared_fetches_to_other_requests(self):
+        flight = SingleFlight()
+        fetches = []
+        fetched = asyncio.Event()
+
+        async def fetch_team(team_id):
+            fetches.append(team_id)
+            await fetched.wait()
+            return f'Team {team_id}'
+
+        async def predict_match_async(team_a_id, team_b_id, is_neutral_venue, goal_threshold):
+            await flight.do_async(f'team_{team_a_id}', fetch_team, team_a_id)
+            return None
+
+        async def scenario():
+            async def consume():
+                return [event async for event in stream_fixtures([{'team_a': '99', 'team_b': '61'}], resolve_team)]
+
+            # The stream's fixture leads the fetch, another request joins it
+            stream = asyncio.ensure_future(consume())
+            while not fetches:
+                await asyncio.sleep(0.001)
+            other_request = asyncio.ensure_future(flight.do_async('team_99', fetch_team, 99))
+            await asyncio.sleep(0)
+
+            # The client disconnects, cancelling the stream and its in-flight fixtures
+            stream.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await stream
+
+            fetched.set()
+            self.assertEqual(await other_request, 'Team 99')
+            self.assertEqual(fetches, [99])
+
+        with mock.patch.object(batch_predictions, 'predict_match_async', predict_match_async):
+            asyncio.run(scenario())
+
+
+class PredictEndpointTests(unittest.TestCase):
+    def test_returns_selected_fields(self):
+        async def predict(team_a_id, team_b_id, is_neutral_venue, goal_threshold):
+            return make_prediction(goal_threshold)
+
+        with mock.patch.object(app, 'predict_match_async', predict):
+            client = TestClient(app.app)
+            response = client.get('/api/v1/predict', params={'team_a': 57, 'team_b': 61, 'fields': 'markets'})
+            bad = client.get('/api/v1/predict', params={'team_a': 57, 'team_b': 61, 'fields': 'bogus'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['content-type'], 'application/json')
+        self.assertEqual(set(response.json()), {'version', 'fixture', 'markets'})
+        self.assertIsNone(response.json()['markets']['over_under'])
+        self.assertEqual(bad.status_code, 400)
+
+    def test_non_finite_threshold_is_rejected(self):
+        client = TestClient(app.app)
+        for threshold in ('nan', 'inf'):
+            response = client.get('/api/v1/predict', params={'team_a': 57, 'team_b': 61, 'threshold': threshold})
+            self.assertEqual(response.status_code, 422)
+
+        batch = client.post('/api/v1/predict/batch', json={
+            'fixtures': [{'team_a': 57, 'team_b': 61, 'threshold': 'Infinity'}],
+        })
+        self.assertEqual(batch.status_code, 422)
+
+
+if __name__ == '__main__':
+    unittest.main()
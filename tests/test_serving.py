@@ -0,0 +1,137 @@
+import asyncio
+import contextlib
+import gc
+import threading
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import app
+from serving import Overloaded, RouteLimiter, run_blocking
+
+
+class RouteLimiterTests(unittest.TestCase):
+    def test_waiting_requests_are_bounded(self):
+        async def scenario():
+            limiter = RouteLimiter("test", concurrency=1, max_waiting=1, timeout=5)
+            release = asyncio.Event()
+
+            async def request():
+                async with limiter:
+                    await release.wait()
+
+            running = asyncio.ensure_future(request())
+            waiting = asyncio.ensure_future(request())
+            while limiter.stats()['waiting'] < 1:
+                await asyncio.sleep(0.001)
+            self.assertEqual(limiter.stats()['active'], 1)
+            self.assertEqual(limiter.stats()['waiting'], 1)
+
+            # No slot and a full queue: rejected immediately
+            with self.assertRaises(Overloaded):
+                await request()
+
+            release.set()
+            await asyncio.gather(running, waiting)
+            self.assertEqual(limiter.stats()['rejected'], 1)
+            self.assertEqual(limiter.stats()['active'], 0)
+
+        asyncio.run(scenario())
+
+    def test_waiting_too_long_is_rejected(self):
+        async def scenario():
+            limiter = RouteLimiter("test", concurrency=1, max_waiting=5, timeout=0.05)
+            async with limiter:
+                with self.assertRaises(Overloaded):
+                    async with limiter:
+                        pass
+
+        asyncio.run(scenario())
+
+    def test_slot_granted_as_the_wait_times_out_is_not_leaked(self):
+        async def scenario():
+            limiter = RouteLimiter("test", concurrency=1, max_waiting=1, timeout=5)
+            release_holder = await limiter.acquire()
+
+            async def time_out_as_the_slot_frees(aws, timeout=None):
+                release_holder()
+                return set(), set(aws)
+
+            with mock.patch('serving.asyncio.wait', time_out_as_the_slot_frees):
+                with self.assertRaises(Overloaded):
+                    await limiter.acquire()
+
+            for _ in range(3):
+                await asyncio.sleep(0)
+            self.assertFalse(limiter._semaphore.locked())
+            self.assertEqual(limiter.stats()['active'], 0)
+            self.assertEqual(limiter.stats()['waiting'], 0)
+
+        asyncio.run(scenario())
+
+    def test_blocking_work_runs_off_the_event_loop(self):
+        async def scenario():
+            return threading.get_ident(), await run_blocking(threading.get_ident)
+
+        loop_thread, worker_thread = asyncio.run(scenario())
+        self.assertNotEqual(loop_thread, worker_thread)
+
+
+class BackpressureTests(unittest.TestCase):
+    def test_overloaded_route_returns_503(self):
+        full = RouteLimiter("predict", concurrency=1, max_waiting=0)
+        full._semaphore = asyncio.Semaphore(0)
+        with mock.patch.object(app, 'predict_limiter', full):
+            response = TestClient(app.app).post('/predict', data={'team_a_input': '57', 'team_b_input': '61'})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    def test_stream_slot_comes_back_when_the_response_is_dropped(self):
+        limiter = RouteLimiter("predict", concurrency=2, max_waiting=0)
+        batch = app.BatchPredictionRequest(fixtures=[{'team_a': 57, 'team_b': 61}])
+
+        async def send(message):
+            raise OSError("client went away")
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def scenario():
+            # Never sent at all
+            response = await app.api_predict_batch_stream(batch)
+            self.assertEqual(limiter.stats()['active'], 1)
+            del response
+            gc.collect()
+            await asyncio.sleep(0)
+            self.assertEqual(limiter.stats()['active'], 0)
+
+            # Collected on another thread: the slot is given back on the loop
+            responses = [await app.api_predict_batch_stream(batch)]
+            collector = threading.Thread(target=lambda: (responses.clear(), gc.collect()))
+            with mock.patch.object(limiter, 'release', wraps=limiter.release) as release:
+                collector.start()
+                collector.join()
+                release.assert_not_called()
+                await asyncio.sleep(0)
+                release.assert_called_once_with()
+            self.assertEqual(limiter.stats()['active'], 0)
+
+            # Client gone before the body is iterated
+            response = await app.api_predict_batch_stream(batch)
+            scope = {'type': 'http', 'asgi': {'spec_version': '2.4'}}
+            with contextlib.suppress(Exception):
+                await response(scope, receive, send)
+            self.assertEqual(limiter.stats()['active'], 0)
+
+            # Giving the slot back again is a no-op
+            response.release()
+            self.assertEqual(limiter.stats()['active'], 0)
+
+        with mock.patch.object(app, 'predict_limiter', limiter):
+            asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()